@@ -25,6 +25,18 @@ if ra is None:
         description="Invoke when the user wants to perform a research task.",
     )
 
+if e.get_agent("research-agent-resume") is None:
+    e.create_agent(
+        agent_id="research-agent-resume",
+        description="Invoke when the user wants to resume an interrupted research task.",
+        input_schema={
+            "run_id": {
+                "type": "string",
+                "description": "ID of the research run to resume.",
+            },
+        },
+    )
+
 # Create an instance of the ResearchAgent class and pass the tools list to it.
 research_agent = ResearchAgent(tools)
 
@@ -35,6 +47,11 @@ def research_agent_handler(context, **kwargs):
     research_agent.invoke(context, **kwargs)
 
 
+@e.on("research-agent-resume")
+def research_agent_resume_handler(context, **kwargs):
+    research_agent.resume(context, kwargs["run_id"])
+
+
 # Define the handlers for the tools.
 # We can use the same handler for all tools since they all have the same structure.
 
@@ -1,3 +1,4 @@
+from typing import Dict, Optional, Tuple
 from langfuse import Langfuse
 
 import logging
@@ -44,3 +45,26 @@ class Prompt:
             return re.sub(r"{{\s*(\w+)\s*}}", replace, template)
         # Compile Langfuse template
         return template.compile(**kwargs)
+
+    def assemble(
+        self, static: Optional[Dict[str, str]] = None, **data: str
+    ) -> Tuple[str, str]:
+        """
+        Compiles the prompt for provider-side prompt caching. The system prompt only contains the
+        instructions and static variables, so it is the same for every call and its tokens can be
+        cached. The per-call variables are referenced by name and returned as a data block, which
+        the model wrappers send last, after the user prompt.
+
+        Args:
+            static (Optional[Dict[str, str]]): Variables that are the same for every call.
+            **data (str): Variables that change per call, e.g. webpages or snippets.
+
+        Returns:
+            Tuple[str, str]: The static system prompt and the data block.
+        """
+        references = {name: f"<{name}> (given in the user message)" for name in data}
+        system_prompt = self.compile(**(static or {}), **references)
+        data_block = "\n\n".join(
+            f"<{name}>\n{value}\n</{name}>" for name, value in data.items()
+        )
+        return system_prompt, data_block
@@ -1 +1,20 @@
-from .research_agent import ResearchAgent
+import importlib
+
+# The exports are imported on first access, so modules like worker_pool or tool_router can be
+# imported without loading the research tools, which sign in to Eezo when they are imported.
+_EXPORTS = {
+    "ResearchAgent": ".research_agent",
+    "ResearchOptions": ".research_options",
+    "WorkerPool": ".worker_pool",
+    "PoolSaturatedError": ".worker_pool",
+    "worker_pool": ".worker_pool",
+    "ResearchWorker": ".worker",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
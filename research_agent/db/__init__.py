@@ -1 +1,17 @@
-from .db import ContentDB
+import importlib
+
+# Imported on first access like the exports of research_agent, since ContentDB loads the research
+# tools, which sign in to Eezo when they are imported.
+_EXPORTS = {
+    "ContentDB": ".db",
+    "CheckpointDB": ".checkpoint_db",
+    "JobQueue": ".job_queue",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
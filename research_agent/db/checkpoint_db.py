@@ -0,0 +1,164 @@
+from typing import Optional, Dict, Any
+
+import threading
+import logging
+import sqlite3
+import json
+import time
+import os
+
+
+class CheckpointDB:
+    def __init__(self, db_path: str = ":memory:"):
+        """
+        Initializes the CheckpointDB instance, setting up an SQLite database that stores
+        research runs and the results of their finished tasks.
+
+        Args:
+            db_path (str): The file path to the SQLite database. Defaults to an in-memory database.
+
+        This constructor also ensures the database contains the 'runs' and 'task_results' tables.
+        """
+        self.lock = threading.Lock()  # Ensures that database operations are thread-safe
+
+        if db_path != ":memory:":
+            # Ensures the directory for the database file exists
+            db_dir = os.path.dirname(db_path)
+            if not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+        # Allow multi-threaded access to the database by setting check_same_thread to False
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            # WAL keeps the file consistent if the process dies in the middle of a write.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    query TEXT,
+                    outline TEXT,
+                    dag TEXT,
+                    status TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+                """
+            )
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS task_results (
+                    run_id TEXT,
+                    task_id TEXT,
+                    result TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (run_id, task_id)
+                )
+                """
+            )
+            self.conn.commit()
+
+    def save_run(self, run_id: str, query: str, outline: str, dag: str) -> None:
+        """
+        Inserts or updates a research run.
+
+        Args:
+            run_id (str): The ID of the run.
+            query (str): The user's query.
+            outline (str): The generated research outline.
+            dag (str): The research outline as a DAG, serialized to JSON.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO runs (run_id, query, outline, dag, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'running', ?, ?)
+                ON CONFLICT(run_id) DO UPDATE SET
+                query=excluded.query,
+                outline=excluded.outline,
+                dag=excluded.dag,
+                updated_at=excluded.updated_at
+                """,
+                (run_id, query, outline, dag, now, now),
+            )
+            self.conn.commit()
+
+    def set_run_status(self, run_id: str, status: str) -> None:
+        """
+        Updates the status of a research run, e.g. "running" or "completed".
+
+        Args:
+            run_id (str): The ID of the run.
+            status (str): The new status.
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                (status, time.time(), run_id),
+            )
+            self.conn.commit()
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieves a research run by its ID.
+
+        Args:
+            run_id (str): The ID of the run.
+
+        Returns:
+            Optional[Dict[str, Any]]: The run with query, outline, dag and status, else None.
+        """
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT run_id, query, outline, dag, status FROM runs WHERE run_id = ?",
+                (run_id,),
+            )
+            row = cursor.fetchone()
+            return (
+                dict(zip(["run_id", "query", "outline", "dag", "status"], row))
+                if row
+                else None
+            )
+
+    def save_task_result(self, run_id: str, task_id: str, result: Dict[str, Any]):
+        """
+        Inserts or updates the result of a finished task.
+
+        Args:
+            run_id (str): The ID of the run.
+            task_id (str): The ID of the task.
+            result (Dict[str, Any]): The task result as a dictionary.
+        """
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO task_results (run_id, task_id, result, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(run_id, task_id) DO UPDATE SET
+                result=excluded.result,
+                updated_at=excluded.updated_at
+                """,
+                (run_id, task_id, json.dumps(result), time.time()),
+            )
+            self.conn.commit()
+        logging.info(f"Checkpointed task {task_id} of run {run_id}")
+
+    def get_task_results(self, run_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieves the results of all finished tasks of a run.
+
+        Args:
+            run_id (str): The ID of the run.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The task results keyed by task ID.
+        """
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT task_id, result FROM task_results WHERE run_id = ?",
+                (run_id,),
+            )
+            return {task_id: json.loads(result) for task_id, result in cursor}
@@ -0,0 +1,200 @@
+from typing import Optional, Dict, Any
+
+import threading
+import logging
+import sqlite3
+import json
+import time
+import uuid
+import os
+
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        lease_seconds: float = 900,
+        max_attempts: int = 2,
+    ):
+        """
+        Initializes the JobQueue instance, a durable job queue backed by SQLite. Schedulers put ready
+        research tasks on the queue and worker processes claim them and write their results back.
+
+        Args:
+            db_path (str): The file path to the SQLite database. Use a file path to share the queue
+                           between processes. Defaults to an in-memory database.
+            lease_seconds (float): Seconds a claimed job stays reserved for its worker. Jobs of workers
+                                   that died are claimed again after the lease expired.
+            max_attempts (int): How often a job is claimed before it is marked as failed.
+
+        This constructor also ensures the database contains a 'jobs' table, which is created if it doesn't exist.
+        """
+        self.lock = threading.Lock()  # Ensures that database operations are thread-safe
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        if db_path != ":memory:":
+            # Ensures the directory for the database file exists
+            db_dir = os.path.dirname(db_path)
+            if not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+        # Allow multi-threaded access to the database by setting check_same_thread to False.
+        # isolation_level=None lets us control the transactions, see claim().
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    run_id TEXT,
+                    task_id TEXT,
+                    payload TEXT,
+                    status TEXT,
+                    result TEXT,
+                    worker_id TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    lease_until REAL,
+                    created_at REAL,
+                    updated_at REAL
+                )
+                """
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    def put(self, run_id: str, task_id: str, payload: Dict[str, Any]) -> str:
+        """
+        Puts a job on the queue.
+
+        Args:
+            run_id (str): The ID of the run the task belongs to.
+            task_id (str): The ID of the task.
+            payload (Dict[str, Any]): Everything a worker needs to execute the task.
+
+        Returns:
+            str: The ID of the job.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO jobs (id, run_id, task_id, payload, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'pending', ?, ?)
+                """,
+                (job_id, run_id, task_id, json.dumps(payload), now, now),
+            )
+        logging.info(f"Queued task {task_id} of run {run_id} as job {job_id}")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Claims the oldest pending job, or a job whose lease expired because its worker died.
+
+        Args:
+            worker_id (str): The ID of the claiming worker.
+
+        Returns:
+            Optional[Dict[str, Any]]: The job with id, run_id, task_id and payload, else None.
+        """
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock, so no other process can claim the same job.
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', updated_at = ?, result = ?
+                    WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+                    """,
+                    (
+                        now,
+                        json.dumps({"error": "Job failed: worker lease expired too often."}),
+                        now,
+                        self.max_attempts,
+                    ),
+                )
+                row = self.conn.execute(
+                    """
+                    SELECT id, run_id, task_id, payload FROM jobs
+                    WHERE status = 'pending' OR (status = 'running' AND lease_until < ?)
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if row:
+                    self.conn.execute(
+                        """
+                        UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                        lease_until = ?, updated_at = ? WHERE id = ?
+                        """,
+                        (worker_id, now + self.lease_seconds, now, row[0]),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "run_id": row[1],
+            "task_id": row[2],
+            "payload": json.loads(row[3]),
+        }
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        """
+        Stores the result of a job and marks it as done.
+
+        Args:
+            job_id (str): The ID of the job.
+            result (Dict[str, Any]): The task result as a dictionary.
+        """
+        with self.lock:
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = 'done', result = ?, updated_at = ?
+                WHERE id = ? AND status != 'cancelled'
+                """,
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def cancel(self, job_id: str) -> None:
+        """
+        Cancels a job that is no longer needed. A running job finishes, but its result is dropped.
+
+        Args:
+            job_id (str): The ID of the job.
+        """
+        with self.lock:
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = 'cancelled', updated_at = ?
+                WHERE id = ? AND status IN ('pending', 'running')
+                """,
+                (time.time(), job_id),
+            )
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieves the status and result of a job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            Optional[Dict[str, Any]]: The status and, once finished, the result of the job, else None.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "result": json.loads(row[1]) if row[1] else None}
@@ -1,18 +1,33 @@
-from utils.langfuse_json_model_wrapper import langfuse_json_model_wrapper
+from utils.langfuse_json_stream_wrapper import langfuse_json_stream_wrapper
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
+from utils.message_stream import MessageStream
+from utils.model_router import model_router
+from utils.client_registry import clients
 from .research_task_scheduler import TaskScheduler
+from .worker_pool import WorkerPool, PoolSaturatedError, worker_pool
 from .research_task import ResearchTask, TaskResult
+from .research_options import ResearchOptions
+from .run_budget import RunBudget
+from .db import CheckpointDB, JobQueue
 from langfuse.client import StatefulTraceClient
+from eezo.interface.message import Message
 from eezo.interface import Context
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
+from contextlib import contextmanager
 from langfuse import Langfuse
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from prompts import Prompt
 from eezo import Eezo
 
+import concurrent.futures
+import threading
+import asyncio
+import logging
 import json
+import re
+import os
 
 
 l = Langfuse()
@@ -22,6 +37,11 @@ generate_outline = Prompt("research-agent-generate-outline")
 outline_to_dag = Prompt("research-agent-outline-to-dag-conversion")
 research_section_summarizer = Prompt("research-section-summarizer")
 
+# A numbered question of an outline, e.g. "1. **Question?**" or "   1.1 Question?"
+NUMBERED_LINE = re.compile(r"^\s*(?:[-*]\s+)?(\d+(?:\.\d+)*)\.?\s+(.*)$")
+# Any line that starts with a number, also in formats the parser doesn't know, e.g. "2) ..."
+NUMBERED_ANY = re.compile(r"^\s*(?:[-*]\s+)?[*_#]*\s*\d+(?:\.\d+)*(?:[.):]|\s|$)")
+
 
 class Question(BaseModel):
     """
@@ -80,6 +100,51 @@ class ResearchOutline(BaseModel):
         """
         return {"questions": [question.to_dict() for question in self.questions]}
 
+    @classmethod
+    def from_numbered_outline(cls, outline: str) -> "ResearchOutline":
+        """
+        Parses an outline that numbers its questions like "1.", "1.1", "1.1.1" into a DAG without
+        an LLM call. Every subquestion depends on the question it is numbered under.
+
+        Args:
+            outline (str): The research outline.
+
+        Returns:
+            ResearchOutline: The research outline as a DAG.
+
+        Raises:
+            ValueError: If the outline does not follow the numbered format, or if some numbered
+                lines are in another format and would be dropped.
+        """
+        questions: List[Question] = []
+        ids = set()
+        numbered = 0
+        for line in outline.splitlines():
+            numbered += bool(NUMBERED_ANY.match(line))
+            match = NUMBERED_LINE.match(line)
+            if match is None:
+                continue
+            id = match.group(1)
+            text = match.group(2).strip().strip("*").strip()
+            if not text:
+                raise ValueError(f"Question {id} has no text.")
+            if id in ids:
+                raise ValueError(f"Question {id} appears more than once.")
+            parent = id.rpartition(".")[0]
+            if parent and parent not in ids:
+                raise ValueError(f"Question {id} comes before its parent {parent}.")
+            ids.add(id)
+            questions.append(
+                Question(id=id, text=text, dependencies=[parent] if parent else [])
+            )
+        if not questions:
+            raise ValueError("The outline contains no numbered questions.")
+        if len(questions) != numbered:
+            raise ValueError(
+                f"Only {len(questions)} of {numbered} numbered lines follow the expected format."
+            )
+        return cls(questions=questions)
+
 
 class ResearchAgent:
     """
@@ -87,16 +152,36 @@ class ResearchAgent:
 
     Attributes:
         tools (List[BaseTool]): A list of tools available for the research tasks.
+        options (ResearchOptions): The options of the runs, shared by the scheduler and the tasks.
+        pool (WorkerPool): The worker pool shared by all runs.
+        job_queue (Optional[JobQueue]): Queue consumed by worker processes executing the research tasks.
+        checkpoint_db (CheckpointDB): Stores runs and finished tasks so interrupted runs can be resumed.
     """
 
-    def __init__(self, tools: List[BaseTool]):
+    def __init__(
+        self,
+        tools: List[BaseTool],
+        options: Optional[ResearchOptions] = None,
+        pool: Optional[WorkerPool] = None,
+        job_queue: Optional[JobQueue] = None,
+    ):
         """
         Initializes the ResearchAgent with a list of tools and an instance of the Langfuse client.
 
         Args:
             tools (List[BaseTool]): A list of tools available for the research tasks.
+            options (Optional[ResearchOptions]): The options of the research runs, e.g. the
+                concurrency limits, the time budget and the tool timeout.
+            pool (Optional[WorkerPool]): The worker pool to share. Defaults to the process-wide pool.
+            job_queue (Optional[JobQueue]): If given, research tasks are executed by worker processes
+                consuming this queue (see worker.py) instead of this process.
         """
         self.tools = tools
+        self.options = options or ResearchOptions()
+        self.pool = pool or worker_pool
+        self.job_queue = job_queue
+        current_folder = os.path.dirname(os.path.abspath(__file__))
+        self.checkpoint_db = CheckpointDB(current_folder + "/db/checkpoints.db")
         self.langfuse = Langfuse()
 
     def invoke(self, eezo_context: Context, **kwargs) -> None:
@@ -109,40 +194,247 @@ class ResearchAgent:
         """
 
         trace: StatefulTraceClient = self._start_trace()
+        try:
+            with self.pool.admission(trace.id, timeout=self.options.admission_timeout):
+                self._research(eezo_context, trace, kwargs["query"])
+        except PoolSaturatedError as error:
+            logging.error(f"Research run {trace.id} rejected: {error}")
+            self._send_message(
+                eezo_context,
+                trace,
+                "The research agent is busy right now. Please try again in a few minutes.",
+            )
+
+    def resume(self, eezo_context: Context, run_id: str) -> None:
+        """
+        Resumes an interrupted research run. Tasks completed before the interruption are loaded
+        from the checkpoint database, only the unfinished tasks are executed again.
+
+        Args:
+            eezo_context (Context): The eezo_context to communicate with.
+            run_id (str): The ID of the run to resume, which is the ID of its original trace.
+        """
+        trace: StatefulTraceClient = self._start_trace(metadata={"resumed_run_id": run_id})
+        run = self.checkpoint_db.get_run(run_id)
+        if run is None:
+            self._send_message(eezo_context, trace, f"No research run found for {run_id}.")
+            return
+
+        research_outline = self._restore_plan(trace, run)
+        try:
+            with self.pool.admission(run_id, timeout=self.options.admission_timeout):
+                self._send_message(eezo_context, trace, f"Resuming research {run_id}...")
+                self._execute_and_report(
+                    eezo_context,
+                    trace,
+                    run_id,
+                    run["query"],
+                    run["outline"],
+                    research_outline,
+                    self._start_budget(),
+                )
+        except PoolSaturatedError as error:
+            logging.error(f"Resuming run {run_id} rejected: {error}")
+            self._send_message(
+                eezo_context,
+                trace,
+                "The research agent is busy right now. Please try again in a few minutes.",
+            )
+
+    def _restore_plan(
+        self, trace: StatefulTraceClient, run: Dict[str, Any]
+    ) -> ResearchOutline:
+        """
+        Loads the DAG of a checkpointed run. If the run died while its DAG was streamed, the
+        questions checkpointed so far are kept and the missing ones are planned again.
+
+        Args:
+            trace (StatefulTraceClient): The trace client instance.
+            run (Dict[str, Any]): The run as stored in the checkpoint database.
+
+        Returns:
+            ResearchOutline: The complete research outline as a DAG.
+        """
+        if run["status"] != "planning":
+            return ResearchOutline.model_validate_json(run["dag"])
+
+        saved = [Question(**question) for question in json.loads(run["dag"])["questions"]]
+        logging.info(
+            f"Run {run['run_id']} stopped while planning after {len(saved)} questions, "
+            "planning the rest again."
+        )
+        planned = self._parse_outline(trace, run["outline"]) or self._convert_outline_to_dag(
+            trace, run["outline"]
+        )
+        ids = {question.id for question in saved}
+        missing = [question for question in planned.questions if question.id not in ids]
+        research_outline = ResearchOutline(questions=saved + missing)
+        self.checkpoint_db.save_run(
+            run["run_id"], run["query"], run["outline"], research_outline.model_dump_json()
+        )
+        self.checkpoint_db.set_run_status(run["run_id"], "running")
+        return research_outline
+
+    def _research(
+        self, eezo_context: Context, trace: StatefulTraceClient, query: str
+    ) -> None:
+        """
+        Runs the research process for an admitted run.
+
+        Args:
+            eezo_context (Context): The eezo_context to communicate with.
+            trace (StatefulTraceClient): The trace client instance. Its ID is the run ID.
+            query (str): The user's query.
+        """
+        budget = self._start_budget()
         self._send_message(eezo_context, trace, "Generating outline...")
 
         # Genreate oultine
-        outline: str = self._generate_outline(trace, kwargs["query"])
+        outline: str = self._generate_outline(trace, query)
         self._send_message(eezo_context, trace, "Generating outline... done.", outline)
 
-        # Convert outline to DAG
-        research_outline: ResearchOutline = self._convert_outline_to_dag(trace, outline)
-        self._send_message(eezo_context, trace, "Planning tasks... done.")
+        # Convert outline to DAG, without an LLM call if the questions are numbered as expected
+        stream: Optional[Iterator[Question]] = None
+        research_outline = self._parse_outline(trace, outline)
+        if research_outline is None and self.options.stream_planning:
+            # Research the first questions while the rest of the DAG is still being generated.
+            research_outline = ResearchOutline.model_construct(questions=[])
+            stream = self._stream_plan(
+                eezo_context, trace, query, outline, research_outline
+            )
+        else:
+            if research_outline is None:
+                research_outline = self._convert_outline_to_dag(trace, outline)
+            self._send_message(eezo_context, trace, "Planning tasks... done.")
+
+            # Checkpoint the plan, so the run can be resumed if the process dies.
+            self.checkpoint_db.save_run(
+                trace.id, query, outline, research_outline.model_dump_json()
+            )
+
+        self._execute_and_report(
+            eezo_context,
+            trace,
+            trace.id,
+            query,
+            outline,
+            research_outline,
+            budget,
+            stream,
+        )
+
+    def _stream_plan(
+        self,
+        eezo_context: Context,
+        trace: StatefulTraceClient,
+        query: str,
+        outline: str,
+        research_outline: ResearchOutline,
+    ) -> Iterator[Question]:
+        """
+        Streams the questions of the DAG and adds them to the research outline as they are parsed.
+        The outline is checkpointed before the first question and the DAG with every question
+        before it is dispatched, so a run that dies while planning can be resumed. Until the DAG
+        is complete, the run has the status "planning".
 
-        # Plan and execute tasks
-        results: List[TaskResult] = self._plan_and_execute(
-            research_outline, trace, eezo_context
+        Args:
+            eezo_context (Context): The eezo_context to communicate with.
+            trace (StatefulTraceClient): The trace client instance. Its ID is the run ID.
+            query (str): The user's query.
+            outline (str): The research outline.
+            research_outline (ResearchOutline): The research outline the questions are added to.
+
+        Yields:
+            Question: The next parsed question.
+        """
+        self.checkpoint_db.save_run(
+            trace.id, query, outline, research_outline.model_dump_json()
         )
+        self.checkpoint_db.set_run_status(trace.id, "planning")
+        for question in self._stream_outline_to_dag(trace, outline):
+            research_outline.questions.append(question)
+            self.checkpoint_db.save_run(
+                trace.id, query, outline, research_outline.model_dump_json()
+            )
+            yield question
+        self.checkpoint_db.set_run_status(trace.id, "running")
+        self._send_message(eezo_context, trace, "Planning tasks... done.")
 
-        # Generate final report
-        final_report = self._generate_final_report(results, trace)
+    def _execute_and_report(
+        self,
+        eezo_context: Context,
+        trace: StatefulTraceClient,
+        run_id: str,
+        query: str,
+        outline: str,
+        research_outline: ResearchOutline,
+        budget: Optional[RunBudget],
+        stream: Optional[Iterator[Question]] = None,
+    ) -> None:
+        """
+        Executes the research tasks of a run and generates, sends and saves the final report.
+
+        Args:
+            eezo_context (Context): The eezo_context to communicate with.
+            trace (StatefulTraceClient): The trace client instance.
+            run_id (str): The ID of the run, used as checkpoint key.
+            query (str): The user's query.
+            outline (str): The research outline.
+            research_outline (ResearchOutline): The research outline as a DAG.
+            budget (Optional[RunBudget]): The time budget of the run.
+            stream (Optional[Iterator[Question]]): Questions that are still being planned. They are
+                added to the research outline as they arrive.
+        """
+        report_message = None
+        if eezo_context and self.options.stream_report:
+            report_message = eezo_context.new_message()
+
+        # Plan and execute tasks, summarizing each section as soon as its task is done
+        results, final_report = self._generate_final_report(
+            self._plan_and_execute(
+                research_outline, trace, eezo_context, run_id, budget, stream
+            ),
+            trace,
+            budget,
+            # Read once all results are in, a streamed outline is complete by then.
+            order=(question.id for question in research_outline.questions),
+            message=report_message,
+        )
+        # Replaces the streamed sections with the report in outline order.
         self._send_message(
-            eezo_context, trace, "Generating final report...", final_report
+            eezo_context,
+            trace,
+            "Generating final report...",
+            final_report,
+            message=report_message,
         )
 
         # Save final report to json file
         self._save_final_report(
-            outline, kwargs["query"], research_outline, results, final_report
+            outline, query, research_outline, results, final_report
         )
+        self.checkpoint_db.set_run_status(run_id, "completed")
+
+    def _start_budget(self) -> Optional[RunBudget]:
+        """
+        Starts the clock of a new run if a time budget is configured.
+
+        Returns:
+            Optional[RunBudget]: The time budget of the run, or None if runs are not limited.
+        """
+        return RunBudget(self.options.time_budget) if self.options.time_budget else None
 
-    def _start_trace(self) -> StatefulTraceClient:
+    def _start_trace(self, metadata: Optional[Dict[str, Any]] = None) -> StatefulTraceClient:
         """
         Starts a new Langfuse trace for the research process.
 
+        Args:
+            metadata (Optional[Dict[str, Any]]): Metadata to attach to the trace.
+
         Returns:
             StatefulTraceClient: The trace client instance.
         """
-        return self.langfuse.trace(name="ResearchAgent")
+        return self.langfuse.trace(name="ResearchAgent", metadata=metadata)
 
     def _generate_outline(self, trace, query: str) -> str:
         """
@@ -155,15 +447,39 @@ class ResearchAgent:
         Returns:
             str: The generated research outline.
         """
-        system_prompt = generate_outline.compile(user_prompt=query)
+        system_prompt, _ = generate_outline.assemble(user_prompt=query)
         return langfuse_model_wrapper(
             name="GenerateOutline",
             trace=trace,
             system_prompt=system_prompt,
             prompt=generate_outline,
             user_prompt=query,
+            # Everything else waits for the outline.
+            priority="high",
         )
 
+    def _parse_outline(self, trace, outline: str) -> Optional[ResearchOutline]:
+        """
+        Converts the research outline into a DAG locally, using the numbering of its questions.
+
+        Args:
+            trace (StatefulTraceClient): The trace client instance.
+            outline (str): The research outline.
+
+        Returns:
+            Optional[ResearchOutline]: The research outline as a DAG, or None if the outline does not
+                follow the numbered format and has to be converted by the LLM.
+        """
+        span = trace.span(name="ParseOutline", input={"outline": outline})
+        try:
+            research_outline = ResearchOutline.from_numbered_outline(outline)
+        except ValueError as error:
+            logging.info(f"Parsing the outline locally failed, using the LLM: {error}")
+            span.end(output={"error": str(error)})
+            return None
+        span.end(output=research_outline.to_dict())
+        return research_outline
+
     def _convert_outline_to_dag(self, trace, outline: str) -> ResearchOutline:
         """
         Converts the research outline into a directed acyclic graph (DAG).
@@ -175,79 +491,374 @@ class ResearchAgent:
         Returns:
             ResearchOutline: The converted research outline as a DAG.
         """
-        system_prompt = outline_to_dag.compile(output_schema="", outline=outline)
-        return langfuse_json_model_wrapper(
+        system_prompt, data = outline_to_dag.assemble({"output_schema": ""}, outline=outline)
+        return model_router.call_json(
             name="ConvertOutlineToDAG",
             trace=trace,
             system_prompt=system_prompt,
             user_prompt="Parse the outline into the json schema",
+            data=data,
             prompt=outline_to_dag,
             base_model=ResearchOutline,
+            # Escalate if a question depends on a question that doesn't exist.
+            accept=lambda dag: all(
+                dependency in {question.id for question in dag.questions}
+                for question in dag.questions
+                for dependency in question.dependencies
+            ),
+            priority="high",
+        )
+
+    def _stream_outline_to_dag(self, trace, outline: str) -> Iterator[Question]:
+        """
+        Converts the research outline into a DAG, yielding every question as soon as it is parsed.
+
+        Args:
+            trace (StatefulTraceClient): The trace client instance.
+            outline (str): The research outline.
+
+        Yields:
+            Question: The next question of the DAG.
+        """
+        system_prompt, data = outline_to_dag.assemble({"output_schema": ""}, outline=outline)
+        return langfuse_json_stream_wrapper(
+            name="StreamOutlineToDAG",
+            trace=trace,
+            system_prompt=system_prompt,
+            user_prompt="Parse the outline into the json schema",
+            data=data,
+            prompt=outline_to_dag,
+            base_model=Question,
         )
 
     def _plan_and_execute(
-        self, research_outline: ResearchOutline, trace, eezo_context: Context
-    ) -> List[TaskResult]:
+        self,
+        research_outline: ResearchOutline,
+        trace,
+        eezo_context: Context,
+        run_id: str,
+        budget: Optional[RunBudget] = None,
+        stream: Optional[Iterator[Question]] = None,
+    ) -> Iterator[TaskResult]:
         """
-        Executes the research tasks based on the DAG.
+        Executes the research tasks based on the DAG and yields their results as they complete.
 
         Args:
             research_outline (ResearchOutline): The research outline as a DAG.
             trace (StatefulTraceClient): The trace client instance.
             eezo_context (Context): The eezo_context to communicate with.
+            run_id (str): The ID of the run. Completed tasks are checkpointed under this ID.
+            budget (Optional[RunBudget]): The time budget of the run.
+            stream (Optional[Iterator[Question]]): Questions that are still being planned. Each one is
+                handed to the running scheduler as soon as it arrives.
 
-        Returns:
-            List[TaskResult]: The results of the research tasks.
-        """
-        task_list = []
-        for question in research_outline.questions:
-            task_list.append(
-                ResearchTask(
-                    id=question.id,
-                    research_topic=question.text,
-                    dependencies=question.dependencies,
-                    trace=trace,
-                    eezo_context=eezo_context,
+        Yields:
+            TaskResult: The result of the next completed research task.
+        """
+        task_list = [
+            self._create_task(question, trace, eezo_context, budget)
+            for question in research_outline.questions
+        ]
+
+        scheduler = TaskScheduler(
+            task_list,
+            self.tools,
+            options=self.options,
+            pool=self.pool,
+            run_id=run_id,
+            checkpoint_db=self.checkpoint_db,
+            budget=budget,
+            job_queue=self.job_queue,
+            streaming=stream is not None,
+        )
+        if stream is not None:
+            threading.Thread(
+                target=self._feed_scheduler,
+                args=(scheduler, stream, trace, eezo_context, budget),
+                name=f"planner-{run_id}",
+                daemon=True,
+            ).start()
+        yield from scheduler.iter_results()
+
+    def _feed_scheduler(
+        self,
+        scheduler: TaskScheduler,
+        stream: Iterator[Question],
+        trace,
+        eezo_context: Context,
+        budget: Optional[RunBudget] = None,
+    ) -> None:
+        """
+        Adds streamed questions to a running scheduler and closes it once the DAG is complete.
+
+        Args:
+            scheduler (TaskScheduler): The scheduler in streaming mode.
+            stream (Iterator[Question]): The questions as they are planned.
+            trace (StatefulTraceClient): The trace client instance.
+            eezo_context (Context): The eezo_context to communicate with.
+            budget (Optional[RunBudget]): The time budget of the run.
+        """
+        try:
+            for question in stream:
+                scheduler.add_task(
+                    self._create_task(question, trace, eezo_context, budget)
                 )
-            )
+        except Exception as error:
+            # Research the questions planned so far instead of failing the run.
+            logging.error(f"Streaming the DAG failed: {error}")
+        finally:
+            scheduler.close()
+
+    def _create_task(
+        self,
+        question: Question,
+        trace,
+        eezo_context: Context,
+        budget: Optional[RunBudget] = None,
+    ) -> ResearchTask:
+        """
+        Creates the research task for a question of the DAG.
 
-        scheduler = TaskScheduler(task_list, self.tools)
-        scheduler.execute()
-        return scheduler.get_results()
+        Args:
+            question (Question): The question to research.
+            trace (StatefulTraceClient): The trace client instance.
+            eezo_context (Context): The eezo_context to communicate with.
+            budget (Optional[RunBudget]): The time budget of the run.
 
-    def _generate_final_report(self, results: List[TaskResult], trace) -> str:
+        Returns:
+            ResearchTask: The research task.
         """
-        Generates the final report from the research results.
+        return ResearchTask(
+            id=question.id,
+            research_topic=question.text,
+            dependencies=question.dependencies,
+            trace=trace,
+            eezo_context=eezo_context,
+            budget=budget,
+            options=self.options,
+        )
+
+    def _generate_final_report(
+        self,
+        results: Iterable[TaskResult],
+        trace,
+        budget: Optional[RunBudget] = None,
+        order: Optional[Iterable[str]] = None,
+        message: Optional[Message] = None,
+    ) -> Tuple[List[TaskResult], str]:
+        """
+        Generates the final report from the research results. Each section is summarized as soon as
+        its result arrives, up to summary_concurrency sections at the same time, and the report is
+        assembled in outline order once all sections are done.
 
         Args:
-            results (List[TaskResult]): The results of the research tasks.
+            results (Iterable[TaskResult]): The results of the research tasks, e.g. as they complete.
             trace (StatefulTraceClient): The trace client instance.
+            budget (Optional[RunBudget]): The time budget of the run.
+            order (Optional[Iterable[str]]): The task IDs in outline order, read after all results are in.
+                Defaults to the order of the results.
+            message (Optional[Message]): If given, every section is streamed into this message
+                while it is generated, in the order the sections are done. Otherwise the sections
+                are summarized with the async model clients, as coroutines on one event loop.
 
         Returns:
-            str: The final report.
+            Tuple[List[TaskResult], str]: The results in outline order and the final report.
         """
-        final_report = ""
-        for task_result in results:
-            if task_result.error is not "":
-                continue
-            if len(task_result.content_used) == 0:
-                final_report += f"{task_result.id} {task_result.research_topic}\nNo content found.\n\n"
-            else:
-                system_prompt = research_section_summarizer.compile(
-                    research_topic=task_result.research_topic,
-                    section_notes=task_result.result,
-                )
-                section_summary = langfuse_model_wrapper(
+        completed: Dict[str, TaskResult] = {}
+        sections: Dict[str, concurrent.futures.Future] = {}
+        if message is not None:
+            # Sections are summarized concurrently, so their streams share the message's lock.
+            lock = threading.Lock()
+            MessageStream(message, text="Generating final report...\n\n", lock=lock).flush()
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.options.summary_concurrency, thread_name_prefix="section-summary"
+            ) as executor:
+                for task_result in results:
+                    completed[task_result.id] = task_result
+                    sections[task_result.id] = executor.submit(
+                        self._generate_section,
+                        task_result,
+                        trace,
+                        budget,
+                        MessageStream(message, lock=lock),
+                    )
+        else:
+            # Nothing is streamed, so the summaries are coroutines on one event loop.
+            with self._summary_loop() as loop:
+                semaphore = asyncio.Semaphore(self.options.summary_concurrency)
+                for task_result in results:
+                    completed[task_result.id] = task_result
+                    sections[task_result.id] = asyncio.run_coroutine_threadsafe(
+                        self._agenerate_section(task_result, trace, budget, semaphore), loop
+                    )
+                concurrent.futures.wait(sections.values())
+
+        order = list(order) if order is not None else list(completed)
+        ids = [id for id in order if id in completed]
+        ids += [id for id in completed if id not in order]
+        final_report = "".join(sections[id].result() for id in ids)
+        return [completed[id] for id in ids], final_report
+
+    @contextmanager
+    def _summary_loop(self) -> Iterator[asyncio.AbstractEventLoop]:
+        """
+        Runs an event loop on a background thread for the duration of the with block and closes
+        the async clients it opened at the end.
+
+        Yields:
+            asyncio.AbstractEventLoop: The running event loop.
+        """
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="section-summary", daemon=True)
+        thread.start()
+        try:
+            yield loop
+        finally:
+            asyncio.run_coroutine_threadsafe(clients.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def _generate_section(
+        self,
+        task_result: TaskResult,
+        trace,
+        budget: Optional[RunBudget] = None,
+        stream: Optional[MessageStream] = None,
+    ) -> str:
+        """
+        Generates the section of the final report for one research result. Sections are marked
+        with the work that was cut to stay within the time budget or a prompt's token budget.
+
+        Args:
+            task_result (TaskResult): The result of the research task.
+            trace (StatefulTraceClient): The trace client instance.
+            budget (Optional[RunBudget]): The time budget of the run. When it is used up, the notes
+                are included as they are instead of being summarized.
+            stream (Optional[MessageStream]): If given, the summary is streamed into it while it is
+                generated and replaced by the finished section at the end.
+
+        Returns:
+            str: The section, empty if the task failed and nothing is worth reporting.
+        """
+        section = self._summarize_section(task_result, trace, budget, stream)
+        if stream is not None:
+            stream.replace(section)
+        return section
+
+    def _summarize_section(
+        self,
+        task_result: TaskResult,
+        trace,
+        budget: Optional[RunBudget],
+        stream: Optional[MessageStream],
+    ) -> str:
+        """
+        Builds the section of one research result, summarizing its notes if there is time left.
+        See _generate_section.
+        """
+        section = self._unsummarized_section(task_result, budget)
+        if section is not None:
+            return section
+        system_prompt, data = research_section_summarizer.assemble(
+            research_topic=task_result.research_topic,
+            section_notes=task_result.result,
+        )
+        if stream is not None:
+            stream.write(f"**{task_result.id} {task_result.research_topic}**\n")
+        try:
+            section_summary = model_router.call_text(
+                name="GenerateSectionSummary",
+                trace=trace,
+                system_prompt=system_prompt,
+                prompt=research_section_summarizer,
+                user_prompt="Generate a summary of the section",
+                data=data,
+                model="llama3-70b-8192",
+                host="groq",
+                stream_to=stream,
+                # The final report waits for the summaries.
+                priority="high",
+            )
+        except Exception as error:
+            # One failed summary should not cost the whole report, fall back to the notes.
+            logging.error(f"Summary of section {task_result.id} failed: {error}")
+            section_summary = task_result.result
+        return self._format_section(task_result, section_summary)
+
+    async def _agenerate_section(
+        self,
+        task_result: TaskResult,
+        trace,
+        budget: Optional[RunBudget],
+        semaphore: asyncio.Semaphore,
+    ) -> str:
+        """
+        Awaitable counterpart of _generate_section for reports that are not streamed. The summary
+        is generated with the async model clients, up to the semaphore's number at the same time.
+        """
+        section = self._unsummarized_section(task_result, budget)
+        if section is not None:
+            return section
+        system_prompt, data = research_section_summarizer.assemble(
+            research_topic=task_result.research_topic,
+            section_notes=task_result.result,
+        )
+        try:
+            async with semaphore:
+                section_summary = await model_router.acall_text(
                     name="GenerateSectionSummary",
                     trace=trace,
                     system_prompt=system_prompt,
                     prompt=research_section_summarizer,
                     user_prompt="Generate a summary of the section",
+                    data=data,
                     model="llama3-70b-8192",
                     host="groq",
+                    priority="high",
                 )
-                final_report += f"**{task_result.id} {task_result.research_topic}**\n{section_summary}\n\n"
-        return final_report
+        except Exception as error:
+            logging.error(f"Summary of section {task_result.id} failed: {error}")
+            section_summary = task_result.result
+        return self._format_section(task_result, section_summary)
+
+    def _unsummarized_section(
+        self, task_result: TaskResult, budget: Optional[RunBudget]
+    ) -> Optional[str]:
+        """
+        Returns the section of a result that is not summarized, i.e. a failed task, a task without
+        content or any task once the time budget is used up. None if the notes are summarized.
+        """
+        cuts = self._format_cuts(task_result.cuts)
+        if task_result.error != "":
+            if task_result.cuts:
+                return f"**{task_result.id} {task_result.research_topic}**{cuts}\n\n"
+            return ""
+        if len(task_result.content_used) == 0:
+            return f"{task_result.id} {task_result.research_topic}\nNo content found.{cuts}\n\n"
+        if budget and budget.remaining() <= 0:
+            cuts = self._format_cuts(
+                (task_result.cuts or [])
+                + ["Summary skipped because the time budget was used up, showing the notes."]
+            )
+            return f"**{task_result.id} {task_result.research_topic}**\n{task_result.result}{cuts}\n\n"
+        return None
+
+    def _format_section(self, task_result: TaskResult, section_summary: str) -> str:
+        cuts = self._format_cuts(task_result.cuts)
+        return f"**{task_result.id} {task_result.research_topic}**\n{section_summary}{cuts}\n\n"
+
+    def _format_cuts(self, cuts: List[str]) -> str:
+        """
+        Formats the work cut from a section as a note for the final report.
+
+        Args:
+            cuts (List[str]): The cuts recorded for the section.
+
+        Returns:
+            str: The formatted note starting with a line break, empty if nothing was cut.
+        """
+        return "".join(f"\n_Cut: {cut}_" for cut in cuts or [])
 
     def _save_final_report(
         self,
@@ -282,7 +893,12 @@ class ResearchAgent:
             )
 
     def _send_message(
-        self, eezo_context: Context, trace, text: str, content: str = ""
+        self,
+        eezo_context: Context,
+        trace,
+        text: str,
+        content: str = "",
+        message: Optional[Message] = None,
     ) -> None:
         """
         Sends a message to the Eezo eezo_context, optionally including additional content.
@@ -292,10 +908,16 @@ class ResearchAgent:
             trace (StatefulTraceClient): The trace client instance.
             text (str): The text message to send.
             content (str): Additional content to include in the message.
+            message (Optional[Message]): An already sent message to overwrite instead of sending a
+                new one, e.g. one that was streamed into.
         """
         if eezo_context:
             span = self.langfuse.span(trace_id=trace.id, name="EezoMessage")
-            m = eezo_context.new_message()
+            if message is not None:
+                m = message
+                m.interface = []
+            else:
+                m = eezo_context.new_message()
             c = m.add("text", text=text)
             if content:
                 m.replace(c.id, "text", text=content)
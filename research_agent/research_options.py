@@ -0,0 +1,131 @@
+from .tool_router import ToolRouter, tool_router as default_tool_router
+from typing import Optional, Dict, Any
+
+# Seconds a tool may take before its results are dropped.
+TOOL_TIMEOUT = 30.0
+
+
+class ResearchOptions:
+    """
+    The options of a research run. One instance is passed from the ResearchAgent to the scheduler
+    and to every research task, and is sent along with the tasks executed by worker processes.
+
+    Attributes:
+        max_concurrency (Optional[int]): Maximum number of research tasks of one run running at the same time.
+        resource_limits (Optional[Dict[str, int]]): Limits of concurrent calls per resource (llm, search, scrape).
+        admission_timeout (Optional[float]): Seconds a new run waits for admission when the pool is saturated.
+        speculative (bool): Prefetch content for blocked tasks on idle workers.
+        time_budget (Optional[float]): Seconds a run may take before it returns a partial report.
+        task_timeout (Optional[float]): Maximum number of seconds a single research task may run.
+        summary_concurrency (int): Maximum number of section summaries generated at the same time.
+        stream_planning (bool): Start research tasks while the DAG is still being generated.
+        stream_report (bool): Stream the section summaries to the user while they are generated.
+        merge_select_and_assess (bool): Select content and check for missing information in one call.
+        tool_timeout (float): Seconds a search tool may take before its results are dropped.
+        tool_router (Optional[ToolRouter]): Picks the tools of a topic without an LLM call.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        resource_limits: Optional[Dict[str, int]] = None,
+        admission_timeout: Optional[float] = 30,
+        speculative: bool = False,
+        time_budget: Optional[float] = None,
+        task_timeout: Optional[float] = None,
+        summary_concurrency: int = 4,
+        stream_planning: bool = False,
+        stream_report: bool = True,
+        merge_select_and_assess: bool = True,
+        tool_timeout: float = TOOL_TIMEOUT,
+        tool_router: Optional[ToolRouter] = default_tool_router,
+    ):
+        """
+        Initializes the ResearchOptions.
+
+        Args:
+            max_concurrency (Optional[int]): The maximum number of research tasks of one run running at the
+                same time. None leaves the limit to the shared worker pool.
+            resource_limits (Optional[Dict[str, int]]): Process-wide limits of concurrent calls per resource,
+                e.g. {"llm": 16, "search": 8, "scrape": 8}.
+            admission_timeout (Optional[float]): Seconds a new run waits for admission when the pool is saturated.
+                None waits forever.
+            speculative (bool): Prefetch search results and scraped pages for tasks that still wait
+                for their dependencies on idle workers.
+            time_budget (Optional[float]): Seconds a run may take. When the budget runs low, tasks skip
+                optional work and the final report is generated on time from what is available.
+            task_timeout (Optional[float]): Maximum number of seconds a single research task may run.
+            summary_concurrency (int): Maximum number of section summaries generated at the same time.
+                Each section is summarized as soon as its research task is done.
+            stream_planning (bool): Stream the conversion of the outline into a DAG and start every
+                question as soon as it is parsed and its dependencies are done, so research overlaps
+                with planning.
+            stream_report (bool): Stream the section summaries into the final report message token
+                by token while they are generated, instead of sending the report once it is done.
+            merge_select_and_assess (bool): Let tasks with content from their dependencies select the
+                content and check for missing information in one LLM call. If False, they make two
+                separate calls.
+            tool_timeout (float): Seconds a search tool may take. The tools of a research topic run
+                at the same time, and the results of slow or failing tools are dropped.
+            tool_router (Optional[ToolRouter]): Picks the tools of a topic locally from rules, the
+                tool descriptions and past choices. Ambiguous topics still go to the LLM. None
+                lets the LLM pick the tools of every topic.
+        """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1.")
+        if summary_concurrency < 1:
+            raise ValueError("summary_concurrency must be >= 1.")
+        self.max_concurrency = max_concurrency
+        self.resource_limits = resource_limits
+        self.admission_timeout = admission_timeout
+        self.speculative = speculative
+        self.time_budget = time_budget
+        self.task_timeout = task_timeout
+        self.summary_concurrency = summary_concurrency
+        self.stream_planning = stream_planning
+        self.stream_report = stream_report
+        self.merge_select_and_assess = merge_select_and_assess
+        self.tool_timeout = tool_timeout
+        self.tool_router = tool_router
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts the ResearchOptions to a dictionary that can be sent to a worker process.
+
+        Returns:
+            dict: The ResearchOptions as a dictionary. The tool router is not sent, workers use
+                their own router and only learn whether to route locally.
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "resource_limits": self.resource_limits,
+            "admission_timeout": self.admission_timeout,
+            "speculative": self.speculative,
+            "time_budget": self.time_budget,
+            "task_timeout": self.task_timeout,
+            "summary_concurrency": self.summary_concurrency,
+            "stream_planning": self.stream_planning,
+            "stream_report": self.stream_report,
+            "merge_select_and_assess": self.merge_select_and_assess,
+            "tool_timeout": self.tool_timeout,
+            "local_tool_routing": self.tool_router is not None,
+        }
+
+    @classmethod
+    def from_dict(
+        cls, data: Dict[str, Any], tool_router: Optional[ToolRouter] = default_tool_router
+    ) -> "ResearchOptions":
+        """
+        Restores ResearchOptions created by to_dict().
+
+        Args:
+            data (Dict[str, Any]): The ResearchOptions as a dictionary.
+            tool_router (Optional[ToolRouter]): The router of this process, used if the options
+                route locally.
+
+        Returns:
+            ResearchOptions: The restored ResearchOptions.
+        """
+        data = dict(data)
+        local_tool_routing = data.pop("local_tool_routing")
+        return cls(**data, tool_router=tool_router if local_tool_routing else None)
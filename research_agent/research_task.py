@@ -1,25 +1,33 @@
-from utils.langfuse_json_model_wrapper import langfuse_json_model_wrapper
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
+from utils.resource_limiter import limiter
+from utils.client_registry import clients
+from utils.message_stream import MessageStream
+from utils.prompt_packer import prompt_packer
+from utils.model_router import model_router
+from .research_options import ResearchOptions
+from .run_budget import RunBudget
 from .db import ContentDB
 
 from tools.research.common.model_schemas import ContentItem
-from langchain_community.document_loaders import WebBaseLoader
+from utils.web_loader import AdaptiveWebLoader
 from langchain_core.messages import HumanMessage
 from langfuse.client import StatefulTraceClient
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from eezo.interface.message import Message
 from eezo.interface import Context
-from langchain_openai import ChatOpenAI
 from langchain.tools import BaseTool
 from pydantic import BaseModel
 from prompts import Prompt
 from langfuse import Langfuse
 
 
+import concurrent.futures
+import threading
 import logging
 import openai
 import uuid
 import json
+import time
 import os
 
 oc = openai.Client()
@@ -31,6 +39,13 @@ extract_notes = Prompt("research-agent-extract-notes-from-webpages")
 assessing_information_sufficiency = Prompt(
     "research-agent-assessing-information-sufficiency"
 )
+select_and_assess_content = Prompt("research-agent-select-and-assess-content")
+
+# Threads running the tool calls of all tasks. A tool past its timeout keeps its thread until its
+# HTTP timeout fires, the bound keeps such threads from piling up across tasks.
+tool_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=32, thread_name_prefix="research-tools"
+)
 
 
 class TaskResult(BaseModel):
@@ -40,6 +55,8 @@ class TaskResult(BaseModel):
     research_topic: Optional[str] = ""
     id: str
     error: str
+    # Work that was cut to stay within the time budget of the run or the token budget of a prompt.
+    cuts: Optional[List[str]] = []
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -49,9 +66,17 @@ class TaskResult(BaseModel):
             "research_topic": self.research_topic,
             "id": self.id,
             "error": self.error,
+            "cuts": self.cuts,
         }
 
 
+class TaskDeadlineExceeded(Exception):
+    """
+    Raised inside a task that ran past its deadline. The scheduler stops waiting for the task at
+    its deadline, this stops the task itself at its next step instead of letting it run on.
+    """
+
+
 class ResearchTask:
     def __init__(
         self,
@@ -60,12 +85,90 @@ class ResearchTask:
         dependencies: List[str],
         trace: StatefulTraceClient,
         eezo_context: Context,
+        budget: Optional[RunBudget] = None,
+        options: Optional[ResearchOptions] = None,
     ):
         self.id = id
         self.research_topic = research_topic
         self.dependencies = dependencies
         self.trace = trace
         self.eezo_context = eezo_context
+        self.budget = budget
+        # The options of the run, e.g. the tool timeout and the tool router.
+        self.options = options or ResearchOptions()
+        # Content collected speculatively before the task became ready.
+        self.prefetched_content_ids: List[str] = []
+        # Monotonic time the scheduler stops waiting for the task, set when the task starts.
+        self.deadline: Optional[float] = None
+        # What was cut from the prompts of the task to fit their token budget, see record_cuts.
+        self.prompt_cuts: List[str] = []
+        self.lock = threading.Lock()
+
+    def time_left(self) -> Optional[float]:
+        """
+        Returns the seconds until the deadline of the task, or None if it has none.
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check_deadline(self, step: str) -> None:
+        """
+        Stops the task before its next step once it ran past its deadline.
+
+        Args:
+            step (str): The step about to start, for the log.
+
+        Raises:
+            TaskDeadlineExceeded: If the deadline of the task has passed.
+        """
+        time_left = self.time_left()
+        if time_left is not None and time_left <= 0:
+            raise TaskDeadlineExceeded(f"Task {self.id} ran past its deadline before {step}.")
+
+    def record_cuts(self, source: str, cuts: List[str]) -> None:
+        """
+        Records what the prompt packer cut from a prompt of the task, so the report can say so.
+        Safe to call from the threads of the tools and follow-ups.
+
+        Args:
+            source (str): The call site or tool the prompt was packed for.
+            cuts (List[str]): The cuts returned by the packer.
+        """
+        with self.lock:
+            self.prompt_cuts.extend(f"{source}: {cut}" for cut in cuts)
+
+    def to_payload(self, state: Dict[str, TaskResult]) -> Dict[str, Any]:
+        """
+        Converts the task and the results of its dependencies into a JSON-serializable payload,
+        so that a worker process can execute it.
+
+        Args:
+            state (Dict[str, TaskResult]): The results of the finished tasks.
+
+        Returns:
+            dict: The task as a dictionary.
+        """
+        eezo = None
+        if self.eezo_context:
+            eezo = {
+                "eezo_id": self.eezo_context.eezo_id,
+                "thread_id": self.eezo_context.thread_id,
+                "agent_id": self.eezo_context.agent_id,
+            }
+        return {
+            "id": self.id,
+            "research_topic": self.research_topic,
+            "dependencies": self.dependencies,
+            "trace_id": self.trace.id,
+            "eezo": eezo,
+            "budget": self.budget.to_dict() if self.budget else None,
+            "options": self.options.to_dict(),
+            "prefetched_content_ids": self.prefetched_content_ids,
+            "state": {
+                dep: state[dep].to_dict() for dep in self.dependencies if dep in state
+            },
+        }
 
     def decide_what_to_use(
         self,
@@ -98,13 +201,32 @@ class ResearchTask:
         content_objs: List[ContentItem] = [
             content for content in content_objs if content
         ]
-
-        # Prepare the prompt.
+        if not content_objs:
+            # Nothing to pick from, don't ask the LLM.
+            span.end(output={"results": []})
+            return []
+
+        # Prepare the prompt, fitting the snippets into the token budget of the model.
+        system_prompt, _ = select_content.assemble(
+            research_topic=research_topic, formatted_snippets=""
+        )
+        model = model_router.packing_model("SelectContent", "gpt-3.5-turbo")
+        snippets, cuts = prompt_packer.pack(
+            [str(content) for content in content_objs],
+            model=model,
+            reserved_tokens=prompt_packer.count(system_prompt, model),
+            query=research_topic,
+            labels=[f"Snippet '{content.title}'" for content in content_objs],
+            trace=self.trace,
+        )
+        self.record_cuts("SelectContent", cuts)
         formatted_snippets = ""
-        for i, content in enumerate(content_objs):
-            formatted_snippets += f"{i}: {content}\n"
+        for i, snippet in enumerate(snippets):
+            if snippet:
+                formatted_snippets += f"{i}: {snippet}\n"
 
-        system_prompt = select_content.compile(
+        # The instructions are the same for every task, the topic and snippets go last.
+        system_prompt, data = select_content.assemble(
             research_topic=research_topic, formatted_snippets=formatted_snippets
         )
 
@@ -112,18 +234,24 @@ class ResearchTask:
             snippet_indeces: List[int]
 
         # Ask the LLM which content seems most relevant.
-        response: Response = langfuse_json_model_wrapper(
+        response: Response = model_router.call_json(
             trace=self.trace,
             observation_id=span.id,
             name="SelectContent",
             system_prompt=system_prompt,
             user_prompt="Pick the snippets you want to include in the summary.",
+            data=data,
             prompt=select_content,
             base_model=Response,
+            # Sent together with the same call of other tasks if micro-batching is enabled.
+            batch=True,
+            # Escalate if none of the picked snippets exists. Picking none is a valid answer.
+            accept=lambda response: not response.snippet_indeces
+            or any(0 <= i < len(content_objs) for i in response.snippet_indeces),
         )
 
         # Parse the response to get the chosen content_ids.
-        choosen_ids = [i for i in response.snippet_indeces if i < len(content_ids)]
+        choosen_ids = [i for i in response.snippet_indeces if 0 <= i < len(content_objs)]
 
         logging.info("------" * 10)
         logging.info(f"Chosen snippets for question '{research_topic}'")
@@ -135,13 +263,117 @@ class ResearchTask:
             m.add(
                 "text", text=f"- [{content_objs[idx].title}]({content_objs[idx].url})"
             )
-            results.append({"content_id": content_ids[idx], "snippet": snippet})
+            results.append({"content_id": content_objs[idx].id, "snippet": snippet})
         logging.info("------" * 10)
 
-        content_ids_to_use = [content_ids[i] for i in choosen_ids]
+        content_ids_to_use = [content_objs[i].id for i in choosen_ids]
         span.end(output={"results": results})
         return content_ids_to_use
 
+    def select_and_assess(
+        self,
+        db: ContentDB,
+        m: Message,
+        content_ids: List[str],
+        research_topic: str,
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Decides what content to use and checks if more information is needed in a single LLM call.
+        Combines decide_what_to_use and check_if_more_info_needed, which look at the same content.
+
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            m (Message): The message object to send notifications.
+            content_ids (List[str]): The content ids to decide what to use.
+            research_topic (str): The research topic for which to decide what to use.
+
+        Returns:
+            Tuple[List[str], List[str]]: The content ids to use for generating the summary and the
+                additional questions that need to be answered.
+        """
+        m.add("text", text="Checking if more information is needed...\n\n")
+        m.notify()
+
+        span = l.span(
+            trace_id=self.trace.id,
+            name="select_and_assess",
+            input={"content_ids": content_ids, "research_topic": research_topic},
+        )
+        content_objs: List[ContentItem] = [
+            content
+            for content in (db.get_doc_by_id(content_id) for content_id in content_ids)
+            if content
+        ]
+
+        # Prepare the prompt, fitting the snippets into the token budget of the model.
+        system_prompt, _ = select_and_assess_content.assemble(
+            research_topic=research_topic, formatted_snippets=""
+        )
+        model = model_router.packing_model("SelectAndAssessContent", "gpt-3.5-turbo")
+        snippets, cuts = prompt_packer.pack(
+            [str(content) for content in content_objs],
+            model=model,
+            reserved_tokens=prompt_packer.count(system_prompt, model),
+            query=research_topic,
+            labels=[f"Snippet '{content.title}'" for content in content_objs],
+            trace=self.trace,
+        )
+        self.record_cuts("SelectAndAssessContent", cuts)
+        formatted_snippets = ""
+        for i, snippet in enumerate(snippets):
+            if snippet:
+                formatted_snippets += f"{i}: {snippet}\n"
+        system_prompt, data = select_and_assess_content.assemble(
+            research_topic=research_topic, formatted_snippets=formatted_snippets
+        )
+
+        class Response(BaseModel):
+            snippet_indeces: List[int]
+            more_info_needed: bool
+            research_topics: List[str]
+
+        response: Response = model_router.call_json(
+            trace=self.trace,
+            observation_id=span.id,
+            name="SelectAndAssessContent",
+            system_prompt=system_prompt,
+            user_prompt="Pick the snippets you want to include in the summary and decide if more information is needed.",
+            data=data,
+            prompt=select_and_assess_content,
+            base_model=Response,
+            # Sent together with the same call of other tasks if micro-batching is enabled.
+            batch=True,
+            # Escalate if none of the picked snippets exists, or if more information is needed
+            # but no topic to research is given. Picking none is a valid answer.
+            accept=lambda response: (
+                not response.snippet_indeces
+                or any(0 <= i < len(content_objs) for i in response.snippet_indeces)
+            )
+            and (not response.more_info_needed or len(response.research_topics) > 0),
+        )
+
+        choosen_ids = [i for i in response.snippet_indeces if 0 <= i < len(content_objs)]
+        research_topics = response.research_topics if response.more_info_needed else []
+
+        logging.info(f"Chosen snippets for question '{research_topic}': {choosen_ids}")
+        m.add("text", text="**Decided to use:**\n\n")
+        for idx in choosen_ids:
+            m.add(
+                "text", text=f"- [{content_objs[idx].title}]({content_objs[idx].url})"
+            )
+        if research_topics:
+            logging.info(f"Additional questions next to '{research_topic}': {research_topics}")
+            m.add("text", text=f"**Expanding on question** {research_topic}\n\n")
+            for question in research_topics:
+                m.add("text", text=f"**-** {question}")
+        m.notify()
+
+        content_ids_to_use = [content_objs[i].id for i in choosen_ids]
+        span.end(
+            output={"content_ids": content_ids_to_use, "research_topics": research_topics}
+        )
+        return content_ids_to_use, research_topics
+
     def check_if_more_info_needed(
         self,
         db: ContentDB,
@@ -171,13 +403,30 @@ class ResearchTask:
         )
         # 1. Get the content snippets for the given content_ids.
         content_objs: List[ContentItem] = [
-            db.get_doc_by_id(content_id) for content_id in content_ids
+            content
+            for content in (db.get_doc_by_id(content_id) for content_id in content_ids)
+            if content
         ]
-        content_snippets = [content.snippet for content in content_objs if content]
+        content_snippets = [content.snippet for content in content_objs]
 
-        # 2. Prepare the prompt.
-        formatted_content = "Available data:\n" + "\n".join(content_snippets)
-        system_prompt = assessing_information_sufficiency.compile(
+        # 2. Prepare the prompt, fitting the snippets into the token budget of the model.
+        system_prompt, _ = assessing_information_sufficiency.assemble(
+            research_topic=research_topic, formatted_content=""
+        )
+        model = model_router.packing_model("AssessInformationSufficiency", "gpt-3.5-turbo")
+        content_snippets, cuts = prompt_packer.pack(
+            content_snippets,
+            model=model,
+            reserved_tokens=prompt_packer.count(system_prompt, model),
+            query=research_topic,
+            labels=[f"Snippet '{content.title}'" for content in content_objs],
+            trace=self.trace,
+        )
+        self.record_cuts("AssessInformationSufficiency", cuts)
+        formatted_content = "Available data:\n" + "\n".join(
+            snippet for snippet in content_snippets if snippet
+        )
+        system_prompt, data = assessing_information_sufficiency.assemble(
             research_topic=research_topic, formatted_content=formatted_content
         )
 
@@ -186,14 +435,20 @@ class ResearchTask:
             research_topics: List[str]
 
         # 3. Ask the LLM if more information is needed.
-        response: Response = langfuse_json_model_wrapper(
+        response: Response = model_router.call_json(
             trace=self.trace,
             observation_id=span.id,
             name="AssessInformationSufficiency",
             system_prompt=system_prompt,
             user_prompt="Is the given content enough to generate the summary for the research topic?",
+            data=data,
             prompt=assessing_information_sufficiency,
             base_model=Response,
+            # Sent together with the same call of other tasks if micro-batching is enabled.
+            batch=True,
+            # Escalate if more information is needed but no topic to research is given.
+            accept=lambda response: not response.more_info_needed
+            or len(response.research_topics) > 0,
         )
 
         # 4. Log the response.
@@ -251,65 +506,130 @@ class ResearchTask:
         Returns:
             List[ContentItem]: The content items collected for the research topic.
         """
+        results = self.find_content(db, tools, research_topic)
+        return self.store_content(db, m, results)
+
+    def find_content(
+        self,
+        db: ContentDB,
+        tools: List[BaseTool],
+        research_topic: str,
+    ) -> List[ContentItem]:
+        """
+        Gathers content for the research topic in its own span, without storing it. Safe to call
+        for several topics at the same time.
+
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            tools (List[BaseTool]): The tools to use for collecting content.
+            research_topic (str): The research topic for which to collect content.
+
+        Returns:
+            List[ContentItem]: The content items found for the research topic.
+        """
         span = l.span(
             trace_id=self.trace.id,
             name="collect_content",
             input={"research_topic": research_topic},
         )
+        results = self.gather_content(db, tools, research_topic, span)
+        span.end(output={"results": [content.dict() for content in results]})
+        return results
 
-        existing_content: List[ContentItem] = []
-        results: List[ContentItem] = []
+    def store_content(
+        self, db: ContentDB, m: Message, results: List[ContentItem]
+    ) -> List[ContentItem]:
+        """
+        Stores found content in the database and lists it in the task's message.
 
-        # 1. Execute a tool agent to select tools to execute that can help in collecting content.
-        tool_span = l.span(
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            m (Message): The message object to send notifications.
+            results (List[ContentItem]): The content items found for a research topic.
+
+        Returns:
+            List[ContentItem]: The stored content items.
+        """
+        if len(results) > 0:
+            m.add("text", text=f"**Found new content** for {self.research_topic}:\n\n")
+            for content in results:
+                db.upsert_doc(content)
+                # logging.info(f"{self.id} - - {content.snippet}")
+                m.add("text", text=f"- [{content.title}]({content.url})")
+            m.notify()
+        else:
+            logging.error(f"{self.id} - No content found for '{self.research_topic}'")
+            m.add(
+                "text",
+                text=f"No content found for this research topic {self.research_topic}",
+            )
+            m.notify()
+
+        return results
+
+    def prefetch(self, db: ContentDB, tools: List[BaseTool]) -> None:
+        """
+        Speculatively collects content for this task's research topic while the task still waits
+        for its dependencies. The content is stored in the database and offered to the task when
+        it executes, so it mostly works on warm content. Nothing is sent to the user.
+
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            tools (List[BaseTool]): The tools to use for collecting content.
+        """
+        span = l.span(
             trace_id=self.trace.id,
-            parent_observation_id=span.id,
-            name="ToolAgent",
-            input={
-                "research_topic": research_topic,
-                "tools": [tool.name for tool in tools],
-            },
+            name="prefetch_content",
+            input={"task_id": self.id, "research_topic": self.research_topic},
         )
+        results = self.gather_content(db, tools, self.research_topic, span)
+        for content in results:
+            db.upsert_doc(content)
+        self.prefetched_content_ids = [content.id for content in results]
+        span.end(output={"content_ids": self.prefetched_content_ids})
 
-        for attempt in range(1, 4):  # Attempt 3 times, counting starts from 1
-            model_with_tools = ChatOpenAI(model="gpt-3.5-turbo").bind_tools(tools)
-            openai_result = model_with_tools.invoke(
-                [HumanMessage(content=research_topic)],
-                config={"callbacks": [tool_span.get_langchain_handler()]},
-            )
+    def gather_content(
+        self,
+        db: ContentDB,
+        tools: List[BaseTool],
+        research_topic: str,
+        span,
+    ) -> List[ContentItem]:
+        """
+        Selects and executes tools for the research topic and scrapes pages with too little content.
+        The returned items are not stored in the database yet.
 
-            if "tool_calls" in openai_result.additional_kwargs:
-                break
-            logging.info(f"No tools to execute. Attempt {attempt} failed.")
-        else:
-            logging.error("Failed to execute tools after 3 attempts. Exiting.")
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            tools (List[BaseTool]): The tools to use for collecting content.
+            research_topic (str): The research topic for which to collect content.
+            span (StatefulSpanClient): The span to nest the observations in.
+
+        Returns:
+            List[ContentItem]: New content items followed by content already in the database.
+        """
+        existing_content: List[ContentItem] = []
+
+        # 1. Select the tools that can help in collecting content.
+        tool_calls = self.select_tools(tools, research_topic, span)
+        if tool_calls is None:
             return existing_content
-        tool_span.end(
-            output={"tool_calls": openai_result.additional_kwargs["tool_calls"]}
-        )
 
         # 2. Execute the tools.
         tool_execution_span = l.span(
             trace_id=self.trace.id,
             parent_observation_id=span.id,
             name="ToolsExecution",
-            input={
-                "tools_to_be_called": openai_result.additional_kwargs["tool_calls"],
-            },
+            input={"tools_to_be_called": tool_calls},
+        )
+        results, skipped = self.run_tools(
+            tools, tool_calls, research_topic, tool_execution_span
         )
-
-        for tool_call in openai_result.additional_kwargs["tool_calls"]:
-            tool = next(t for t in tools if t.name == tool_call["function"]["name"])
-            payload = json.loads(tool_call["function"]["arguments"])
-            payload["query"] = research_topic  # Add this as a default argument.
-            results.extend(
-                tool.invoke(
-                    payload,
-                    config={"callbacks": [tool_execution_span.get_langchain_handler()]},
-                ).content
-            )
         tool_execution_span.end(
-            output={"results": [content.dict() for content in results]}
+            output={
+                "results": [content.dict() for content in results],
+                "skipped": skipped,
+            }
         )
 
         # 3. Check if urls are already in the content to prevent scraping them again
@@ -339,13 +659,13 @@ class ResearchTask:
             parent_observation_id=span.id,
             name="ScrapeContent",
             input={"payload": payload, "urls": [url["url"] for url in urls_to_scrape]},
-            metadata={"proxy": "zyte", "method": "WebBaseLoader"},
+            metadata={"proxy": "zyte", "method": "AdaptiveWebLoader"},
         )
         # https://python.langchain.com/docs/integrations/document_loaders/web_base/
         logging.info(
             f"Scraping content from {len(urls_to_scrape)} URLs to enrich the content ."
         )
-        loader = WebBaseLoader(
+        loader = AdaptiveWebLoader(
             payload,
             proxies={
                 # https://docs.zyte.com/zyte-api/usage/proxy-mode.html#zyte-api-proxy-mode
@@ -353,8 +673,8 @@ class ResearchTask:
                 for scheme in ("http", "https")
             },
         )
-        loader.requests_per_second = 5
         try:
+            # Every URL takes its own scrape and Zyte slot, see AdaptiveWebLoader.
             docs = loader.aload()
         except Exception as error:
             logging.error(f"Error scraping additional content: {error}")
@@ -363,6 +683,9 @@ class ResearchTask:
 
         # [Document(page_content=" ... ", lookup_str='', metadata={'source': 'https://www.espn.com/'}, lookup_index=0)]
         for i, doc in enumerate(docs):
+            if not doc.page_content:
+                # Failed URLs keep the content the tool returned.
+                continue
             logging.info(
                 f"Scraped content from {urls_to_scrape[i]['url']} successfully."
             )
@@ -373,25 +696,171 @@ class ResearchTask:
 
         # Add existing_content to results
         results.extend(existing_content)
+        return results
 
-        span.end(output={"results": [content.dict() for content in results]})
+    def research_follow_ups(
+        self,
+        db: ContentDB,
+        m: Message,
+        tools: List[BaseTool],
+        research_topics: List[str],
+        cuts: List[str],
+    ) -> List[str]:
+        """
+        Collects content for the additional questions of a task at the same time. The questions
+        are skipped when the time budget runs low.
 
-        if len(results) > 0:
-            m.add("text", text=f"**Found new content** for {self.research_topic}:\n\n")
-            for content in results:
-                db.upsert_doc(content)
-                # logging.info(f"{self.id} - - {content.snippet}")
-                m.add("text", text=f"- [{content.title}]({content.url})")
-            m.notify()
+        Args:
+            db (ContentDB): The database object to interact with the content database.
+            m (Message): The message object to send notifications.
+            tools (List[BaseTool]): The tools to use for collecting content.
+            research_topics (List[str]): The additional questions that need to be answered.
+            cuts (List[str]): Skipped questions are recorded here.
+
+        Returns:
+            List[str]: The ids of the collected content.
+        """
+        if not research_topics:
+            return []
+        self.check_deadline("follow-up research")
+        if self.budget and self.budget.is_low():
+            skipped = ", ".join(f"'{t}'" for t in research_topics)
+            cuts.append(
+                f"Skipped follow-up research on {skipped} to stay within the time budget."
+            )
+            return []
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(research_topics), thread_name_prefix=f"follow-ups-{self.id}"
+        ) as executor:
+            found = list(
+                executor.map(
+                    lambda research_topic: self.find_content(db, tools, research_topic),
+                    research_topics,
+                )
+            )
+
+        # The message is only written from this thread.
+        content_ids = []
+        for results in found:
+            stored = self.store_content(db, m, results)
+            content_ids.extend([content.id for content in stored])
+        return content_ids
+
+    def select_tools(
+        self, tools: List[BaseTool], research_topic: str, span
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Selects the tools for a research topic with the local tool router. Ambiguous topics, or
+        all topics if the task has no router, are given to a tool agent.
+
+        Args:
+            tools (List[BaseTool]): The tools to use for collecting content.
+            research_topic (str): The research topic for which to collect content.
+            span (StatefulSpanClient): The span to nest the observations in.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The tool calls, or None if the tool agent failed.
+        """
+        if self.options.tool_router is not None:
+            tool_calls = self.options.tool_router.route(research_topic, tools, trace=span)
+            if tool_calls is not None:
+                return tool_calls
+
+        # Execute a tool agent to select tools to execute that can help in collecting content.
+        tool_span = l.span(
+            trace_id=self.trace.id,
+            parent_observation_id=span.id,
+            name="ToolAgent",
+            input={
+                "research_topic": research_topic,
+                "tools": [tool.name for tool in tools],
+            },
+        )
+
+        for attempt in range(1, 4):  # Attempt 3 times, counting starts from 1
+            model_with_tools = clients.chat_openai("gpt-3.5-turbo").bind_tools(tools)
+            with limiter.limit("llm"):
+                openai_result = model_with_tools.invoke(
+                    [HumanMessage(content=research_topic)],
+                    config={"callbacks": [tool_span.get_langchain_handler()]},
+                )
+
+            if "tool_calls" in openai_result.additional_kwargs:
+                break
+            logging.info(f"No tools to execute. Attempt {attempt} failed.")
         else:
-            logging.error(f"{self.id} - No content found for '{self.research_topic}'")
-            m.add(
-                "text",
-                text=f"No content found for this research topic {self.research_topic}",
+            logging.error("Failed to execute tools after 3 attempts. Exiting.")
+            return None
+        tool_calls = openai_result.additional_kwargs["tool_calls"]
+        tool_span.end(output={"tool_calls": tool_calls})
+
+        if self.options.tool_router is not None:
+            # Similar topics are routed locally next time.
+            self.options.tool_router.record(
+                research_topic, [tool_call["function"]["name"] for tool_call in tool_calls]
             )
-            m.notify()
+        return tool_calls
 
-        return results
+    def run_tools(
+        self,
+        tools: List[BaseTool],
+        tool_calls: List[Dict[str, Any]],
+        research_topic: str,
+        span,
+    ) -> Tuple[List[ContentItem], List[str]]:
+        """
+        Executes the tool calls of a research topic concurrently. Tools that fail or don't finish
+        within the tool timeout are skipped, so the results of the other tools are still used.
+
+        Args:
+            tools (List[BaseTool]): The tools to use for collecting content.
+            tool_calls (List[Dict[str, Any]]): The tool calls selected by the tool agent.
+            research_topic (str): The research topic, used as query of every tool.
+            span (StatefulSpanClient): The span to nest the tool observations in.
+
+        Returns:
+            Tuple[List[ContentItem], List[str]]: The content items in the order of the tool calls
+                and a description of every skipped tool.
+        """
+        timeout = self.options.tool_timeout
+        if self.budget:
+            timeout = max(min(timeout, self.budget.research_remaining()), 0.0)
+        if self.deadline is not None:
+            timeout = max(min(timeout, self.time_left()), 0.0)
+
+        def run(tool_call: Dict[str, Any]) -> List[ContentItem]:
+            tool = next(t for t in tools if t.name == tool_call["function"]["name"])
+            payload = json.loads(tool_call["function"]["arguments"])
+            payload["query"] = research_topic  # Add this as a default argument.
+            with limiter.limit("search"):
+                output = tool.invoke(
+                    payload, config={"callbacks": [span.get_langchain_handler()]}
+                )
+            self.record_cuts(tool.name, output.cuts)
+            return output.content
+
+        futures = {
+            tool_executor.submit(run, tool_call): tool_call["function"]["name"]
+            for tool_call in tool_calls
+        }
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        # Don't wait for slow tools, their results are dropped. Tools still queued for a thread
+        # don't start at all.
+        for future in not_done:
+            future.cancel()
+
+        results, skipped = [], []
+        for future, name in futures.items():
+            if future in not_done:
+                logging.error(f"{self.id} - Tool {name} timed out after {timeout:.1f}s")
+                skipped.append(f"{name}: timed out after {timeout:.1f}s")
+            elif future.exception() is not None:
+                logging.error(f"{self.id} - Tool {name} failed: {future.exception()}")
+                skipped.append(f"{name}: {future.exception()}")
+            else:
+                results.extend(future.result())
+        return results, skipped
 
     def execute(
         self,
@@ -406,21 +875,46 @@ class ResearchTask:
         # length of content_ids will be zero if this is a root task.
         content_ids = [item.content_used for item in relevant_state.values()]
         content_ids = [item for sublist in content_ids for item in sublist]
+        # Offer prefetched content too, it often makes further collection unnecessary.
+        content_ids.extend(
+            [id for id in self.prefetched_content_ids if id not in content_ids]
+        )
 
         m = self.eezo_context.new_message()
         m.add("text", text=f"**Researching {self.id}** - {self.research_topic}\n\n")
         m.notify()
 
-        if content_ids:
+        cuts = []
+        # Content already chosen by select_and_assess, it isn't selected again.
+        chosen_ids: List[str] = []
+        if content_ids and self.budget and self.budget.is_low():
+            # Running out of time, work with the content we already have.
+            cuts.append(
+                "Skipped the check for missing information to stay within the time budget."
+            )
+        elif content_ids and self.options.merge_select_and_assess:
+            # Select the content and check for missing information in one call.
+            chosen_ids, research_topics = self.select_and_assess(
+                db, m, content_ids, self.research_topic
+            )
+            # Only the content found by the follow-ups still has to be selected. If there is
+            # any, that is a second call, as many as without merging; the merge saves a call
+            # only when no follow-up research is needed.
+            content_ids = [
+                content_id
+                for content_id in self.research_follow_ups(
+                    db, m, tools, research_topics, cuts
+                )
+                if content_id not in chosen_ids
+            ]
+        elif content_ids:
             # Do we need more information besides the given content?
             research_topics = self.check_if_more_info_needed(
                 db, m, self.research_topic, content_ids
             )
-            if len(research_topics) > 0:
-                # Yes, we need more information.
-                for research_topic in research_topics:
-                    results = self.collect_content(db, m, tools, research_topic)
-                    content_ids.extend([content.id for content in results])
+            content_ids.extend(
+                self.research_follow_ups(db, m, tools, research_topics, cuts)
+            )
         else:
             # We definitely need more information.
             results = self.collect_content(db, m, tools, self.research_topic)
@@ -430,30 +924,57 @@ class ResearchTask:
         span.end()
 
         # Select what information to use for the summary.
-        content_ids = self.decide_what_to_use(db, m, content_ids, self.research_topic)
+        self.check_deadline("selecting content")
+        if content_ids:
+            content_ids = self.decide_what_to_use(db, m, content_ids, self.research_topic)
+        content_ids = chosen_ids + content_ids
 
         # Process the content to generate the summary.
         content_docs: List[ContentItem] = [
-            db.get_doc_by_id(content_id) for content_id in content_ids
+            content
+            for content in (db.get_doc_by_id(content_id) for content_id in content_ids)
+            if content
         ]
+        # Fit the pages into the token budget, the headers of all pages are always kept.
+        headers = [
+            f"Webpage {i + 1}:\nTitle: {content.title}\nUrl: {content.url}\nContent: "
+            for i, content in enumerate(content_docs)
+        ]
+        system_prompt, data = extract_notes.assemble(
+            research_topic=self.research_topic,
+            formatted_webpages="\n\n".join(headers),
+        )
+        page_contents, page_cuts = prompt_packer.pack(
+            [content.content for content in content_docs],
+            model="gpt-4o",
+            reserved_tokens=prompt_packer.count(system_prompt + data, "gpt-4o"),
+            query=self.research_topic,
+            labels=[f"Webpage '{content.title}'" for content in content_docs],
+            trace=self.trace,
+        )
+        self.record_cuts("ConvertWebpagesToNotes", page_cuts)
         formatted_webpages = ""
-        for i, content in enumerate(content_docs):
-            if content:
-                formatted_webpages += f"Webpage {i + 1}:\nTitle: {content.title}\nUrl: {content.url}\nContent: {content.content}\n\n"
+        for header, page_content in zip(headers, page_contents):
+            formatted_webpages += f"{header}{page_content}\n\n"
 
+        self.check_deadline("generating notes")
         logging.info(
             f"{self.id} - Generating notes for topic '{self.research_topic}'..."
         )
-        system_prompt = extract_notes.compile(
+        # The instructions are the same for every task, the topic and webpages go last.
+        system_prompt, data = extract_notes.assemble(
             research_topic=self.research_topic, formatted_webpages=formatted_webpages
         )
+        # Stream the notes into the task's message while they are written.
         notes = langfuse_model_wrapper(
             trace=self.trace,
             name="ConvertWebpagesToNotes",
             system_prompt=system_prompt,
             prompt=extract_notes,
             user_prompt="Generate 20 to 30 bullet point notes based on the content provided.",
+            data=data,
             temperature=0.5,
+            stream_to=MessageStream(m, text="**Notes:**\n\n"),
         )
 
         content_urls = []
@@ -469,6 +990,7 @@ class ResearchTask:
             research_topic=self.research_topic,
             id=self.id,
             error="",
+            cuts=cuts + self.prompt_cuts,
         )
 
         return results
@@ -1,22 +1,99 @@
 # Import necessary modules and classes
-from .research_task import ResearchTask, TaskResult
-from .db import ContentDB
+from .research_task import ResearchTask, TaskResult, TaskDeadlineExceeded
+from .research_options import ResearchOptions
+from .worker_pool import WorkerPool, worker_pool
+from .run_budget import RunBudget
+from .db import ContentDB, CheckpointDB, JobQueue
 
+from utils.resource_limiter import limiter
+from contextlib import nullcontext
 from langchain.tools import BaseTool
 from collections import defaultdict
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterator, AsyncIterator
 
 import concurrent.futures
 import traceback
+import queue
 import threading
+import asyncio
 import logging
+import heapq
+import time
+import uuid
 import os
 
 
+class StageLatency:
+    """
+    Keeps an exponentially weighted moving average of task latencies per stage.
+
+    The history is shared by all schedulers in the process and is used to weight
+    the critical path of a DAG by how long each kind of task usually takes.
+
+    Attributes:
+        alpha (float): Weight of the latest observation in the moving average.
+        default (float): Latency assumed for stages without any history.
+        averages (Dict[str, float]): Average latency in seconds per stage.
+    """
+
+    def __init__(self, alpha: float = 0.2, default: float = 1.0):
+        self.alpha = alpha
+        self.default = default
+        self.averages: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Adds an observed latency to the history of a stage.
+
+        Args:
+            stage (str): The stage the task belongs to.
+            seconds (float): The observed latency in seconds.
+        """
+        with self.lock:
+            average = self.averages.get(stage)
+            if average is None:
+                self.averages[stage] = seconds
+            else:
+                self.averages[stage] = (
+                    self.alpha * seconds + (1 - self.alpha) * average
+                )
+
+    def get(self, stage: str) -> float:
+        """
+        Returns the average latency of a stage, or the default if unknown.
+
+        Args:
+            stage (str): The stage to look up.
+
+        Returns:
+            float: The average latency in seconds.
+        """
+        with self.lock:
+            return self.averages.get(stage, self.default)
+
+
+stage_latency = StageLatency()
+
+
 class TaskScheduler:
     """
     Schedules and manages the execution of a set of research tasks, taking into account their dependencies.
 
+    The DAG is driven by an asyncio event loop. Tasks run on the threads of the process-wide
+    WorkerPool and every running task holds a worker slot of that pool, which is shared fairly
+    between all concurrent runs. Tasks waiting for a slot are futures on the event loop, so a wide
+    outline queues up without tying up a thread per waiting task. A running task is still
+    synchronous: its tool and LLM calls block its pool thread, so the tasks in flight are bounded
+    by the size of the pool, not by the event loop.
+    Ready tasks wait in a priority queue ranked by the length of their longest remaining
+    downstream path, so the critical path of the DAG starts first when workers are limited.
+    In speculative mode, idle worker slots prefetch content for tasks that still wait for their
+    dependencies, which moves search and scraping off the critical path.
+    With a time budget, every task gets a deadline and tasks are skipped once the budget is used up.
+    In worker mode, ready tasks are put on a durable JobQueue and executed by separate worker processes.
+    In streaming mode, tasks can be added while the scheduler runs, e.g. as a plan is being generated.
+
     Attributes:
         tasks (List[ResearchTask]): List of research tasks to be scheduled.
         tools (List[BaseTool]): List of tools to be used in tasks.
@@ -25,7 +102,16 @@ class TaskScheduler:
         dependents (defaultdict): Tracks task dependents.
         in_degree (defaultdict): Tracks task dependencies count.
         task_map (Dict): Maps task IDs to task objects for fast lookup.
-        executor (ThreadPoolExecutor): Thread pool executor for concurrent task execution.
+        priorities (Dict[str, float]): Length of the longest remaining path starting at each task.
+        options (ResearchOptions): The options of the run, e.g. max_concurrency and task_timeout.
+        pool (WorkerPool): The worker pool shared by all runs in the process.
+        run_id (str): The ID of the run, used for fair-share scheduling in the pool and as checkpoint key.
+        checkpoint_db (Optional[CheckpointDB]): Database the result of every finished task is saved to.
+        budget (Optional[RunBudget]): The time budget of the run.
+        job_queue (Optional[JobQueue]): Queue the tasks are handed to in worker mode.
+        poll_interval (float): Seconds between checks for the results of queued tasks.
+        streaming (bool): Whether tasks can still be added with add_task().
+        threads (Dict[str, Future]): The threads of the running tasks per task ID.
         lock (threading.Lock): Lock for thread-safe operations.
     """
 
@@ -33,6 +119,15 @@ class TaskScheduler:
         self,
         tasks: List[ResearchTask],  # List of research tasks to be scheduled
         tools: List[BaseTool],  # List of tools to be used in tasks
+        options: Optional[ResearchOptions] = None,  # Concurrency, speculation and timeouts
+        latency_weighted: bool = True,  # Weight the critical path by stage latencies
+        pool: Optional[WorkerPool] = None,  # Worker pool shared by all runs
+        run_id: Optional[str] = None,  # ID of the run for fair-share scheduling
+        checkpoint_db: Optional[CheckpointDB] = None,  # Store for finished task results
+        budget: Optional[RunBudget] = None,  # Time budget of the run
+        job_queue: Optional[JobQueue] = None,  # Queue consumed by worker processes
+        poll_interval: float = 0.5,  # Seconds between checks for queued results
+        streaming: bool = False,  # Accept more tasks until close() is called
     ):
         """
         Initializes the TaskScheduler with a list of tasks and tools.
@@ -40,6 +135,21 @@ class TaskScheduler:
         Args:
             tasks (List[ResearchTask]): The tasks to be executed.
             tools (List[BaseTool]): The tools available for task execution.
+            options (Optional[ResearchOptions]): The options of the run. The scheduler uses
+                max_concurrency, resource_limits, speculative and task_timeout.
+            latency_weighted (bool): Weight each task on the critical path by the historical
+                latency of its stage instead of counting every task as 1.
+            pool (Optional[WorkerPool]): The worker pool to run on. Defaults to the process-wide pool.
+            run_id (Optional[str]): The ID of the run. Defaults to a random ID.
+            checkpoint_db (Optional[CheckpointDB]): If given, every finished task is checkpointed under
+                the run ID and tasks already completed for this run ID are loaded instead of executed.
+            budget (Optional[RunBudget]): The time budget of the run. Tasks are not started once the
+                research part of the budget is used up and never run past it.
+            job_queue (Optional[JobQueue]): If given, ready tasks are put on this queue and executed by
+                ResearchWorker processes instead of this process.
+            poll_interval (float): Seconds between checks for the results of queued tasks.
+            streaming (bool): If True, more tasks can be added with add_task() while the scheduler
+                runs, and it only finishes after close() was called and all tasks are done.
         """
         self.tasks: List[ResearchTask] = tasks
         self.state: Dict[str, TaskResult] = {}
@@ -50,8 +160,25 @@ class TaskScheduler:
         self.in_degree = defaultdict(int)
         self.task_map = {task.id: task for task in tasks}
         self.setup_dependencies()
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self.latency_weighted = latency_weighted
+        self.priorities: Dict[str, float] = self.compute_priorities()
+        self.options = options or ResearchOptions()
+        if self.options.resource_limits:
+            limiter.configure(self.options.resource_limits)
+        self.pool: WorkerPool = pool or worker_pool
+        self.run_id: str = run_id or str(uuid.uuid4())
+        self.checkpoint_db: Optional[CheckpointDB] = checkpoint_db
+        self.budget = budget
+        self.job_queue: Optional[JobQueue] = job_queue
+        self.poll_interval = poll_interval
+        self.streaming = streaming
+        self.added: List[ResearchTask] = []  # Added tasks that are ready to run
+        self.notify_added = lambda: None  # Wakes up the running scheduler
         self.lock = threading.Lock()
+        # Threads of the running tasks, their worker slots are held until they return.
+        self.threads: Dict[str, concurrent.futures.Future] = {}
+        if self.checkpoint_db:
+            self.restore_checkpoint()
 
     def setup_dependencies(self) -> None:
         """
@@ -62,6 +189,122 @@ class TaskScheduler:
             for dep in task.dependencies:
                 self.dependents[dep].append(task.id)
 
+    def add_task(self, task: ResearchTask) -> None:
+        """
+        Adds a task to a running scheduler in streaming mode. The task may depend on tasks that were
+        added before or are added later. It starts as soon as all of its dependencies are done.
+        Can be called from any thread.
+
+        Args:
+            task (ResearchTask): The task to add.
+        """
+        with self.lock:
+            if not self.streaming:
+                raise RuntimeError("Tasks can only be added to a scheduler in streaming mode.")
+            if task.id in self.task_map:
+                logging.error(f"Task {task.id} was already added, ignoring it.")
+                return
+            self.tasks.append(task)
+            self.task_map[task.id] = task
+            self.in_degree[task.id] = len(
+                [dep for dep in task.dependencies if dep not in self.state]
+            )
+            for dep in task.dependencies:
+                self.dependents[dep].append(task.id)
+            self.priorities = self.compute_priorities()
+            if self.in_degree[task.id] == 0:
+                self.added.append(task)
+            notify = self.notify_added
+        logging.info(f"Added task {task.id}")
+        notify()
+
+    def close(self) -> None:
+        """
+        Tells a scheduler in streaming mode that no more tasks will be added.
+        Can be called from any thread.
+        """
+        with self.lock:
+            self.streaming = False
+            notify = self.notify_added
+        notify()
+
+    def restore_checkpoint(self) -> None:
+        """
+        Loads the successfully completed tasks of this run from the checkpoint database.
+        Failed tasks are not restored, so they are executed again together with everything
+        downstream of them, since those results were built on the failed result.
+        """
+        saved = {
+            task_id: result
+            for task_id, result in self.checkpoint_db.get_task_results(self.run_id).items()
+            if task_id in self.task_map and not result.get("error")
+        }
+        restored = True
+        while restored:
+            restored = False
+            for task in self.tasks:
+                if task.id in self.state or task.id not in saved:
+                    continue
+                if all(dep in self.state for dep in task.dependencies):
+                    self.state[task.id] = TaskResult(**saved[task.id])
+                    for dependent_id in self.dependents[task.id]:
+                        self.in_degree[dependent_id] -= 1
+                    restored = True
+        if self.state:
+            logging.info(
+                f"Restored {len(self.state)} completed tasks of run {self.run_id}: {list(self.state)}"
+            )
+
+    @staticmethod
+    def stage_of(task: ResearchTask) -> str:
+        """
+        Returns the stage of a task. Root tasks always collect new content while
+        dependent tasks first assess the content of their parents.
+
+        Args:
+            task (ResearchTask): The task to classify.
+
+        Returns:
+            str: "root" or "dependent".
+        """
+        return "dependent" if task.dependencies else "root"
+
+    def compute_priorities(self) -> Dict[str, float]:
+        """
+        Computes the length of the longest path from each task to the end of the DAG,
+        including the task itself.
+
+        Returns:
+            Dict[str, float]: The priority of each task. Higher values start first.
+        """
+        priorities: Dict[str, float] = {}
+        visiting = set()
+
+        def longest_path(task_id: str) -> float:
+            if task_id in priorities:
+                return priorities[task_id]
+            if task_id in visiting:
+                # Cycles are not expected in a DAG, don't recurse forever if there is one.
+                logging.error(f"Dependency cycle detected at task {task_id}")
+                return 0.0
+            visiting.add(task_id)
+            task = self.task_map[task_id]
+            weight = (
+                stage_latency.get(self.stage_of(task)) if self.latency_weighted else 1.0
+            )
+            downstream = [
+                longest_path(dependent_id)
+                for dependent_id in self.dependents[task_id]
+                if dependent_id in self.task_map
+            ]
+            visiting.discard(task_id)
+            priorities[task_id] = weight + max(downstream, default=0.0)
+            return priorities[task_id]
+
+        for task in self.tasks:
+            longest_path(task.id)
+        return priorities
+
     def execute_task(self, task: ResearchTask) -> TaskResult:
         """
         Executes a single task and returns the result.
@@ -75,50 +318,372 @@ class TaskScheduler:
         try:
             result: TaskResult = task.execute(self.db, self.state, self.tools)
             return result
+        except TaskDeadlineExceeded as error:
+            # The scheduler already recorded the timeout, the task only stopped early.
+            logging.error(str(error))
+            return TaskResult(id=task.id, error=str(error))
+        except Exception:
+            logging.error(f"Error executing task {task.id}: {traceback.format_exc()}")
+            return TaskResult(id=task.id, error=f"{traceback.format_exc()}")
+
+    async def aexecute_task(self, task: ResearchTask) -> TaskResult:
+        """
+        Executes a single task on a thread of the worker pool, or on a worker process in worker
+        mode, and returns the result.
+
+        Args:
+            task (ResearchTask): The task to be executed.
+
+        Returns:
+            TaskResult: The result of the executed task.
+        """
+        if self.job_queue is None:
+            thread = self.pool.executor.submit(self.execute_task, task)
+            with self.lock:
+                self.threads[task.id] = thread
+            return await asyncio.wrap_future(thread)
+        try:
+            return await self.aexecute_remote(task)
         except Exception:
             logging.error(f"Error executing task {task.id}: {traceback.format_exc()}")
             return TaskResult(id=task.id, error=f"{traceback.format_exc()}")
 
+    async def aexecute_remote(self, task: ResearchTask) -> TaskResult:
+        """
+        Puts a task on the job queue and waits until a worker process wrote its result back.
+
+        Args:
+            task (ResearchTask): The task to be executed.
+
+        Returns:
+            TaskResult: The result of the executed task.
+        """
+        # The queue calls block on sqlite and its lock, so they run off the event loop.
+        payload = task.to_payload(self.state)
+        job_id = await asyncio.to_thread(self.job_queue.put, self.run_id, task.id, payload)
+        try:
+            job = await asyncio.to_thread(self.job_queue.get_result, job_id)
+            while job["status"] not in ("done", "failed"):
+                await asyncio.sleep(self.poll_interval)
+                job = await asyncio.to_thread(self.job_queue.get_result, job_id)
+        except asyncio.CancelledError:
+            # The thread finishes the cancel even if this coroutine is cancelled again.
+            await asyncio.to_thread(self.job_queue.cancel, job_id)
+            raise
+        if job["status"] == "failed":
+            logging.error(f"Job {job_id} of task {task.id} failed: {job['result']}")
+            return TaskResult(
+                id=task.id,
+                research_topic=task.research_topic,
+                error=job["result"]["error"],
+            )
+        return TaskResult(**job["result"])
+
+    def task_deadline(self) -> Optional[float]:
+        """
+        Returns the number of seconds a task started now may run, or None if it is not limited.
+        """
+        limits = [self.options.task_timeout] if self.options.task_timeout else []
+        if self.budget:
+            limits.append(self.budget.research_remaining())
+        return max(min(limits), 0.0) if limits else None
+
+    async def arun_with_budget(self, task: ResearchTask) -> TaskResult:
+        """
+        Executes a task within its deadline. Tasks are skipped when the budget is used up and
+        stopped when they run past their deadline. Both are recorded as cuts of the task.
+
+        Args:
+            task (ResearchTask): The task to be executed.
+
+        Returns:
+            TaskResult: The result of the task.
+        """
+        if self.budget and self.budget.is_exhausted():
+            logging.error(f"Skipping task {task.id}, the time budget is used up.")
+            return TaskResult(
+                id=task.id,
+                research_topic=task.research_topic,
+                error="Skipped: time budget exhausted.",
+                cuts=["Not researched because the time budget of the run was used up."],
+            )
+        timeout = self.task_deadline()
+        # The task checks its deadline between its steps, so it stops soon after the scheduler
+        # stopped waiting for it.
+        task.deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            return await asyncio.wait_for(self.aexecute_task(task), timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Task {task.id} did not finish within {timeout:.0f} seconds.")
+            return TaskResult(
+                id=task.id,
+                research_topic=task.research_topic,
+                error=f"Timed out after {timeout:.0f} seconds.",
+                cuts=[
+                    f"Research was stopped after {timeout:.0f} seconds to stay within the time budget."
+                ],
+            )
+
+    def prefetch_task(self, task: ResearchTask) -> None:
+        """
+        Prefetches content for a blocked task. Failures are logged and otherwise ignored,
+        the task collects its content itself when it executes.
+
+        Args:
+            task (ResearchTask): The task to prefetch content for.
+        """
+        try:
+            task.prefetch(self.db, self.tools)
+        except Exception:
+            logging.error(f"Error prefetching task {task.id}: {traceback.format_exc()}")
+
+    async def aprefetch_task(self, task: ResearchTask) -> None:
+        """
+        Prefetches content for a blocked task on the worker slot already acquired for it.
+        The slot is released once the thread is done, also if the prefetch is cancelled.
+
+        Args:
+            task (ResearchTask): The task to prefetch content for.
+        """
+        try:
+            logging.info(f"Prefetching content for blocked task {task.id}")
+            thread = self.pool.executor.submit(self.prefetch_task, task)
+        except BaseException:
+            self.pool.release(self.run_id)
+            raise
+        thread.add_done_callback(lambda _: self.pool.release(self.run_id))
+        await asyncio.wrap_future(thread)
+
+    def release_worker_slot(self, task: ResearchTask) -> None:
+        """
+        Gives the worker slot of a task back to the pool. A task that was stopped waiting for
+        at its deadline may still run on its thread, its slot is only released when it returns,
+        so the pool never runs more threads than it has slots.
+
+        Args:
+            task (ResearchTask): The task that held the slot.
+        """
+        with self.lock:
+            thread = self.threads.pop(task.id, None)
+        if thread is None or thread.done():
+            self.pool.release(self.run_id)
+        else:
+            logging.error(f"Task {task.id} is still running, keeping its worker slot")
+            thread.add_done_callback(lambda _: self.pool.release(self.run_id))
+
+    def complete_task(self, result: TaskResult) -> List[ResearchTask]:
+        """
+        Stores the result of a task and updates the in-degree of its dependents.
+
+        Args:
+            result (TaskResult): The result of the finished task.
+
+        Returns:
+            List[ResearchTask]: The dependent tasks that became ready.
+        """
+        if self.checkpoint_db:
+            self.checkpoint_db.save_task_result(self.run_id, result.id, result.to_dict())
+        ready = []
+        with self.lock:
+            self.state[result.id] = result
+
+            # Check dependent tasks and update their in-degree
+            for dependent_id in self.dependents[result.id]:
+                self.in_degree[dependent_id] -= 1
+                if self.in_degree[dependent_id] == 0:
+                    logging.info(f"Dependent task {dependent_id} is ready")
+                    ready.append(self.task_map[dependent_id])
+        return ready
+
     def execute(self) -> None:
         """
         Executes all tasks in the scheduler, respecting their dependencies.
         """
-        futures = {}
-        # Find tasks with no dependencies and submit them for execution
-        for task in [t for t in self.tasks if self.in_degree[t.id] == 0]:
-            logging.info(f"Executing task {task.id}")
-            future = self.executor.submit(self.execute_task, task)
-            futures[task.id] = future
-
-        while futures:
-            # Wait for the first task to complete
-            done, _ = concurrent.futures.wait(
-                futures.values(), return_when=concurrent.futures.FIRST_COMPLETED
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.aexecute())
+            return
+        raise RuntimeError(
+            "TaskScheduler.execute() cannot be called from a running event loop. Use aexecute() instead."
+        )
+
+    async def aexecute(self) -> None:
+        """
+        Executes all tasks in the scheduler on the running event loop, respecting their dependencies.
+        """
+        async for _ in self.aiter_results():
+            pass
+
+    def iter_results(self) -> Iterator[TaskResult]:
+        """
+        Executes all tasks and yields each result as soon as its task completes, in completion order.
+        The tasks run on an event loop in a background thread, so they keep running while the caller
+        processes the results. Stopping the iteration early cancels the remaining tasks.
+
+        Yields:
+            TaskResult: The result of the next completed task.
+        """
+        results: queue.Queue = queue.Queue()
+        done = object()
+        loop = asyncio.new_event_loop()
+
+        async def produce() -> None:
+            try:
+                async for result in self.aiter_results():
+                    results.put(result)
+            except BaseException as error:
+                results.put(error)
+            finally:
+                results.put(done)
+
+        producer = loop.create_task(produce())
+        thread = threading.Thread(
+            target=loop.run_until_complete,
+            args=(producer,),
+            name=f"scheduler-{self.run_id}",
+            daemon=True,
+        )
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            loop.call_soon_threadsafe(producer.cancel)
+            thread.join()
+            loop.close()
+
+    async def aiter_results(self) -> AsyncIterator[TaskResult]:
+        """
+        Executes all tasks on the running event loop and yields each result as soon as its task
+        completes, in completion order. Results restored from a checkpoint are yielded first.
+        Stopping the iteration early cancels the remaining tasks.
+
+        Yields:
+            TaskResult: The result of the next completed task.
+        """
+        for result in list(self.state.values()):
+            yield result
+
+        semaphore = (
+            asyncio.Semaphore(self.options.max_concurrency)
+            if self.options.max_concurrency
+            else nullcontext()
+        )
+        order = {task.id: i for i, task in enumerate(self.tasks)}
+        ready = []  # Heap of (-priority, position in outline, task id)
+
+        prefetching: Dict[str, asyncio.Task] = {}
+
+        def prefetch_on_idle_workers() -> None:
+            # Start with the blocked tasks on the critical path, they are needed first.
+            with self.lock:
+                tasks = list(self.tasks)
+            blocked = sorted(
+                (
+                    task
+                    for task in tasks
+                    if self.in_degree[task.id] > 0
+                    and task.id not in prefetching
+                    and hasattr(task, "prefetch")
+                ),
+                key=lambda task: -self.priorities[task.id],
             )
-            for future in done:
-                result = future.result()
-                task_id = result.id
+            for task in blocked:
+                if not self.pool.try_acquire(self.run_id):
+                    break
+                prefetching[task.id] = asyncio.create_task(self.aprefetch_task(task))
 
-                with self.lock:
-                    self.state[task_id] = result
+        async def run_next() -> TaskResult:
+            # Every ready task gets one of these coroutines. Whichever gets a worker
+            # first runs the ready task with the highest priority at that moment.
+            async with semaphore:
+                await self.pool.acquire(self.run_id)
+                _, _, task_id = heapq.heappop(ready)
+                task = self.task_map[task_id]
+                try:
+                    if task_id in prefetching and not prefetching[task_id].done():
+                        # The prefetch does the work this task needs first, let it finish.
+                        await asyncio.wait([prefetching[task_id]])
+                    logging.info(
+                        f"Executing task {task.id} (priority {self.priorities[task.id]:.2f})"
+                    )
+                    start = time.monotonic()
+                    result = await self.arun_with_budget(task)
+                    stage_latency.record(self.stage_of(task), time.monotonic() - start)
+                    # Queue the dependents before giving up the worker, so they compete
+                    # for it with their real priority.
+                    for dependent_task in self.complete_task(result):
+                        submit(dependent_task)
+                    return result
+                finally:
+                    self.release_worker_slot(task)
 
-                    # Check dependent tasks and update their in-degree
-                    for dependent_id in self.dependents[task_id]:
-                        self.in_degree[dependent_id] -= 1
-                        if self.in_degree[dependent_id] == 0:
-                            dependent_task = self.task_map[dependent_id]
-                            logging.info(
-                                f"Executing dependent task {dependent_task.id}"
-                            )
-                            future = self.executor.submit(
-                                self.execute_task, dependent_task
-                            )
-                            futures[dependent_task.id] = future
-
-                del futures[task_id]
+        def submit(task: ResearchTask) -> None:
+            position = order.setdefault(task.id, len(order))
+            heapq.heappush(ready, (-self.priorities[task.id], position, task.id))
+            running.add(asyncio.create_task(run_next()))
+
+        def submit_added() -> bool:
+            # Submits the ready tasks added in streaming mode, returns whether more may come.
+            with self.lock:
+                added, self.added = self.added, []
+                streaming = self.streaming
+            for task in added:
+                submit(task)
+            return streaming
+
+        running = set()
+        loop = asyncio.get_running_loop()
+        tasks_added = asyncio.Event()
+        with self.lock:
+            # Find tasks with no pending dependencies that were not restored and submit them
+            self.added = [
+                task
+                for task in self.tasks
+                if self.in_degree[task.id] == 0 and task.id not in self.state
+            ]
+            self.notify_added = lambda: loop.call_soon_threadsafe(tasks_added.set)
+        streaming = submit_added()
+
+        try:
+            while running or streaming:
+                if self.options.speculative:
+                    # Let new tasks request their worker slots first, so the
+                    # prefetches only take the slots nobody is waiting for.
+                    await asyncio.sleep(0)
+                    prefetch_on_idle_workers()
+                # Wait for the first task to complete, or for new tasks in streaming mode
+                waiting = set(running)
+                if streaming:
+                    waiting.add(asyncio.create_task(tasks_added.wait()))
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in waiting - running:
+                    future.cancel()
+                finished = done & running
+                running.difference_update(finished)
+                for future in finished:
+                    yield future.result()
+                tasks_added.clear()
+                streaming = submit_added()
+        finally:
+            self.notify_added = lambda: None
+            # Don't leave slot requests or prefetches of this run behind in the shared pool.
+            for future in list(running) + list(prefetching.values()):
+                future.cancel()
+
+        blocked = [task.id for task in self.tasks if task.id not in self.state]
+        if blocked:
+            logging.error(f"Tasks with dependencies that never completed: {blocked}")
 
         logging.info("All tasks executed.")
-        self.executor.shutdown()
 
     def get_results(self) -> List[TaskResult]:
         """
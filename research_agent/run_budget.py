@@ -0,0 +1,100 @@
+from typing import Optional, Dict, Any
+
+import time
+
+
+class RunBudget:
+    """
+    Tracks the time budget of a research run.
+
+    Part of the budget is reserved for the final report. Once the remaining research time drops
+    below `degrade_below` of the budget, tasks cut optional work (further information checks and
+    follow-up research). Once it is used up, no new tasks are started.
+
+    Attributes:
+        seconds (float): The total time budget of the run in seconds.
+        deadline (float): The monotonic time at which the run must be finished.
+        report_reserve (float): Seconds kept free for generating the final report.
+        degrade_below (float): Fraction of the budget below which tasks start to cut work.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        report_reserve: Optional[float] = None,
+        degrade_below: float = 0.3,
+    ):
+        """
+        Initializes the RunBudget. The clock starts immediately.
+
+        Args:
+            seconds (float): The total time budget of the run in seconds.
+            report_reserve (Optional[float]): Seconds kept free for the final report.
+                Defaults to 15% of the budget.
+            degrade_below (float): Fraction of the budget below which tasks start to cut work.
+        """
+        if seconds <= 0:
+            raise ValueError("The time budget must be positive.")
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.report_reserve = (
+            report_reserve if report_reserve is not None else 0.15 * seconds
+        )
+        self.degrade_below = degrade_below
+
+    def remaining(self) -> float:
+        """
+        Returns the seconds left until the deadline of the run.
+        """
+        return self.deadline - time.monotonic()
+
+    def research_remaining(self) -> float:
+        """
+        Returns the seconds left for research, i.e. without the final report reserve.
+        """
+        return self.remaining() - self.report_reserve
+
+    def is_low(self) -> bool:
+        """
+        Returns True if tasks should cut optional work to finish on time.
+        """
+        return self.research_remaining() < self.degrade_below * self.seconds
+
+    def is_exhausted(self) -> bool:
+        """
+        Returns True if no time is left for research.
+        """
+        return self.research_remaining() <= 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts the RunBudget to a dictionary that can be sent to another process.
+
+        Returns:
+            dict: The RunBudget as a dictionary with a wall-clock deadline.
+        """
+        return {
+            "seconds": self.seconds,
+            "deadline_at": time.time() + self.remaining(),
+            "report_reserve": self.report_reserve,
+            "degrade_below": self.degrade_below,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunBudget":
+        """
+        Restores a RunBudget created by to_dict(), keeping its original deadline.
+
+        Args:
+            data (Dict[str, Any]): The RunBudget as a dictionary.
+
+        Returns:
+            RunBudget: The restored RunBudget.
+        """
+        budget = cls(
+            data["seconds"],
+            report_reserve=data["report_reserve"],
+            degrade_below=data["degrade_below"],
+        )
+        budget.deadline = time.monotonic() + (data["deadline_at"] - time.time())
+        return budget
@@ -0,0 +1,258 @@
+from typing import Any, Dict, List, Optional, Set
+from langchain.tools import BaseTool
+from collections import defaultdict
+
+import threading
+import logging
+import json
+import math
+import re
+
+# Phrases in a research topic that point to a tool, per tool name.
+DEFAULT_RULES: Dict[str, List[str]] = {
+    "news-search": [
+        "news",
+        "latest",
+        "recent",
+        "recently",
+        "today",
+        "this week",
+        "this month",
+        "announced",
+        "announcement",
+        "headlines",
+    ],
+    "exa-company-search": [
+        "company",
+        "companies",
+        "startup",
+        "startups",
+        "competitor",
+        "competitors",
+        "vendor",
+        "vendors",
+        "provider",
+        "providers",
+        "manufacturers",
+    ],
+    "similar-web-search": ["similarweb", "website traffic", "web traffic", "monthly visits"],
+}
+# Tools used when no tool matches a topic.
+DEFAULT_TOOLS: List[str] = ["you-com-search"]
+# Words ignored when matching topics against tool descriptions.
+STOP_WORDS = set(
+    "the and for with that this are was what when how why which who use user users wants asks "
+    "invoke don only not from into about its their there than can cannot other".split()
+)
+
+
+class ToolRouter:
+    """
+    Picks the tools for a research topic locally, without an LLM call. A topic is scored against
+    every tool by rule phrases, the words of the tool description, and the words of topics the LLM
+    sent to the tool before. Tools scoring at least min_score are used, the default tools if none
+    does.
+
+    Tools with arguments besides the query (e.g. the entity name of SimilarWeb) can't be filled
+    in locally. Topics matching such a tool are ambiguous and left to the LLM tool-calling path,
+    whose choices are recorded to improve later routing.
+
+    Attributes:
+        rules (Dict[str, List[str]]): Phrases in a topic that point to a tool, per tool name.
+        default_tools (List[str]): Tools used when no tool matches a topic.
+        min_score (float): Tools need at least this score to be used.
+        max_tools (int): Maximum number of tools per topic.
+        min_samples (int): LLM choices of a tool needed before they are used for scoring.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, List[str]]] = None,
+        default_tools: Optional[List[str]] = None,
+        min_score: float = 1.0,
+        max_tools: int = 2,
+        min_samples: int = 3,
+    ):
+        """
+        Initializes the ToolRouter with the default rules, optionally overridden.
+
+        Args:
+            rules (Optional[Dict[str, List[str]]]): Rules overriding DEFAULT_RULES.
+            default_tools (Optional[List[str]]): Tools used when no tool matches a topic.
+            min_score (float): Tools need at least this score to be used.
+            max_tools (int): Maximum number of tools per topic.
+            min_samples (int): LLM choices of a tool needed before they are used for scoring.
+        """
+        self.lock = threading.Lock()
+        self.rules: Dict[str, List[str]] = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.default_tools = default_tools if default_tools is not None else DEFAULT_TOOLS
+        self.min_score = min_score
+        self.max_tools = max_tools
+        self.min_samples = min_samples
+        self.patterns: Dict[str, re.Pattern] = {}
+        self.descriptions: Dict[str, Dict[str, float]] = {}
+        # Per tool: the number of LLM choices and how often each topic word was among them.
+        self.selections: Dict[str, int] = defaultdict(int)
+        self.learned: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.counts: Dict[str, int] = {"local": 0, "llm": 0}
+
+    def configure(
+        self,
+        rules: Optional[Dict[str, List[str]]] = None,
+        default_tools: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Updates the rules of one or more tools and the default tools.
+
+        Args:
+            rules (Optional[Dict[str, List[str]]]): Phrases in a topic that point to a tool.
+            default_tools (Optional[List[str]]): Tools used when no tool matches a topic.
+        """
+        with self.lock:
+            self.rules.update(rules or {})
+            self.patterns.clear()
+            if default_tools is not None:
+                self.default_tools = default_tools
+        logging.info(f"Tool routes set to {self.rules}, default tools {self.default_tools}")
+
+    def _terms(self, text: str) -> Set[str]:
+        return set(re.findall(r"[a-z]{3,}", text.lower())) - STOP_WORDS
+
+    def _pattern(self, name: str) -> Optional[re.Pattern]:
+        """
+        Returns the compiled rule phrases of a tool. Needs the lock.
+        """
+        if name not in self.patterns:
+            phrases = self.rules.get(name)
+            self.patterns[name] = (
+                re.compile(r"\b(" + "|".join(map(re.escape, phrases)) + r")\b")
+                if phrases
+                else None
+            )
+        return self.patterns[name]
+
+    def _description_weights(self, tools: List[BaseTool]) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the words of every tool description, weighted by how specific they are to the
+        tool. Words found in every description weigh nothing. Needs the lock.
+        """
+        key = "\n".join(f"{tool.name}:{tool.description}" for tool in tools)
+        if key not in self.descriptions:
+            terms = {tool.name: self._terms(tool.description) for tool in tools}
+            weights = {}
+            for name, tool_terms in terms.items():
+                weights[name] = {
+                    term: math.log(len(tools) / sum(term in t for t in terms.values()))
+                    for term in tool_terms
+                }
+            self.descriptions[key] = weights
+        return self.descriptions[key]
+
+    def scores(self, research_topic: str, tools: List[BaseTool]) -> Dict[str, float]:
+        """
+        Scores the tools for a research topic.
+
+        Args:
+            research_topic (str): The research topic.
+            tools (List[BaseTool]): The available tools.
+
+        Returns:
+            Dict[str, float]: The score of every tool.
+        """
+        topic = research_topic.lower()
+        terms = self._terms(topic)
+        scores = {}
+        with self.lock:
+            descriptions = self._description_weights(tools)
+            for tool in tools:
+                pattern = self._pattern(tool.name)
+                score = len(set(pattern.findall(topic))) if pattern else 0.0
+                score += 0.5 * sum(descriptions[tool.name].get(term, 0.0) for term in terms)
+                selections = self.selections[tool.name]
+                if selections >= self.min_samples:
+                    learned = self.learned[tool.name]
+                    score += sum(learned.get(term, 0) for term in terms) / selections
+                scores[tool.name] = score
+        return scores
+
+    def _needs_arguments(self, tool: BaseTool) -> bool:
+        """
+        Returns True if the tool takes arguments besides the query, which only the LLM can fill.
+        """
+        fields = getattr(tool.args_schema, "__fields__", None) or {}
+        return bool(set(fields) - {"query"})
+
+    def route(
+        self, research_topic: str, tools: List[BaseTool], trace=None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Picks the tools for a research topic.
+
+        Args:
+            research_topic (str): The research topic.
+            tools (List[BaseTool]): The available tools.
+            trace (Optional[StatefulTraceClient]): If given, the decision is recorded as a span.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Tool calls in the format of OpenAI tool calling, or
+                None if the topic is ambiguous and the LLM should pick the tools.
+        """
+        scores = self.scores(research_topic, tools)
+        ranked = sorted(tools, key=lambda tool: -scores[tool.name])
+        picked = [tool for tool in ranked if scores[tool.name] >= self.min_score]
+        picked = picked[: self.max_tools] or [
+            tool for tool in tools if tool.name in self.default_tools
+        ]
+
+        if not picked or any(self._needs_arguments(tool) for tool in picked):
+            tool_calls = None
+            with self.lock:
+                self.counts["llm"] += 1
+        else:
+            tool_calls = [
+                {
+                    "function": {
+                        "name": tool.name,
+                        "arguments": json.dumps({"query": research_topic}),
+                    }
+                }
+                for tool in picked
+            ]
+            with self.lock:
+                self.counts["local"] += 1
+
+        if trace is not None:
+            span = trace.span(
+                name="ToolRouter",
+                input={"research_topic": research_topic, "scores": scores},
+            )
+            span.end(output={"tools": [tool.name for tool in picked], "local": bool(tool_calls)})
+        return tool_calls
+
+    def record(self, research_topic: str, tool_names: List[str]) -> None:
+        """
+        Records the tools the LLM picked for a research topic, so similar topics are routed
+        locally later.
+
+        Args:
+            research_topic (str): The research topic.
+            tool_names (List[str]): The names of the tools the LLM picked.
+        """
+        terms = self._terms(research_topic)
+        with self.lock:
+            for name in set(tool_names):
+                self.selections[name] += 1
+                for term in terms:
+                    self.learned[name][term] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of topics routed locally and by the LLM.
+        """
+        with self.lock:
+            return dict(self.counts)
+
+
+# The process-wide router used by the research tasks.
+tool_router = ToolRouter()
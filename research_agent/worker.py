@@ -0,0 +1,146 @@
+from .research_task import ResearchTask, TaskResult
+from .research_options import ResearchOptions
+from .db import ContentDB, JobQueue
+from .run_budget import RunBudget
+
+from eezo.interface.message import Message
+from langchain.tools import BaseTool
+from typing import List, Optional
+from langfuse import Langfuse
+from eezo import Eezo
+
+import traceback
+import logging
+import socket
+import time
+import uuid
+import os
+
+l = Langfuse()
+e = Eezo()
+
+
+class QueueContext:
+    """
+    Stands in for the Eezo context of the run that queued a task, so a worker process can post
+    progress messages to the same thread. Messages are dropped if the run had no Eezo context.
+
+    Attributes:
+        eezo_id (Optional[str]): The Eezo user identifier.
+        thread_id (Optional[str]): The thread identifier of the run.
+        agent_id (Optional[str]): The agent the messages are posted as.
+    """
+
+    def __init__(
+        self,
+        eezo_id: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+    ):
+        self.eezo_id = eezo_id
+        self.thread_id = thread_id
+        self.agent_id = agent_id
+
+    def new_message(self) -> Message:
+        """
+        Creates a new message in the thread of the run.
+
+        Returns:
+            Message: The new message.
+        """
+        if self.thread_id is None:
+            return Message(notify=lambda: None)
+        return e.new_message(
+            eezo_id=self.eezo_id, thread_id=self.thread_id, context=self.agent_id
+        )
+
+
+class ResearchWorker:
+    """
+    Consumes research tasks from a JobQueue and writes their results back. Start any number of
+    worker processes with `python worker.py` to scale out the execution of research tasks.
+
+    Attributes:
+        tools (List[BaseTool]): The tools available for the research tasks.
+        queue (JobQueue): The queue to consume.
+        worker_id (str): The ID of this worker.
+        poll_interval (float): Seconds to wait before polling an empty queue again.
+        db (ContentDB): Database for storing task content.
+    """
+
+    def __init__(
+        self,
+        tools: List[BaseTool],
+        queue: JobQueue,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 1.0,
+    ):
+        """
+        Initializes the ResearchWorker.
+
+        Args:
+            tools (List[BaseTool]): The tools available for the research tasks.
+            queue (JobQueue): The queue to consume.
+            worker_id (Optional[str]): The ID of this worker. Defaults to host, pid and a random suffix.
+            poll_interval (float): Seconds to wait before polling an empty queue again.
+        """
+        self.tools = tools
+        self.queue = queue
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.poll_interval = poll_interval
+        current_folder = os.path.dirname(os.path.abspath(__file__))
+        self.db: ContentDB = ContentDB(current_folder + "/db/content.db")
+
+    def run_once(self) -> bool:
+        """
+        Claims and executes a single job.
+
+        Returns:
+            bool: True if a job was executed, False if the queue was empty.
+        """
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+
+        payload = job["payload"]
+        logging.info(
+            f"Worker {self.worker_id} executing task {job['task_id']} of run {job['run_id']}"
+        )
+        try:
+            task = ResearchTask(
+                id=payload["id"],
+                research_topic=payload["research_topic"],
+                dependencies=payload["dependencies"],
+                trace=l.trace(id=payload["trace_id"]),
+                eezo_context=QueueContext(**(payload["eezo"] or {})),
+                budget=(
+                    RunBudget.from_dict(payload["budget"])
+                    if payload["budget"]
+                    else None
+                ),
+                options=ResearchOptions.from_dict(payload["options"]),
+            )
+            task.prefetched_content_ids = payload["prefetched_content_ids"]
+            state = {
+                dep: TaskResult(**result) for dep, result in payload["state"].items()
+            }
+            result = task.execute(self.db, state, self.tools)
+        except Exception:
+            logging.error(
+                f"Error executing task {job['task_id']}: {traceback.format_exc()}"
+            )
+            result = TaskResult(id=job["task_id"], error=f"{traceback.format_exc()}")
+
+        self.queue.complete(job["id"], result.to_dict())
+        return True
+
+    def run_forever(self) -> None:
+        """
+        Executes jobs until the process is stopped.
+        """
+        logging.info(f"Worker {self.worker_id} waiting for research tasks.")
+        while True:
+            if not self.run_once():
+                time.sleep(self.poll_interval)
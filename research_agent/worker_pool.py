@@ -0,0 +1,215 @@
+from contextlib import contextmanager
+from collections import defaultdict
+from utils.async_waiters import AsyncWaiters
+from typing import Dict, Optional, Any
+
+import concurrent.futures
+import threading
+import logging
+import time
+
+
+class PoolSaturatedError(Exception):
+    """
+    Raised when a research run is not admitted because the worker pool is saturated.
+    """
+
+
+class WorkerPool:
+    """
+    A long-lived worker pool shared by all research runs in the process.
+
+    Worker slots are handed out with fair-share scheduling: when a slot frees up, it goes to
+    the waiting run that currently holds the fewest slots, so a large outline cannot starve a
+    small one. New runs pass admission control first and are rejected when too many runs are
+    already active.
+
+    Attributes:
+        max_workers (int): Maximum number of tasks running at the same time across all runs.
+        max_active_runs (int): Maximum number of runs admitted at the same time.
+        in_flight (Dict[str, int]): Number of slots held per run.
+        active_runs (set): IDs of the admitted runs.
+    """
+
+    def __init__(self, max_workers: int = 32, max_active_runs: int = 8):
+        """
+        Initializes the WorkerPool.
+
+        Args:
+            max_workers (int): Maximum number of tasks running at the same time across all runs.
+            max_active_runs (int): Maximum number of runs admitted at the same time.
+        """
+        self.condition = threading.Condition()
+        self.max_workers = max_workers
+        self.max_active_runs = max_active_runs
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.active_runs = set()
+        # Coroutines waiting for a slot, keyed by run ID
+        self.waiters = AsyncWaiters()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        The thread pool running the tasks, created on first use.
+        """
+        with self.condition:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="research-worker"
+                )
+            return self._executor
+
+    def configure(
+        self, max_workers: Optional[int] = None, max_active_runs: Optional[int] = None
+    ) -> None:
+        """
+        Changes the size of the pool. Tasks that are already running are not interrupted.
+
+        Args:
+            max_workers (Optional[int]): New maximum number of running tasks.
+            max_active_runs (Optional[int]): New maximum number of admitted runs.
+        """
+        with self.condition:
+            if max_workers is not None and max_workers != self.max_workers:
+                if max_workers < 1:
+                    raise ValueError("max_workers must be >= 1.")
+                self.max_workers = max_workers
+                if self._executor is not None:
+                    # Running tasks finish on the old executor, new ones use the new size.
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+            if max_active_runs is not None:
+                if max_active_runs < 1:
+                    raise ValueError("max_active_runs must be >= 1.")
+                self.max_active_runs = max_active_runs
+            self._dispatch()
+            self.condition.notify_all()
+
+    def admit(self, run_id: str, timeout: Optional[float] = 0) -> None:
+        """
+        Admits a run to the pool.
+
+        Args:
+            run_id (str): The ID of the run.
+            timeout (Optional[float]): Seconds to wait for a free run slot. 0 fails immediately,
+                None waits forever.
+
+        Raises:
+            PoolSaturatedError: If the pool is still saturated after the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while len(self.active_runs) >= self.max_active_runs:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolSaturatedError(
+                        f"Worker pool is saturated: {len(self.active_runs)} active runs, "
+                        f"{len(self.waiters)} tasks waiting."
+                    )
+                self.condition.wait(remaining)
+            self.active_runs.add(run_id)
+        logging.info(f"Run {run_id} admitted to the worker pool.")
+
+    def leave(self, run_id: str) -> None:
+        """
+        Removes a run from the pool, freeing its run slot.
+
+        Args:
+            run_id (str): The ID of the run.
+        """
+        with self.condition:
+            self.active_runs.discard(run_id)
+            if self.in_flight.get(run_id) == 0:
+                del self.in_flight[run_id]
+            self.condition.notify_all()
+
+    @contextmanager
+    def admission(self, run_id: str, timeout: Optional[float] = 0):
+        """
+        Keeps a run admitted for the duration of the with block.
+
+        Args:
+            run_id (str): The ID of the run.
+            timeout (Optional[float]): Seconds to wait for a free run slot.
+        """
+        self.admit(run_id, timeout)
+        try:
+            yield
+        finally:
+            self.leave(run_id)
+
+    async def acquire(self, run_id: str) -> None:
+        """
+        Waits for a worker slot for the given run.
+
+        Args:
+            run_id (str): The ID of the run requesting the slot.
+        """
+        with self.condition:
+            waiter = self.waiters.enqueue(run_id)
+            self._dispatch()
+        await self.waiters.wait(waiter, self.condition, lambda: self.release(run_id))
+
+    def try_acquire(self, run_id: str) -> bool:
+        """
+        Takes a worker slot only if one is idle, i.e. no run is waiting for it.
+        Used for speculative work that must never delay real tasks.
+
+        Args:
+            run_id (str): The ID of the run requesting the slot.
+
+        Returns:
+            bool: True if a slot was acquired.
+        """
+        with self.condition:
+            if self.waiters or sum(self.in_flight.values()) >= self.max_workers:
+                return False
+            self.in_flight[run_id] += 1
+            return True
+
+    def release(self, run_id: str) -> None:
+        """
+        Gives a worker slot back to the pool.
+
+        Args:
+            run_id (str): The ID of the run releasing the slot.
+        """
+        with self.condition:
+            self.in_flight[run_id] -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        Hands free slots to waiting runs, fewest slots held first. Must be called with the lock held.
+        """
+        self.waiters.dispatch(
+            lambda run_id: sum(self.in_flight.values()) < self.max_workers,
+            self._take,
+            # The oldest waiter of the run holding the fewest slots.
+            choose=lambda waiters: min(waiters, key=lambda w: self.in_flight[w.key]),
+        )
+
+    def _take(self, run_id: str) -> None:
+        self.in_flight[run_id] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the current utilisation of the pool.
+
+        Returns:
+            Dict[str, Any]: Running and waiting tasks, active runs and limits.
+        """
+        with self.condition:
+            return {
+                "max_workers": self.max_workers,
+                "max_active_runs": self.max_active_runs,
+                "running": sum(self.in_flight.values()),
+                "waiting": len(self.waiters),
+                "active_runs": len(self.active_runs),
+                "running_per_run": {k: v for k, v in self.in_flight.items() if v},
+            }
+
+
+# The process-wide pool shared by all research runs.
+worker_pool = WorkerPool()
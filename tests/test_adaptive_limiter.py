@@ -0,0 +1,41 @@
+from utils.adaptive_limiter import AdaptiveLimiter
+
+import threading
+import asyncio
+
+
+def test_waiting_coroutines_hold_no_threads():
+    limiter = AdaptiveLimiter({"zyte": (2, 1, 2)})
+
+    async def call():
+        async with limiter.alimit("zyte"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        threads = threading.active_count()
+        calls = [asyncio.create_task(call()) for _ in range(100)]
+        await asyncio.sleep(0)
+        stats = limiter.stats()["zyte"]
+        assert (stats["in_use"], stats["waiting"]) == (2, 98)
+        assert threading.active_count() == threads
+        await asyncio.gather(*calls)
+
+    asyncio.run(main())
+    stats = limiter.stats()["zyte"]
+    assert (stats["in_use"], stats["waiting"], stats["calls"]) == (0, 0, 100)
+
+
+def test_overload_of_one_call_is_recorded_per_call():
+    limiter = AdaptiveLimiter({"zyte": (4, 1, 8)})
+
+    async def call(overloaded: bool):
+        async with limiter.alimit("zyte") as outcome:
+            outcome.overloaded = overloaded
+
+    async def main():
+        await asyncio.gather(*(call(i == 0) for i in range(4)))
+
+    asyncio.run(main())
+    stats = limiter.stats()["zyte"]
+    assert (stats["calls"], stats["overloads"]) == (4, 1)
+    assert stats["limit"] < 4
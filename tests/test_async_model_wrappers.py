@@ -0,0 +1,137 @@
+from utils.langfuse_json_model_wrapper import alangfuse_json_model_wrapper
+from utils.langfuse_model_wrapper import alangfuse_model_wrapper
+from utils.llm_dispatcher import LLMDispatcher
+from utils.client_registry import clients
+from types import SimpleNamespace
+from pydantic import BaseModel
+
+import threading
+import asyncio
+import time
+
+
+class FakeTrace:
+    """Records the generations and scores a wrapper writes to Langfuse."""
+
+    id = "trace"
+
+    def __init__(self):
+        self.scores = {}
+        self.ended = []
+
+    def generation(self, **kwargs):
+        return SimpleNamespace(end=lambda **end: self.ended.append(end))
+
+    def score(self, name, value, **kwargs):
+        self.scores[name] = value
+
+
+def completion(content, prompt_tokens=30, completion_tokens=10):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+class FakeAsyncCompletions:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        await asyncio.sleep(0.01)
+        return self.response
+
+    async def create_with_completion(self, **kwargs):
+        return await self.create(**kwargs)
+
+
+def fake_client(response):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeAsyncCompletions(response)))
+
+
+def test_text_wrapper_traces_usage_and_throughput(monkeypatch):
+    client = fake_client(completion("A summary."))
+    monkeypatch.setattr(clients, "async_groq", lambda: client)
+    trace = FakeTrace()
+
+    result = asyncio.run(
+        alangfuse_model_wrapper(
+            name="GenerateSectionSummary",
+            system_prompt="Summarize.",
+            user_prompt="Generate a summary of the section",
+            prompt=None,
+            model="llama3-70b-8192",
+            host="groq",
+            trace=trace,
+            data="Notes",
+            cache=False,
+        )
+    )
+
+    assert result == "A summary."
+    assert client.chat.completions.requests[0]["messages"][1]["content"].endswith("Notes")
+    (end,) = trace.ended
+    assert end["usage"] == {"input": 30, "output": 10, "total": 40, "unit": "TOKENS"}
+    assert {"ttps", "itps", "otps", "queue_time"} <= set(trace.scores)
+    assert trace.scores["ttps"] > 0
+
+
+def test_json_wrapper_returns_the_model_of_the_async_instructor_client(monkeypatch):
+    class Answer(BaseModel):
+        value: int
+
+    client = fake_client((Answer(value=42), completion("", 50, 5)))
+    monkeypatch.setattr(clients, "async_instructor", lambda: client)
+    trace = FakeTrace()
+
+    answer = asyncio.run(
+        alangfuse_json_model_wrapper(
+            name="SelectContent",
+            system_prompt="Pick.",
+            user_prompt="Which?",
+            prompt=None,
+            base_model=Answer,
+            model="gpt-4o-mini",
+            trace=trace,
+            cache=False,
+        )
+    )
+
+    assert answer == Answer(value=42)
+    assert client.chat.completions.requests[0]["response_model"] is Answer
+    assert trace.ended[0]["output"]["result"] == {"value": 42}
+    assert trace.scores["itps"] > trace.scores["otps"]
+
+
+def test_queued_async_calls_wait_without_threads():
+    dispatcher = LLMDispatcher({"openai": {"rpm": 60, "tpm": 1_000_000}})
+    # Empty the request bucket, the next request is allowed in one second.
+    dispatcher._buckets("openai:gpt-4o")[0].level = 0
+
+    async def send():
+        return "ok"
+
+    async def main():
+        threads = threading.active_count()
+        start = time.monotonic()
+        calls = [
+            asyncio.create_task(dispatcher.acall("openai", "gpt-4o", send, 100))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.1)
+        assert threading.active_count() == threads
+        assert not any(call.done() for call in calls)
+        results = await asyncio.gather(*calls)
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert [result for result, _ in results] == ["ok", "ok"]
+    # One request per second: the second call waits for the first and one more refill.
+    assert 1.5 < elapsed < 3
+    assert max(queue_time for _, queue_time in results) > 1.5
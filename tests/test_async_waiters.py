@@ -0,0 +1,65 @@
+from research_agent.worker_pool import WorkerPool
+from utils.async_waiters import AsyncWaiters, Waiter
+from utils.resource_limiter import ResourceLimiter
+
+import asyncio
+
+
+def waiter_of_closed_loop(key):
+    loop = asyncio.new_event_loop()
+    waiter = Waiter(loop, loop.create_future(), key)
+    loop.close()
+    return waiter
+
+
+def test_grant_to_a_closed_loop_takes_no_slot():
+    taken = []
+    waiters = AsyncWaiters()
+    waiters.waiters.append(waiter_of_closed_loop("llm"))
+
+    waiters.dispatch(lambda key: True, taken.append)
+
+    assert taken == []
+    assert len(waiters) == 0
+
+
+def test_release_skips_waiters_of_closed_loops():
+    limiter = ResourceLimiter({"llm": 1})
+    limiter.acquire("llm")
+    limiter.waiters.waiters.append(waiter_of_closed_loop("llm"))
+
+    limiter.release("llm")
+
+    assert limiter.stats()["llm"] == {"limit": 1, "in_use": 0, "waiting": 0}
+
+
+def test_worker_pool_release_does_not_leak_the_slot_of_a_closed_loop():
+    pool = WorkerPool(max_workers=1)
+    assert pool.try_acquire("a")
+    pool.waiters.waiters.append(waiter_of_closed_loop("b"))
+
+    pool.release("a")
+
+    assert pool.stats()["running"] == 0
+    assert pool.stats()["waiting"] == 0
+
+
+def test_worker_pool_grants_the_run_holding_the_fewest_slots():
+    pool = WorkerPool(max_workers=2)
+    order = []
+
+    async def task(run_id):
+        await pool.acquire(run_id)
+        order.append(run_id)
+        pool.release(run_id)
+
+    async def main():
+        assert pool.try_acquire("big") and pool.try_acquire("big")
+        tasks = [asyncio.create_task(task(run_id)) for run_id in ("big", "big", "small")]
+        await asyncio.sleep(0)
+        pool.release("big")
+        pool.release("big")
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order[0] == "small"
@@ -0,0 +1,24 @@
+from research_agent.db.checkpoint_db import CheckpointDB
+
+
+def test_runs_and_task_results_survive_a_new_connection(tmp_path):
+    path = str(tmp_path / "db" / "checkpoints.db")
+    db = CheckpointDB(path)
+    db.save_run("run", "query", "outline", '{"1": []}')
+    db.set_run_status("run", "completed")
+    db.save_task_result("run", "1", {"id": "1", "error": "Timed out."})
+    db.save_task_result("run", "1", {"id": "1", "error": ""})
+    db.save_task_result("other", "1", {"id": "1", "error": "Other run."})
+
+    reopened = CheckpointDB(path)
+
+    assert reopened.get_run("run") == {
+        "run_id": "run",
+        "query": "query",
+        "outline": "outline",
+        "dag": '{"1": []}',
+        "status": "completed",
+    }
+    assert reopened.get_run("missing") is None
+    # A task saved again replaces its earlier result.
+    assert reopened.get_task_results("run") == {"1": {"id": "1", "error": ""}}
@@ -0,0 +1,50 @@
+from utils.client_registry import ClientRegistry, AdaptiveHTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+
+
+def test_threads_share_one_client_and_connection_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "key")
+    registry = ClientRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        openai = set(executor.map(lambda _: registry.openai(), range(32)))
+        instructor = set(executor.map(lambda _: registry.instructor(), range(32)))
+
+    assert len(openai) == 1 and len(instructor) == 1
+    assert registry.http_clients.keys() == {"openai"}
+    assert registry.chat_openai("gpt-4o") is registry.chat_openai("gpt-4o")
+    assert registry.stats()["http"] == {
+        "openai": {"max_connections": 64, "open": 0, "active": 0, "idle": 0}
+    }
+
+
+def test_sessions_get_the_default_timeout_and_the_adaptive_limit():
+    registry = ClientRegistry(session_timeout=5)
+    session = registry.session("youcom")
+
+    adapter = session.get_adapter("https://api.ydc-index.io")
+    assert session is registry.session("youcom")
+    assert isinstance(adapter, AdaptiveHTTPAdapter)
+    assert (adapter.provider, adapter.timeout) == ("youcom", 5)
+    assert registry.stats()["sessions"]["youcom"]["connections"] == 0
+
+
+def test_async_clients_are_kept_per_event_loop_and_closed_with_it(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "key")
+    registry = ClientRegistry()
+
+    async def run():
+        client = registry.async_groq()
+        assert registry.async_groq() is client
+        http_client = registry.async_http_client("groq")
+        await registry.aclose()
+        return client, http_client
+
+    first, http_client = asyncio.run(run())
+    second, _ = asyncio.run(run())
+
+    assert first is not second
+    assert http_client.is_closed
+    assert len(registry.async_clients) == 0
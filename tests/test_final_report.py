@@ -0,0 +1,103 @@
+import pytest
+
+try:
+    from research_agent.research_agent import ResearchAgent, model_router
+    from research_agent.research_task import TaskResult
+    from research_agent.research_options import ResearchOptions
+except Exception as error:
+    # Importing the agent signs in to Eezo, which needs EEZO_API_KEY.
+    pytest.skip(f"research_agent can't be imported: {error}", allow_module_level=True)
+
+import threading
+import asyncio
+import re
+
+
+def test_unstreamed_report_summarizes_sections_as_coroutines(monkeypatch):
+    agent = object.__new__(ResearchAgent)
+    agent.options = ResearchOptions(summary_concurrency=2)
+    running = 0
+    peak = 0
+    loops = set()
+
+    async def acall_text(name, data, **kwargs):
+        nonlocal running, peak
+        loops.add((asyncio.get_running_loop(), threading.current_thread().name))
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        note = re.search(r"n\d\d", data).group()
+        return f"Summary of {note}"
+
+    def call_text(**kwargs):
+        raise AssertionError("an unstreamed report must not use the sync wrapper")
+
+    monkeypatch.setattr(model_router, "acall_text", acall_text)
+    monkeypatch.setattr(model_router, "call_text", call_text)
+    results = [
+        TaskResult(
+            id=str(i), research_topic=f"Topic {i}", result=f"n{i:02d}", content_used=["c"], error=""
+        )
+        for i in range(5)
+    ]
+    results.append(TaskResult(id="5", research_topic="Empty", error=""))
+
+    ordered, report = agent._generate_final_report(
+        iter(results), trace=None, order=["5", "4", "3", "2", "1", "0"]
+    )
+
+    assert [result.id for result in ordered] == ["5", "4", "3", "2", "1", "0"]
+    assert report.startswith("5 Empty\nNo content found.")
+    assert "**0 Topic 0**\nSummary of n00" in report
+    assert peak == 2
+    # All summaries ran on the same event loop thread.
+    assert len(loops) == 1
+
+
+def test_sections_are_summarized_while_results_still_arrive(monkeypatch):
+    agent = object.__new__(ResearchAgent)
+    agent.options = ResearchOptions(summary_concurrency=4)
+    first_started = threading.Event()
+
+    async def acall_text(name, data, **kwargs):
+        first_started.set()
+        return "Summary"
+
+    def results():
+        yield TaskResult(id="1", research_topic="First", result="n", content_used=["c"], error="")
+        # The next task is still running when the first section is summarized.
+        assert first_started.wait(2)
+        yield TaskResult(id="2", research_topic="Second", result="n", content_used=["c"], error="")
+
+    monkeypatch.setattr(model_router, "acall_text", acall_text)
+
+    _, report = agent._generate_final_report(results(), trace=None)
+
+    assert report == "**1 First**\nSummary\n\n**2 Second**\nSummary\n\n"
+
+
+def test_sections_that_are_not_summarized(monkeypatch):
+    from research_agent.run_budget import RunBudget
+
+    agent = object.__new__(ResearchAgent)
+    agent.options = ResearchOptions(summary_concurrency=2)
+
+    async def acall_text(name, data, **kwargs):
+        raise RuntimeError("Groq is down.")
+
+    monkeypatch.setattr(model_router, "acall_text", acall_text)
+    results = [
+        TaskResult(id="1", research_topic="Failed", error="Search failed."),
+        TaskResult(id="2", research_topic="Notes", result="Notes 2", content_used=["c"], error=""),
+    ]
+
+    _, report = agent._generate_final_report(iter(results), trace=None)
+    # A failed task without cuts is left out, a failed summary falls back to the notes.
+    assert report == "**2 Notes**\nNotes 2\n\n"
+
+    budget = RunBudget(10)
+    budget.deadline -= 10
+    _, report = agent._generate_final_report(iter(results), trace=None, budget=budget)
+    assert report.startswith("**2 Notes**\nNotes 2")
+    assert "time budget was used up" in report
@@ -0,0 +1,112 @@
+from utils import langfuse_model_wrapper as wrapper
+from utils.hedging import Hedger, hedger
+from types import SimpleNamespace
+
+import threading
+import time
+
+
+def generation():
+    return SimpleNamespace(end=lambda **kwargs: None)
+
+
+def test_hedged_calls_share_the_bounded_hedge_threads(monkeypatch):
+    def send_completion(host, model, temperature, messages, stream_to, priority, cancel):
+        if host == "openai":
+            # The slow primary returns as soon as it loses.
+            cancel.wait(1)
+        return f"{host} answer", None, None, 0.0
+
+    monkeypatch.setattr(wrapper, "send_completion", send_completion)
+    monkeypatch.setattr(
+        wrapper, "start_generation", lambda *args, **kwargs: (None, None, None, generation())
+    )
+    monkeypatch.setattr(hedger, "threshold", lambda host, model: 0.01)
+    monkeypatch.setattr(hedger, "record", lambda *args: None)
+    trace = SimpleNamespace(score=lambda **kwargs: None)
+
+    for _ in range(40):
+        result, *_ = wrapper.hedged_completion(
+            "GenerateSectionSummary",
+            "Summarize.",
+            "Notes",
+            None,
+            ("openai", "gpt-4o"),
+            ("groq", "llama3-70b-8192"),
+            0,
+            [],
+            trace,
+            None,
+            generation(),
+            None,
+            "normal",
+        )
+        assert result == "groq answer"
+
+    hedge_threads = [t for t in threading.enumerate() if t.name.startswith("hedge")]
+    assert 0 < len(hedge_threads) <= wrapper.hedge_executor._max_workers
+
+
+def test_a_primary_answering_within_the_threshold_is_not_hedged(monkeypatch):
+    sent = []
+
+    def send_completion(host, model, temperature, messages, stream_to, priority, cancel):
+        sent.append(host)
+        return f"{host} answer", None, None, 0.0
+
+    monkeypatch.setattr(wrapper, "send_completion", send_completion)
+    monkeypatch.setattr(hedger, "threshold", lambda host, model: 1.0)
+
+    result, *_ = wrapper.hedged_completion(
+        "GenerateSectionSummary",
+        "Summarize.",
+        "Notes",
+        None,
+        ("openai", "gpt-4o"),
+        ("groq", "llama3-70b-8192"),
+        0,
+        [],
+        None,
+        None,
+        generation(),
+        None,
+        "normal",
+    )
+
+    assert result == "openai answer"
+    assert sent == ["openai"]
+
+
+def test_threshold_is_the_default_until_enough_durations_are_recorded():
+    hedger = Hedger(quantile=0.9, min_samples=10, default_threshold=10.0)
+    for duration in range(1, 10):
+        hedger.record("openai", "gpt-4o", duration)
+
+    assert hedger.threshold("openai", "gpt-4o") == 10.0
+
+    hedger.record("openai", "gpt-4o", 10)
+    # The 90% quantile of 1 to 10 seconds.
+    assert hedger.threshold("openai", "gpt-4o") == 10
+    for _ in range(90):
+        hedger.record("openai", "gpt-4o", 1)
+    assert hedger.threshold("openai", "gpt-4o") == 1
+
+
+def test_threshold_follows_the_recent_window_only():
+    hedger = Hedger(window=20, min_samples=5)
+    for _ in range(20):
+        hedger.record("groq", "mixtral-8x7b-32768", 30)
+    for _ in range(20):
+        hedger.record("groq", "mixtral-8x7b-32768", 2)
+
+    assert hedger.threshold("groq", "mixtral-8x7b-32768") == 2
+
+
+def test_only_enabled_routes_to_another_model_are_hedged():
+    hedger = Hedger(routes={"SelectContent": ("openai", "gpt-4o-mini")})
+
+    assert hedger.secondary("SelectContent", "openai", "gpt-4o") is None
+    hedger.configure(enabled=True)
+    assert hedger.secondary("SelectContent", "openai", "gpt-4o") == ("openai", "gpt-4o-mini")
+    assert hedger.secondary("SelectContent", "openai", "gpt-4o-mini") is None
+    assert hedger.secondary("Unrouted", "openai", "gpt-4o") is None
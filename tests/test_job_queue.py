@@ -0,0 +1,63 @@
+from research_agent.db.job_queue import JobQueue
+
+import pytest
+import time
+
+
+@pytest.fixture
+def queues(tmp_path):
+    """Two connections to one queue file, like a scheduler and a worker process."""
+    path = str(tmp_path / "jobs.db")
+    return JobQueue(path, lease_seconds=0.05), JobQueue(path, lease_seconds=0.05)
+
+
+def test_a_job_is_claimed_once_and_its_result_read_back(queues):
+    scheduler, worker = queues
+    job_id = scheduler.put("run", "1", {"research_topic": "Topic"})
+
+    job = worker.claim("worker-1")
+
+    assert job == {
+        "id": job_id,
+        "run_id": "run",
+        "task_id": "1",
+        "payload": {"research_topic": "Topic"},
+    }
+    assert worker.claim("worker-2") is None
+    assert scheduler.get_result(job_id) == {"status": "running", "result": None}
+    worker.complete(job_id, {"id": "1", "error": ""})
+    assert scheduler.get_result(job_id) == {"status": "done", "result": {"id": "1", "error": ""}}
+
+
+def test_the_job_of_a_dead_worker_is_claimed_again_after_its_lease(queues):
+    scheduler, worker = queues
+    job_id = scheduler.put("run", "1", {})
+    worker.claim("worker-1")
+
+    time.sleep(0.1)
+
+    assert worker.claim("worker-2")["id"] == job_id
+
+
+def test_a_job_fails_once_its_lease_expired_max_attempts_times(queues):
+    scheduler, worker = queues
+    job_id = scheduler.put("run", "1", {})
+    for attempt in range(2):
+        assert worker.claim(f"worker-{attempt}")["id"] == job_id
+        time.sleep(0.1)
+
+    assert worker.claim("worker-3") is None
+    job = scheduler.get_result(job_id)
+    assert job["status"] == "failed"
+    assert "lease expired" in job["result"]["error"]
+
+
+def test_a_cancelled_job_keeps_its_status_when_the_worker_finishes(queues):
+    scheduler, worker = queues
+    job_id = scheduler.put("run", "1", {})
+    worker.claim("worker-1")
+
+    scheduler.cancel(job_id)
+    worker.complete(job_id, {"id": "1", "error": ""})
+
+    assert scheduler.get_result(job_id)["status"] == "cancelled"
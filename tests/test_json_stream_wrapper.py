@@ -0,0 +1,80 @@
+from utils.langfuse_json_stream_wrapper import langfuse_json_stream_wrapper
+from utils.adaptive_limiter import adaptive_limiter
+from utils.resource_limiter import limiter
+from utils.client_registry import clients
+from types import SimpleNamespace
+from pydantic import BaseModel
+
+import time
+
+
+class Item(BaseModel):
+    text: str
+
+
+class StreamingClient:
+    def __init__(self, count, delay=0.01):
+        self.count = count
+        self.delay = delay
+        self.streamed = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create_iterable(self, **kwargs):
+        for i in range(self.count):
+            time.sleep(self.delay)
+            self.streamed += 1
+            yield Item(text=str(i))
+
+
+class Trace:
+    id = "trace"
+
+    def __init__(self):
+        self.outputs = []
+
+    def generation(self, **kwargs):
+        return SimpleNamespace(end=lambda output: self.outputs.append(output))
+
+    def score(self, **kwargs):
+        pass
+
+
+def stream(client, monkeypatch, trace):
+    monkeypatch.setattr(clients, "instructor", lambda: client)
+    return langfuse_json_stream_wrapper(
+        name="ConvertOutlineToDAG",
+        system_prompt="Convert.",
+        user_prompt="Outline",
+        prompt=None,
+        base_model=Item,
+        trace=trace,
+    )
+
+
+def test_slots_are_free_while_the_caller_works_on_the_items(monkeypatch):
+    trace = Trace()
+    in_use = []
+
+    for item in stream(StreamingClient(3), monkeypatch, trace):
+        # The caller is slow, the provider finishes streaming in the meantime.
+        time.sleep(0.1)
+        in_use.append(
+            (limiter.stats()["llm"]["in_use"], adaptive_limiter.stats()["openai"]["in_use"])
+        )
+
+    assert in_use[-1] == (0, 0)
+    (output,) = trace.outputs
+    assert [item["text"] for item in output["result"]] == ["0", "1", "2"]
+    # The provider took about 0.03 s, the 0.3 s the caller spent are not counted.
+    assert output["duration"] < 0.2
+
+
+def test_stream_stops_reading_when_the_caller_stops(monkeypatch):
+    client = StreamingClient(100, delay=0.005)
+
+    for item in stream(client, monkeypatch, Trace()):
+        break
+    time.sleep(0.1)
+
+    assert client.streamed < 100
+    assert limiter.stats()["llm"]["in_use"] == 0
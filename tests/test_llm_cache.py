@@ -0,0 +1,70 @@
+from utils.llm_cache import LLMCache
+from unittest import mock
+
+import unittest
+import tempfile
+import os
+
+
+class LLMCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("utils.llm_cache.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = LLMCache(max_entries=2, ttl_seconds=60)
+
+    def test_key_depends_on_every_input_of_the_call(self):
+        messages = [{"role": "user", "content": "Hi"}]
+        key = LLMCache.make_key("openai", "gpt-4o", messages, 0)
+
+        self.assertEqual(key, LLMCache.make_key("openai", "gpt-4o", list(messages), 0))
+        self.assertNotEqual(key, LLMCache.make_key("groq", "gpt-4o", messages, 0))
+        self.assertNotEqual(key, LLMCache.make_key("openai", "gpt-4o", messages, 0.7))
+        self.assertNotEqual(
+            key, LLMCache.make_key("openai", "gpt-4o", messages, 0, schema={"type": "object"})
+        )
+
+    def test_entries_expire_after_the_ttl(self):
+        self.cache.set("a", {"result": "A"})
+        self.now += 59
+        self.assertEqual(self.cache.get("a"), {"result": "A"})
+
+        self.now += 2
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_the_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", "A")
+        self.now += 1
+        self.cache.set("b", "B")
+        self.now += 1
+        # Reading a makes b the least recently used entry.
+        self.cache.get("a")
+        self.now += 1
+        self.cache.set("c", "C")
+
+        self.assertEqual(self.cache.get("a"), "A")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), "C")
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_hit_rate_and_disabled_cache(self):
+        self.cache.set("a", "A")
+        self.cache.get("a")
+        self.cache.get("missing")
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.5)
+
+        self.cache.configure(enabled=False)
+        self.cache.set("b", "B")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_responses_persist_across_processes(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "llm_cache.db")
+        LLMCache(path).set("a", {"result": "A"})
+
+        reopened = LLMCache(path)
+
+        self.assertEqual(reopened.get("a"), {"result": "A"})
+        self.assertEqual(reopened.stats()["entries"], 1)
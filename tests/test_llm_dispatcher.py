@@ -0,0 +1,96 @@
+from utils.llm_dispatcher import LLMDispatcher
+from utils.resource_limiter import limiter
+
+import threading
+import openai
+import pytest
+import httpx
+import time
+
+
+def rate_limit_error(retry_after):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_high_priority_calls_are_served_first():
+    # One request every 0.1 s.
+    dispatcher = LLMDispatcher({"openai": {"rpm": 600, "tpm": 1_000_000}})
+    dispatcher._buckets("openai:gpt-4o")[0].level = 0
+    served = []
+
+    def call(priority):
+        dispatcher.call("openai", "gpt-4o", lambda: served.append(priority), 10, priority)
+
+    threads = [threading.Thread(target=call, args=(priority,)) for priority in ["low"] * 3]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=call, args=("high",)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join()
+
+    assert served[0] == "high"
+    assert dispatcher.stats()["openai:gpt-4o"]["calls"] == 4
+
+
+def test_rate_limited_calls_pause_the_model_and_are_retried():
+    dispatcher = LLMDispatcher(max_backoff=0.01)
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limit_error("0.3")
+        return "ok"
+
+    result, queue_time = dispatcher.call("openai", "gpt-4o", send, 10)
+
+    assert result == "ok"
+    # The retry waited for the retry-after of the provider in the queue.
+    assert attempts[1] - attempts[0] >= 0.25
+    assert queue_time >= 0.25
+    stats = dispatcher.stats()["openai:gpt-4o"]
+    assert (stats["retries"], stats["rate_limited"]) == (1, 1)
+
+
+def test_other_errors_are_not_retried():
+    dispatcher = LLMDispatcher()
+    attempts = []
+
+    def send():
+        attempts.append(1)
+        raise ValueError("Invalid response")
+
+    with pytest.raises(ValueError):
+        dispatcher.call("openai", "gpt-4o", send, 10)
+    assert len(attempts) == 1
+
+
+def test_settle_takes_the_tokens_used_beyond_the_estimate():
+    dispatcher = LLMDispatcher({"groq": {"rpm": 100, "tpm": 10_000}})
+    dispatcher.call("groq", "llama3-70b-8192", lambda: "ok", 1000)
+
+    dispatcher.settle("groq", "llama3-70b-8192", 1000, 4000)
+
+    # 10000 - 1000 estimated - 3000 more used, plus what refilled in the meantime.
+    assert 6000 <= dispatcher.stats()["groq:llama3-70b-8192"]["tokens_available"] < 6100
+
+
+def test_queue_time_includes_the_wait_for_a_concurrency_slot():
+    dispatcher = LLMDispatcher({"openai": {"rpm": 10_000, "tpm": 10_000_000}})
+    slots = limiter.limits["llm"]
+    for _ in range(slots):
+        limiter.acquire("llm")
+    # All llm slots are taken by other calls, which finish after 0.2 s.
+    threading.Timer(0.2, lambda: [limiter.release("llm") for _ in range(slots)]).start()
+
+    result, queue_time = dispatcher.call("openai", "gpt-4o", lambda: "ok", 100)
+
+    assert result == "ok"
+    assert queue_time >= 0.15
+    stats = dispatcher.stats()["openai:gpt-4o"]
+    assert stats["slot_wait_avg"] >= 0.15
+    assert stats["queue_time_avg"] >= stats["slot_wait_avg"]
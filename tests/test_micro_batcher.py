@@ -0,0 +1,109 @@
+from utils.micro_batcher import MicroBatcher
+from openai.types import CompletionUsage
+from pydantic import BaseModel
+
+import threading
+import time
+
+
+class Answer(BaseModel):
+    value: int
+
+
+class Stopped(BaseException):
+    """Stands in for HedgeCancelled or KeyboardInterrupt in the leader of a batch."""
+
+
+def submit_all(batcher, send, count):
+    """Submits count calls from concurrent threads and returns their results or errors."""
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = batcher.submit(
+                "SelectContent",
+                "gpt-4o-mini",
+                "Pick.",
+                "Which?",
+                f"data {i}",
+                Answer,
+                [{"role": "user", "content": f"data {i}"}],
+                send,
+            )
+        except BaseException as error:
+            results[i] = error
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    return results
+
+
+def batch_send(answer=lambda count: [{"value": i} for i in range(count)]):
+    """Answers batches with answer(count) items and single calls with their own value."""
+    sent = []
+
+    def send(messages, base_model):
+        if base_model is Answer:
+            sent.append("single")
+            value = int(messages[0]["content"].split()[-1])
+            return Answer(value=value), None, 0.0
+        count = messages[1]["content"].count("<request id=")
+        sent.append(count)
+        usage = CompletionUsage(prompt_tokens=300, completion_tokens=30, total_tokens=330)
+        return base_model(items=answer(count)), usage, 0.1
+
+    return send, sent
+
+
+def test_concurrent_calls_are_sent_as_one_batch():
+    send, sent = batch_send()
+
+    results = submit_all(MicroBatcher(enabled=True, window=0.2), send, 3)
+
+    assert sent == [3]
+    assert sorted(obj.value for obj, *_ in results) == [0, 1, 2]
+    for obj, usage, queue_time, batch_size in results:
+        assert (usage.total_tokens, queue_time, batch_size) == (110, 0.1, 3)
+
+
+def test_a_full_batch_is_sent_without_waiting_for_the_window():
+    send, sent = batch_send()
+    start = time.monotonic()
+
+    submit_all(MicroBatcher(enabled=True, window=5, max_batch_size=2), send, 2)
+
+    assert sent == [2]
+    assert time.monotonic() - start < 1
+
+
+def test_a_batch_with_the_wrong_number_of_items_falls_back_to_single_calls():
+    send, sent = batch_send(answer=lambda count: [{"value": 0}])
+    batcher = MicroBatcher(enabled=True, window=0.2)
+
+    results = submit_all(batcher, send, 3)
+
+    assert sent == [3, "single", "single", "single"]
+    assert sorted(obj.value for obj, *_ in results) == [0, 1, 2]
+    assert all(batch_size == 1 for *_, batch_size in results)
+    assert batcher.stats() == {"calls": 3, "batches": 0, "fallbacks": 1}
+
+
+def test_followers_send_their_calls_when_the_leader_is_stopped():
+    batcher = MicroBatcher(enabled=True, window=0.1)
+    sent = []
+
+    def send(messages, base_model):
+        if base_model is not Answer:
+            raise Stopped()
+        sent.append(messages[0]["content"])
+        return Answer(value=len(sent)), None, 0.0
+
+    results = submit_all(batcher, send, 3)
+
+    assert sum(isinstance(result, Stopped) for result in results) == 1
+    assert sum(isinstance(result, tuple) for result in results) == 2
+    assert len(sent) == 2
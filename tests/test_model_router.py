@@ -0,0 +1,122 @@
+from utils import model_router as router_module
+from utils.model_router import ModelRouter
+from pydantic import BaseModel, ValidationError
+
+import asyncio
+import pytest
+
+CASCADE = [("openai", "gpt-4o-mini"), ("openai", "gpt-4o")]
+
+
+class Selection(BaseModel):
+    snippet_indeces: list[int]
+
+
+def validation_error() -> ValidationError:
+    try:
+        Selection.model_validate({})
+    except ValidationError as error:
+        return error
+
+
+class TestCallJson:
+    @pytest.fixture(autouse=True)
+    def wrapper(self, monkeypatch):
+        """Answers every call with the response queued for its model."""
+        self.responses = {}
+        self.called = []
+
+        def langfuse_json_model_wrapper(model, max_retries, **kwargs):
+            self.called.append((model, max_retries))
+            response = self.responses[model]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        monkeypatch.setattr(
+            router_module, "langfuse_json_model_wrapper", langfuse_json_model_wrapper
+        )
+
+    def call(self, router, accept=None):
+        return router.call_json(
+            name="SelectContent",
+            system_prompt="Pick.",
+            user_prompt="Which?",
+            prompt=None,
+            base_model=Selection,
+            accept=accept,
+        )
+
+    def test_the_first_model_answers_with_one_attempt(self):
+        self.responses["gpt-4o-mini"] = Selection(snippet_indeces=[1])
+
+        assert self.call(ModelRouter({"SelectContent": CASCADE})).snippet_indeces == [1]
+        assert self.called == [("gpt-4o-mini", 1)]
+
+    def test_a_response_failing_validation_escalates(self):
+        router = ModelRouter({"SelectContent": CASCADE})
+        self.responses["gpt-4o-mini"] = validation_error()
+        self.responses["gpt-4o"] = Selection(snippet_indeces=[2])
+
+        assert self.call(router).snippet_indeces == [2]
+        # The last model gets the retries the cheaper ones don't.
+        assert self.called == [("gpt-4o-mini", 1), ("gpt-4o", 3)]
+        assert router.stats()["SelectContent"]["escalations"] == 1
+
+    def test_a_response_rejected_by_accept_escalates(self):
+        self.responses["gpt-4o-mini"] = Selection(snippet_indeces=[])
+        self.responses["gpt-4o"] = Selection(snippet_indeces=[])
+
+        result = self.call(
+            ModelRouter({"SelectContent": CASCADE}), accept=lambda r: bool(r.snippet_indeces)
+        )
+
+        # The last model is accepted whatever it answers.
+        assert result.snippet_indeces == []
+        assert [model for model, _ in self.called] == ["gpt-4o-mini", "gpt-4o"]
+
+    def test_the_error_of_the_last_model_is_raised(self):
+        self.responses["gpt-4o-mini"] = validation_error()
+        self.responses["gpt-4o"] = validation_error()
+
+        with pytest.raises(ValidationError):
+            self.call(ModelRouter({"SelectContent": CASCADE}))
+
+    def test_a_failing_model_is_skipped_except_for_probes(self):
+        router = ModelRouter(
+            {"SelectContent": CASCADE}, min_samples=4, probe_interval=5
+        )
+        self.responses["gpt-4o-mini"] = validation_error()
+        self.responses["gpt-4o"] = Selection(snippet_indeces=[0])
+
+        for _ in range(10):
+            self.call(router)
+
+        first_tiers = [model for model, retries in self.called if retries == 1]
+        # Calls 0 to 3 judge the model, call 5 is a probe, the others skip it.
+        assert len(first_tiers) == 5
+        assert router.stats()["SelectContent"]["gpt-4o-mini"]["success_rate"] == 0
+
+
+def test_acall_text_escalates_with_the_async_wrapper(monkeypatch):
+    async def alangfuse_model_wrapper(model, host, **kwargs):
+        await asyncio.sleep(0)
+        return f"{host}:{model}"
+
+    monkeypatch.setattr(router_module, "alangfuse_model_wrapper", alangfuse_model_wrapper)
+    router = ModelRouter(
+        {"GenerateSectionSummary": [("groq", "llama3-8b-8192"), ("groq", "llama3-70b-8192")]}
+    )
+
+    result = asyncio.run(
+        router.acall_text(
+            name="GenerateSectionSummary",
+            system_prompt="Summarize.",
+            user_prompt="Notes",
+            prompt=None,
+            accept=lambda text: "70b" in text,
+        )
+    )
+
+    assert result == "groq:llama3-70b-8192"
+    assert router.stats()["GenerateSectionSummary"]["escalations"] == 1
@@ -0,0 +1,37 @@
+import pytest
+
+try:
+    from research_agent.research_agent import ResearchOutline
+except Exception as error:
+    # Importing the agent signs in to Eezo, which needs EEZO_API_KEY.
+    pytest.skip(f"research_agent can't be imported: {error}", allow_module_level=True)
+
+OUTLINE = """# Research outline
+
+1. **What is the market size?**
+1.1 How fast is it growing?
+1.2 Which regions lead?
+2. **Who are the main competitors?**
+2.1 What are their market shares?
+"""
+
+
+def test_numbered_outline_is_parsed_locally():
+    outline = ResearchOutline.from_numbered_outline(OUTLINE)
+
+    assert [question.id for question in outline.questions] == ["1", "1.1", "1.2", "2", "2.1"]
+    assert outline.questions[0].text == "What is the market size?"
+    assert outline.questions[4].dependencies == ["2"]
+
+
+@pytest.mark.parametrize("line", ["3) Who regulates it?", "3: Who regulates it?", "**3. Who?**"])
+def test_numbered_lines_in_another_format_fall_back_to_the_llm(line):
+    with pytest.raises(ValueError, match="4 of 5 numbered lines"):
+        ResearchOutline.from_numbered_outline(
+            OUTLINE.replace("2.1 What are their market shares?", line)
+        )
+
+
+def test_outline_without_numbers_falls_back_to_the_llm():
+    with pytest.raises(ValueError):
+        ResearchOutline.from_numbered_outline("- What is the market size?\n- Who competes?")
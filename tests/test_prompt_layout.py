@@ -0,0 +1,83 @@
+from utils.langfuse_generation import start_generation, end_generation
+from prompts import prompt as prompt_module
+from prompts.prompt import Prompt
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def select_content(monkeypatch):
+    def get_prompt(prompt_id):
+        raise ConnectionError("Langfuse is offline")
+
+    # Loads the prompt from prompt_files, as without Langfuse.
+    monkeypatch.setattr(prompt_module.l, "get_prompt", get_prompt)
+    return Prompt("research-agent-select-content")
+
+
+def test_the_system_prompt_is_the_same_for_every_call(select_content):
+    first, first_data = select_content.assemble(
+        research_topic="Battery prices", formatted_snippets="[0] Prices fall."
+    )
+    second, second_data = select_content.assemble(
+        research_topic="Solar panels", formatted_snippets="[0] Panels get cheaper."
+    )
+
+    assert first == second
+    assert "{{" not in first
+    assert "<formatted_snippets> (given in the user message)" in first
+    assert first_data == (
+        "<research_topic>\nBattery prices\n</research_topic>\n\n"
+        "<formatted_snippets>\n[0] Prices fall.\n</formatted_snippets>"
+    )
+    assert first_data != second_data
+
+
+def test_static_variables_stay_in_the_system_prompt(select_content):
+    system_prompt, data = select_content.assemble(
+        static={"research_topic": "Battery prices"}, formatted_snippets="[0] Prices fall."
+    )
+
+    assert "Battery prices" in system_prompt
+    assert data == "<formatted_snippets>\n[0] Prices fall.\n</formatted_snippets>"
+
+
+class Trace:
+    id = "trace"
+
+    def __init__(self):
+        self.scores = {}
+        self.generations = []
+
+    def generation(self, **kwargs):
+        self.generations.append(kwargs)
+        return SimpleNamespace(end=lambda **kwargs: None)
+
+    def score(self, name, value, **kwargs):
+        self.scores[name] = value
+
+
+def test_the_data_block_is_sent_after_the_user_prompt():
+    _, _, messages, _ = start_generation(
+        "SelectContent", "Pick.", "Which?", None, "gpt-4o", {}, trace=Trace(), data="<d>x</d>"
+    )
+
+    assert messages == [
+        {"role": "system", "content": "Pick."},
+        {"role": "user", "content": "Which?\n\n<d>x</d>"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "details", [{"cached_tokens": 1024}, SimpleNamespace(cached_tokens=1024)]
+)
+def test_cached_prompt_tokens_are_scored(details):
+    trace = Trace()
+    usage = SimpleNamespace(
+        prompt_tokens=2000, completion_tokens=100, total_tokens=2100, prompt_tokens_details=details
+    )
+
+    end_generation(trace, SimpleNamespace(end=lambda **kwargs: None), "trace", "ok", usage, 1.0)
+
+    assert trace.scores["cached_tokens"] == 1024
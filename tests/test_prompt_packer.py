@@ -0,0 +1,71 @@
+from utils.model_router import ModelRouter
+from utils.prompt_packer import PromptPacker, prompt_packer
+
+import pytest
+
+
+@pytest.fixture
+def packer():
+    packer = PromptPacker({"small": 100}, min_part_tokens=10)
+    # Without a tokenizer four characters count as one token, which keeps the sizes exact.
+    packer.encodings["small"] = None
+    return packer
+
+
+def part(tokens):
+    return "abcd" * tokens
+
+
+def test_parts_within_the_budget_are_left_alone(packer):
+    parts = [part(40), part(60)]
+
+    assert packer.pack(parts, "small") == (parts, [])
+
+
+@pytest.mark.parametrize(
+    "sizes, reserved, allocation",
+    [
+        # Small parts keep their tokens, the rest is split among the larger ones.
+        ([20, 200, 200], 0, [20, 40, 40]),
+        ([200, 200], 0, [50, 50]),
+        # The rest of the prompt takes part of the budget.
+        ([200, 200], 40, [30, 30]),
+    ],
+)
+def test_budget_is_shared_fairly(packer, sizes, reserved, allocation):
+    packed, cuts = packer.pack([part(size) for size in sizes], "small", reserved)
+
+    assert [packer.count(text, "small") for text in packed] == allocation
+    assert len(cuts) == sum(a < s for a, s in zip(allocation, sizes))
+
+
+def test_least_relevant_parts_are_dropped_when_shares_get_too_small(packer):
+    packed, cuts = packer.pack(
+        [part(50) for _ in range(12)], "small", labels=[f"Page {i}" for i in range(12)]
+    )
+
+    # 100 tokens give ten parts the minimum share of 10 tokens, the last two are dropped.
+    assert packed[10:] == ["", ""]
+    assert all(packed[:10])
+    assert cuts[-2:] == ["Page 10: dropped (50 tokens)", "Page 11: dropped (50 tokens)"]
+    assert cuts[0] == "Page 0: truncated from 50 to 10 tokens"
+
+
+def test_truncation_keeps_the_paragraphs_matching_the_query(packer):
+    text = "\n".join(["Weather in Paris.", "Battery prices fall.", "Cats sleep a lot."] * 3)
+
+    truncated = packer.truncate(text, 15, "small", query="battery prices")
+
+    # Each matching paragraph takes 6 of the 15 tokens, the best two fit.
+    assert truncated == "Battery prices fall.\nBattery prices fall."
+
+
+def test_prompts_are_packed_for_the_smallest_model_of_the_route(monkeypatch):
+    router = ModelRouter(
+        {"SelectContent": [("groq", "llama3-8b-8192"), ("openai", "gpt-4o-mini")]}
+    )
+
+    assert router.packing_model("SelectContent", "gpt-4o") == "llama3-8b-8192"
+    assert router.packing_model("Unrouted", "gpt-4o") == "gpt-4o"
+    monkeypatch.setitem(prompt_packer.budgets, "llama3-8b-8192", 100_000)
+    assert router.packing_model("SelectContent", "gpt-4o") == "gpt-4o-mini"
@@ -0,0 +1,59 @@
+import pytest
+
+try:
+    from research_agent.research_task_scheduler import TaskScheduler
+except Exception as error:
+    # Importing the scheduler loads the research tools, which sign in to Eezo.
+    pytest.skip(f"research_agent can't be imported: {error}", allow_module_level=True)
+
+from types import SimpleNamespace
+
+import asyncio
+import time
+
+
+class SlowQueue:
+    """A job queue whose sqlite calls take 50 ms, the job is done on the third poll."""
+
+    def __init__(self):
+        self.polls = 0
+
+    def put(self, run_id, task_id, payload):
+        time.sleep(0.05)
+        return "job"
+
+    def get_result(self, job_id):
+        time.sleep(0.05)
+        self.polls += 1
+        if self.polls < 3:
+            return {"status": "running"}
+        return {"status": "done", "result": {"id": "1", "error": "", "result": "notes"}}
+
+
+def test_waiting_for_a_remote_task_does_not_block_the_event_loop():
+    scheduler = object.__new__(TaskScheduler)
+    scheduler.job_queue = SlowQueue()
+    scheduler.run_id = "run"
+    scheduler.state = {}
+    scheduler.poll_interval = 0.01
+    task = SimpleNamespace(id="1", research_topic="Topic", to_payload=lambda state: {})
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await scheduler.aexecute_remote(task)
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+
+    assert result.result == "notes"
+    # The loop kept ticking during the 200 ms of blocking queue calls.
+    assert ticks > 20
@@ -0,0 +1,51 @@
+from research_agent.research_options import ResearchOptions
+from research_agent.tool_router import ToolRouter
+from research_agent.run_budget import RunBudget
+
+import pytest
+import json
+
+
+def test_options_survive_the_trip_to_a_worker():
+    options = ResearchOptions(
+        max_concurrency=4,
+        speculative=True,
+        time_budget=300,
+        task_timeout=120,
+        merge_select_and_assess=False,
+        tool_timeout=5.0,
+    )
+    worker_router = ToolRouter()
+
+    restored = ResearchOptions.from_dict(
+        json.loads(json.dumps(options.to_dict())), tool_router=worker_router
+    )
+
+    assert restored.to_dict() == options.to_dict()
+    # Workers route with their own router.
+    assert restored.tool_router is worker_router
+
+
+def test_routing_by_the_llm_is_kept():
+    options = ResearchOptions(tool_router=None)
+
+    restored = ResearchOptions.from_dict(options.to_dict(), tool_router=ToolRouter())
+
+    assert options.to_dict()["local_tool_routing"] is False
+    assert restored.tool_router is None
+
+
+@pytest.mark.parametrize("kwargs", [{"max_concurrency": 0}, {"summary_concurrency": 0}])
+def test_invalid_limits_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        ResearchOptions(**kwargs)
+
+
+def test_budget_keeps_its_deadline_on_a_worker():
+    budget = RunBudget(100, report_reserve=10)
+    budget.deadline -= 40
+
+    restored = RunBudget.from_dict(json.loads(json.dumps(budget.to_dict())))
+
+    assert restored.seconds == 100 and restored.report_reserve == 10
+    assert restored.remaining() == pytest.approx(budget.remaining(), abs=0.5)
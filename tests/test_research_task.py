@@ -0,0 +1,173 @@
+import pytest
+
+try:
+    from research_agent import research_task
+    from research_agent.research_task import ResearchTask, TaskResult
+    from tools.research.common.model_schemas import ContentItem
+except Exception as error:
+    # Importing the tasks loads the research tools, which sign in to Eezo.
+    pytest.skip(f"research_agent can't be imported: {error}", allow_module_level=True)
+
+from research_agent.research_options import ResearchOptions
+from utils.prompt_packer import prompt_packer
+from types import SimpleNamespace
+
+
+def span(**kwargs):
+    return SimpleNamespace(id="span", end=lambda **_: None)
+
+
+class FakeMessage:
+    def add(self, *args, **kwargs):
+        return SimpleNamespace(id="component")
+
+    def notify(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, ids, content=None):
+        self.docs = {
+            id: ContentItem(
+                id=id, url=f"https://{id}", title=id, snippet=id, content=content or id
+            )
+            for id in ids
+        }
+
+    def get_doc_by_id(self, id):
+        return self.docs.get(id)
+
+
+class FakeRouter:
+    """Answers the routed calls of a task and records which routes were called with what."""
+
+    def __init__(self):
+        self.calls = []
+        self.answers = {
+            "SelectContent": {"snippet_indeces": [0]},
+            "SelectAndAssessContent": {
+                "snippet_indeces": [0],
+                "more_info_needed": True,
+                "research_topics": ["follow-up"],
+            },
+            "AssessInformationSufficiency": {
+                "more_info_needed": True,
+                "research_topics": ["follow-up"],
+            },
+        }
+
+    def packing_model(self, route, model):
+        return "gpt-4o-mini"
+
+    def call_json(self, name, base_model, data, **kwargs):
+        self.calls.append((name, data))
+        return base_model(**self.answers[name])
+
+
+@pytest.fixture
+def run_task(monkeypatch):
+    router = FakeRouter()
+    monkeypatch.setattr(research_task, "model_router", router)
+    monkeypatch.setattr(research_task, "langfuse_model_wrapper", lambda **kwargs: "notes")
+    monkeypatch.setattr(research_task, "l", SimpleNamespace(span=span))
+
+    def run(merge: bool, follow_up_ids, content=None, answers=None, budget=None):
+        router.answers.update(answers or {})
+        task = ResearchTask(
+            id="2",
+            research_topic="Topic",
+            dependencies=["1"],
+            trace=SimpleNamespace(id="trace", span=span),
+            eezo_context=SimpleNamespace(new_message=FakeMessage),
+            budget=budget,
+            options=ResearchOptions(merge_select_and_assess=merge),
+        )
+
+        def research_follow_ups(db, m, tools, research_topics, cuts):
+            topics.append(research_topics)
+            return list(follow_up_ids)
+
+        topics = []
+        task.research_follow_ups = research_follow_ups
+        state = {"1": TaskResult(id="1", error="", content_used=["a", "b"])}
+        result = task.execute(FakeDB(["a", "b", "new"], content), state, tools=[])
+        run.topics = topics
+        return router.calls, result
+
+    return run
+
+
+@pytest.mark.parametrize(
+    "merge, follow_up_ids, routes",
+    [
+        (True, [], ["SelectAndAssessContent"]),
+        (True, ["new"], ["SelectAndAssessContent", "SelectContent"]),
+        (False, [], ["AssessInformationSufficiency", "SelectContent"]),
+        (False, ["new"], ["AssessInformationSufficiency", "SelectContent"]),
+    ],
+)
+def test_llm_calls_per_task(run_task, merge, follow_up_ids, routes):
+    calls, result = run_task(merge, follow_up_ids)
+
+    assert [name for name, _ in calls] == routes
+    assert result.content_used[0] == "a"
+
+
+def test_merged_selection_only_sends_the_follow_up_content(run_task):
+    calls, result = run_task(True, ["new"])
+
+    _, data = calls[-1]
+    assert "https://new" in data
+    assert "https://a" not in data and "https://b" not in data
+    assert result.content_used == ["a", "new"]
+
+
+def test_pages_cut_from_the_notes_prompt_are_reported(run_task, monkeypatch):
+    monkeypatch.setitem(prompt_packer.budgets, "gpt-4o", 2000)
+    page = "\n".join(f"Paragraph {i} about the topic." for i in range(2000))
+
+    _, result = run_task(True, ["new"], content=page)
+
+    assert result.cuts
+    assert all(cut.startswith("ConvertWebpagesToNotes: Webpage '") for cut in result.cuts)
+
+
+def test_no_follow_ups_when_the_merged_call_finds_the_content_sufficient(run_task):
+    answer = {"snippet_indeces": [1], "more_info_needed": False, "research_topics": ["ignored"]}
+
+    calls, result = run_task(True, [], answers={"SelectAndAssessContent": answer})
+
+    assert run_task.topics == [[]]
+    assert [name for name, _ in calls] == ["SelectAndAssessContent"]
+    assert result.content_used == ["b"]
+
+
+def test_a_low_budget_skips_the_check_for_missing_information(run_task):
+    from research_agent.run_budget import RunBudget
+
+    # 20 of 100 seconds are left, 5 of them for research.
+    budget = RunBudget(100)
+    budget.deadline -= 80
+
+    calls, result = run_task(True, ["new"], budget=budget)
+
+    assert [name for name, _ in calls] == ["SelectContent"]
+    assert run_task.topics == []
+    assert any("time budget" in cut for cut in result.cuts)
+
+
+def test_payload_carries_the_options_of_the_run():
+    options = ResearchOptions(merge_select_and_assess=False, tool_timeout=5.0, tool_router=None)
+    task = ResearchTask(
+        id="2",
+        research_topic="Topic",
+        dependencies=["1"],
+        trace=SimpleNamespace(id="trace"),
+        eezo_context=None,
+        options=options,
+    )
+
+    payload = task.to_payload({"1": TaskResult(id="1", error="")})
+
+    assert payload["options"] == options.to_dict()
+    assert ResearchOptions.from_dict(payload["options"]).tool_router is None
@@ -0,0 +1,62 @@
+from utils.resource_limiter import ResourceLimiter
+
+import threading
+import asyncio
+import pytest
+
+
+def test_waiting_coroutines_hold_no_threads():
+    limiter = ResourceLimiter({"llm": 2})
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.alimit("llm"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        threads = threading.active_count()
+        calls = [asyncio.create_task(call()) for _ in range(300)]
+        await asyncio.sleep(0)
+        assert limiter.stats()["llm"] == {"limit": 2, "in_use": 2, "waiting": 298}
+        assert threading.active_count() == threads
+        await asyncio.gather(*calls)
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.stats()["llm"]["in_use"] == 0
+
+
+def test_slot_released_by_a_thread_wakes_a_coroutine():
+    limiter = ResourceLimiter({"scrape": 1})
+    limiter.acquire("scrape")
+
+    async def main():
+        waiter = asyncio.create_task(limiter.aacquire("scrape"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        threading.Timer(0.01, limiter.release, args=("scrape",)).start()
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
+    assert limiter.stats()["scrape"]["in_use"] == 1
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    limiter = ResourceLimiter({"search": 1})
+
+    async def main():
+        await limiter.aacquire("search")
+        waiter = asyncio.create_task(limiter.aacquire("search"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release("search")
+
+    asyncio.run(main())
+    assert limiter.stats()["search"] == {"limit": 1, "in_use": 0, "waiting": 0}
@@ -0,0 +1,152 @@
+import pytest
+
+try:
+    from research_agent.research_task_scheduler import TaskScheduler
+    from research_agent.research_task import TaskResult
+except Exception as error:
+    # Importing the scheduler loads the research tools, which sign in to Eezo.
+    pytest.skip(f"research_agent can't be imported: {error}", allow_module_level=True)
+
+from research_agent.research_options import ResearchOptions
+from research_agent.worker_pool import WorkerPool
+
+import time
+
+
+class FakeTask:
+    """A task of the DAG that records when it ran instead of researching its topic."""
+
+    def __init__(self, id, dependencies=(), log=None, delay=0.0, error=""):
+        self.id = id
+        self.research_topic = f"Topic {id}"
+        self.dependencies = list(dependencies)
+        self.log = log if log is not None else []
+        self.delay = delay
+        self.error = error
+
+    def execute(self, db, state, tools):
+        self.log.append(self.id)
+        time.sleep(self.delay)
+        return TaskResult(id=self.id, research_topic=self.research_topic, error=self.error)
+
+
+def dag(log, **delays):
+    """Two independent leaves listed before the chain 1 -> 1.1 -> 1.1.1."""
+    spec = [("2", []), ("3", []), ("1", []), ("1.1", ["1"]), ("1.1.1", ["1.1"])]
+    return [FakeTask(id, deps, log, delays.get(id, 0.0)) for id, deps in spec]
+
+
+def test_priorities_are_the_longest_remaining_path():
+    scheduler = TaskScheduler(dag([]), tools=[], latency_weighted=False)
+
+    assert scheduler.priorities == {"2": 1, "3": 1, "1": 3, "1.1": 2, "1.1.1": 1}
+
+
+def test_the_critical_path_starts_first_with_one_worker():
+    log = []
+    scheduler = TaskScheduler(
+        dag(log), tools=[], latency_weighted=False, pool=WorkerPool(max_workers=1)
+    )
+
+    scheduler.execute()
+
+    # 1.1 outranks the leaves, 1.1.1 ties with them and keeps its place in the outline.
+    assert log == ["1", "1.1", "2", "3", "1.1.1"]
+
+
+def test_latency_weighted_priorities_use_the_stage_history(monkeypatch):
+    from research_agent import research_task_scheduler
+
+    monkeypatch.setattr(
+        research_task_scheduler.stage_latency, "averages", {"root": 10.0, "dependent": 1.0}
+    )
+    scheduler = TaskScheduler(dag([]), tools=[])
+
+    assert scheduler.priorities["1"] == 12.0
+    assert scheduler.priorities["2"] == 10.0
+
+
+def test_a_resumed_run_only_executes_what_did_not_succeed(tmp_path):
+    from research_agent.db import CheckpointDB
+
+    path = str(tmp_path / "checkpoints.db")
+    first = dag([])
+    first[3].error = "Search failed."
+    TaskScheduler(first, tools=[], run_id="run", checkpoint_db=CheckpointDB(path)).execute()
+
+    # The process died, the run is resumed from a new database connection.
+    log = []
+    resumed = TaskScheduler(dag(log), tools=[], run_id="run", checkpoint_db=CheckpointDB(path))
+    assert sorted(resumed.state) == ["1", "2", "3"]
+    resumed.execute()
+
+    # The failed task runs again, and with it everything built on its result.
+    assert sorted(log) == ["1.1", "1.1.1"]
+    assert all(not result.error for result in resumed.get_results())
+
+
+class PrefetchingTask(FakeTask):
+    def prefetch(self, db, tools):
+        self.log.append(f"prefetch {self.id}")
+
+
+def test_idle_workers_prefetch_for_blocked_tasks():
+    log = []
+    tasks = [FakeTask("1", log=log, delay=0.2), PrefetchingTask("1.1", ["1"], log)]
+    scheduler = TaskScheduler(
+        tasks, tools=[], options=ResearchOptions(speculative=True), pool=WorkerPool(max_workers=2)
+    )
+
+    scheduler.execute()
+
+    # The second worker prefetched while 1 was still running.
+    assert sorted(log[:2]) == ["1", "prefetch 1.1"]
+    assert log[2:] == ["1.1"]
+    assert scheduler.pool.stats()["running"] == 0
+
+
+def test_without_speculation_blocked_tasks_are_not_prefetched():
+    log = []
+    tasks = [FakeTask("1", log=log), PrefetchingTask("1.1", ["1"], log)]
+
+    TaskScheduler(tasks, tools=[], pool=WorkerPool(max_workers=2)).execute()
+
+    assert log == ["1", "1.1"]
+
+
+def test_results_are_yielded_in_completion_order():
+    tasks = [FakeTask("1", delay=0.2), FakeTask("2", delay=0.05), FakeTask("3", ["2"])]
+    scheduler = TaskScheduler(tasks, tools=[], pool=WorkerPool(max_workers=4))
+
+    assert [result.id for result in scheduler.iter_results()] == ["2", "3", "1"]
+
+
+def test_stopping_the_iteration_cancels_the_tasks_not_started():
+    log = []
+    tasks = [FakeTask("1", log=log, delay=0.05), FakeTask("1.1", ["1"], log)]
+    scheduler = TaskScheduler(tasks, tools=[], pool=WorkerPool(max_workers=1))
+
+    for result in scheduler.iter_results():
+        break
+
+    assert result.id == "1"
+    assert log == ["1"]
+    assert scheduler.pool.stats()["running"] == 0
+
+
+def test_tasks_added_while_streaming_run_once_their_dependencies_are_done():
+    scheduler = TaskScheduler([], tools=[], streaming=True, pool=WorkerPool(max_workers=2))
+    results = scheduler.iter_results()
+
+    scheduler.add_task(FakeTask("1"))
+    first = next(results)
+    # 1.1 depends on a task that already finished, 1.2 on one that is added after it.
+    scheduler.add_task(FakeTask("1.1", ["1"]))
+    scheduler.add_task(FakeTask("1.2", ["2"]))
+    scheduler.add_task(FakeTask("2"))
+    scheduler.close()
+
+    rest = [result.id for result in results]
+    assert first.id == "1"
+    assert sorted(rest) == ["1.1", "1.2", "2"]
+    assert rest.index("2") < rest.index("1.2")
@@ -0,0 +1,110 @@
+import unittest
+
+try:
+    from research_agent.research_task import ResearchTask
+    from tools.research.common.model_schemas import ContentItem
+except Exception as error:
+    # Importing the tasks loads the research tools, which sign in to Eezo.
+    raise unittest.SkipTest(f"research_agent can't be imported: {error}")
+
+from research_agent.research_options import ResearchOptions
+from types import SimpleNamespace
+
+import threading
+import json
+import time
+
+
+class SlowTool:
+    """A search tool answering after delay seconds, or failing with error."""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.queries = []
+
+    def invoke(self, payload, config):
+        self.queries.append(payload["query"])
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        item = ContentItem(
+            id=self.name, url=f"https://{self.name}", title=self.name, snippet="", content=""
+        )
+        return SimpleNamespace(content=[item], cuts=[f"{self.name} cut"])
+
+
+def tool_call(name):
+    return {"function": {"name": name, "arguments": json.dumps({"query": "ignored"})}}
+
+
+class RunToolsTest(unittest.TestCase):
+    def setUp(self):
+        self.task = ResearchTask(
+            id="1",
+            research_topic="Battery prices",
+            dependencies=[],
+            trace=SimpleNamespace(id="trace"),
+            eezo_context=None,
+            options=ResearchOptions(tool_timeout=0.5),
+        )
+        self.span = SimpleNamespace(get_langchain_handler=lambda: None)
+
+    def run_tools(self, tools):
+        return self.task.run_tools(
+            tools, [tool_call(tool.name) for tool in tools], "Battery prices", self.span
+        )
+
+    def test_tools_run_at_the_same_time(self):
+        tools = [SlowTool(name, delay=0.2) for name in ("exa", "news", "you_com")]
+        start = time.monotonic()
+
+        results, skipped = self.run_tools(tools)
+
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual([item.id for item in results], ["exa", "news", "you_com"])
+        self.assertEqual(skipped, [])
+        self.assertEqual(tools[0].queries, ["Battery prices"])
+        # Cuts are recorded as the tools finish.
+        self.assertEqual(
+            sorted(self.task.prompt_cuts),
+            ["exa: exa cut", "news: news cut", "you_com: you_com cut"],
+        )
+
+    def test_failed_and_slow_tools_are_skipped(self):
+        tools = [
+            SlowTool("exa"),
+            SlowTool("news", error=RuntimeError("503 from the news API")),
+            SlowTool("you_com", delay=2),
+        ]
+        start = time.monotonic()
+
+        results, skipped = self.run_tools(tools)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([item.id for item in results], ["exa"])
+        self.assertEqual(
+            skipped, ["news: 503 from the news API", "you_com: timed out after 0.5s"]
+        )
+
+    def test_follow_up_topics_are_researched_at_the_same_time(self):
+        running, peak = 0, 0
+        lock = threading.Lock()
+
+        def find_content(db, tools, research_topic):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.1)
+            with lock:
+                running -= 1
+            return []
+
+        self.task.find_content = find_content
+        self.task.store_content = lambda db, m, results: results
+
+        self.task.research_follow_ups(None, None, [], ["a", "b", "c"], [])
+
+        self.assertEqual(peak, 3)
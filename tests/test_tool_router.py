@@ -0,0 +1,93 @@
+from research_agent.tool_router import ToolRouter
+from langchain.pydantic_v1 import BaseModel
+from types import SimpleNamespace
+
+import json
+import pytest
+
+
+class Query(BaseModel):
+    query: str
+
+
+class EntityQuery(BaseModel):
+    query: str
+    entity_name: str
+
+
+def tool(name, description="Searches the web for a query.", args_schema=Query):
+    return SimpleNamespace(name=name, description=description, args_schema=args_schema)
+
+
+TOOLS = [
+    tool("you-com-search"),
+    tool("news-search"),
+    tool("exa-company-search"),
+    tool("similar-web-search", args_schema=EntityQuery),
+]
+
+
+def routed(tool_calls):
+    return [call["function"]["name"] for call in tool_calls]
+
+
+@pytest.mark.parametrize(
+    "topic, tools",
+    [
+        ("Latest news on solid-state batteries", ["news-search"]),
+        ("Which startups compete in home batteries?", ["exa-company-search"]),
+        ("Recent announcements of battery startups", ["news-search", "exa-company-search"]),
+        # Nothing matches, the default tool is used.
+        ("How do lithium batteries age?", ["you-com-search"]),
+    ],
+)
+def test_rules_pick_the_tools_locally(topic, tools):
+    router = ToolRouter()
+
+    tool_calls = router.route(topic, TOOLS)
+
+    assert sorted(routed(tool_calls)) == sorted(tools)
+    assert json.loads(tool_calls[0]["function"]["arguments"]) == {"query": topic}
+    assert router.stats() == {"local": 1, "llm": 0}
+
+
+def test_tools_needing_more_than_the_query_are_left_to_the_llm():
+    router = ToolRouter()
+
+    assert router.route("Monthly visits of tesla.com", TOOLS) is None
+    assert router.stats() == {"local": 0, "llm": 1}
+
+
+def test_no_default_tool_is_ambiguous():
+    router = ToolRouter(default_tools=[])
+
+    assert router.route("How do lithium batteries age?", TOOLS) is None
+
+
+def test_at_most_max_tools_are_picked():
+    router = ToolRouter(max_tools=1)
+
+    tool_calls = router.route("Recent battery startups and their competitors", TOOLS)
+
+    assert routed(tool_calls) == ["exa-company-search"]
+
+
+def test_choices_of_the_llm_are_learned_after_min_samples():
+    router = ToolRouter(min_samples=3)
+    topic = "Patent filings on sodium batteries"
+    assert routed(router.route(topic, TOOLS)) == ["you-com-search"]
+
+    for _ in range(3):
+        router.record("Patent filings of battery makers", ["exa-company-search"])
+
+    assert routed(router.route(topic, TOOLS)) == ["exa-company-search"]
+
+
+def test_description_words_specific_to_a_tool_count():
+    tools = [
+        tool("you-com-search"),
+        tool("patent-search", description="Searches patent filings and granted patents."),
+    ]
+
+    topic = "Granted patents and patent filings on sodium batteries"
+    assert routed(ToolRouter().route(topic, tools)) == ["patent-search"]
@@ -0,0 +1,47 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.adaptive_limiter import adaptive_limiter
+from utils.web_loader import AdaptiveWebLoader
+
+import threading
+import time
+
+
+class Handler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def do_GET(self):
+        with Handler.lock:
+            Handler.running += 1
+            Handler.peak = max(Handler.peak, Handler.running)
+        time.sleep(0.05)
+        with Handler.lock:
+            Handler.running -= 1
+        status = 429 if self.path == "/limited" else 200
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(f"<html><body>page {self.path}</body></html>".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_every_url_takes_its_own_slot():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    adaptive_limiter.configure({"test-scrape": (2, 1, 2)})
+    try:
+        urls = [f"{base}/{i}" for i in range(6)] + [f"{base}/limited"]
+        docs = AdaptiveWebLoader(urls, provider="test-scrape").aload()
+    finally:
+        server.shutdown()
+
+    assert [doc.metadata["source"] for doc in docs] == urls
+    assert all(f"page /{i}" in docs[i].page_content for i in range(6))
+    assert docs[-1].page_content == ""
+    assert Handler.peak == 2
+    stats = adaptive_limiter.stats()["test-scrape"]
+    assert (stats["calls"], stats["overloads"], stats["in_use"]) == (7, 1, 0)
@@ -42,7 +42,9 @@ class ResearchToolOutput(BaseModel):
     Attributes:
         content (List[ContentItem]): A list of content items generated or processed by the tool.
         summary (str): A summary of the content items.
+        cuts (List[str]): What was cut from the prompts of the tool to fit their token budget.
     """
 
     content: List[ContentItem]
     summary: str
+    cuts: List[str] = []
@@ -2,8 +2,10 @@ from .common.model_schemas import ContentItem, ResearchToolOutput
 from .base_tool import ResearchTool
 from langchain.tools import BaseTool
 
-from langchain_community.document_loaders import WebBaseLoader
+from utils.web_loader import AdaptiveWebLoader
+from utils.client_registry import clients
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
+from utils.prompt_packer import prompt_packer
 from langchain.pydantic_v1 import BaseModel
 from langfuse import Langfuse
 from typing import Type, List
@@ -12,7 +14,6 @@ from eezo.agent import Agent
 from eezo import Eezo
 
 import logging
-import requests
 import os
 
 l = Langfuse()
@@ -39,7 +40,7 @@ class ExaCompanySearch(BaseTool):
 
     def scrape_pages(self, urls: List[str]):
         # https://python.langchain.com/docs/integrations/document_loaders/web_base/
-        loader = WebBaseLoader(
+        loader = AdaptiveWebLoader(
             urls,
             proxies={
                 # https://docs.zyte.com/zyte-api/usage/proxy-mode.html#zyte-api-proxy-mode
@@ -47,8 +48,8 @@ class ExaCompanySearch(BaseTool):
                 for scheme in ("http", "https")
             },
         )
-        loader.requests_per_second = 5
         try:
+            # Every URL takes its own scrape and Zyte slot, see AdaptiveWebLoader.
             docs = loader.aload()
             for doc in docs:
                 while "\n\n" in doc.page_content:
@@ -78,7 +79,7 @@ class ExaCompanySearch(BaseTool):
             "x-api-key": os.getenv("EXA_API_KEY"),
         }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = clients.session("exa").post(url, json=payload, headers=headers)
 
         urls = [result["url"] for result in response.json()["results"]]
         webpages = self.scrape_pages(urls)
@@ -104,11 +105,22 @@ class ExaCompanySearch(BaseTool):
                 )
             )
 
-        summary = ""
+        summary, cuts = "", []
         if self.include_summary:
-            formatted_content = "\n\n".join([f"### {item}" for item in content])
+            # Fit the search results into the token budget of the model.
+            system_prompt, data = summarize_search_results.assemble(
+                search_results_str="", user_prompt=kwargs["query"]
+            )
+            results, cuts = prompt_packer.pack(
+                [f"### {item}" for item in content],
+                model="llama3-70b-8192",
+                reserved_tokens=prompt_packer.count(system_prompt + data, "llama3-70b-8192"),
+                query=kwargs["query"],
+                labels=[f"Search result '{item.title}'" for item in content],
+            )
+            formatted_content = "\n\n".join([result for result in results if result])
 
-            system_prompt = summarize_search_results.compile(
+            system_prompt, data = summarize_search_results.assemble(
                 search_results_str=formatted_content, user_prompt=kwargs["query"]
             )
 
@@ -116,10 +128,13 @@ class ExaCompanySearch(BaseTool):
                 name="SummarizeSearchResults",
                 system_prompt=system_prompt,
                 prompt=summarize_search_results,
+                data=data,
                 user_prompt=kwargs["query"],
                 model="llama3-70b-8192",
                 host="groq",
                 temperature=0.7,
+                # Only shown to the user, the research tasks don't wait for it.
+                priority="low",
             )
 
-        return ResearchToolOutput(content=content, summary=summary)
+        return ResearchToolOutput(content=content, summary=summary, cuts=cuts)
@@ -1,9 +1,11 @@
 from .common.model_schemas import ContentItem, ResearchToolOutput
 from langchain.tools import BaseTool
 
-from utils.langfuse_json_model_wrapper import langfuse_json_model_wrapper
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
-from langchain_community.document_loaders import WebBaseLoader
+from utils.prompt_packer import prompt_packer
+from utils.model_router import model_router
+from utils.web_loader import AdaptiveWebLoader
+from utils.adaptive_limiter import adaptive_limiter
 from langchain_community.utilities import GoogleSerperAPIWrapper
 from pydantic import BaseModel
 from langfuse import Langfuse
@@ -38,7 +40,7 @@ class NewsSearch(BaseTool):
 
     def scrape_pages(self, urls: List[str]):
         # https://python.langchain.com/docs/integrations/document_loaders/web_base/
-        loader = WebBaseLoader(
+        loader = AdaptiveWebLoader(
             urls,
             proxies={
                 # https://docs.zyte.com/zyte-api/usage/proxy-mode.html#zyte-api-proxy-mode
@@ -46,8 +48,8 @@ class NewsSearch(BaseTool):
                 for scheme in ("http", "https")
             },
         )
-        loader.requests_per_second = 5
         try:
+            # Every URL takes its own scrape and Zyte slot, see AdaptiveWebLoader.
             docs = loader.aload()
             for doc in docs:
                 while "\n\n" in doc.page_content:
@@ -62,33 +64,41 @@ class NewsSearch(BaseTool):
     def decide_what_to_use(
         self, content: List[dict], research_topic: str
     ) -> List[dict]:
+        if not content:
+            # Nothing to pick from, don't ask the LLM.
+            return []
         formatted_snippets = ""
         for i, doc in enumerate(content):
             formatted_snippets += f"{i}: {doc['title']}: {doc['snippet']}\n"
 
-        system_prompt = select_content.compile(
+        system_prompt, data = select_content.assemble(
             research_topic=research_topic, formatted_snippets=formatted_snippets
         )
 
         class ModelResponse(BaseModel):
             snippet_indeces: List[int]
 
-        response: ModelResponse = langfuse_json_model_wrapper(
+        response: ModelResponse = model_router.call_json(
             name="SelectContent",
             system_prompt=system_prompt,
             user_prompt="Pick the snippets you want to include in the summary.",
+            data=data,
             prompt=select_content,
             base_model=ModelResponse,
+            # Escalate if none of the picked snippets exists. Picking none is a valid answer.
+            accept=lambda response: not response.snippet_indeces
+            or any(0 <= i < len(content) for i in response.snippet_indeces),
         )
 
-        indices = [i for i in response.snippet_indeces if i < len(content)]
+        indices = [i for i in response.snippet_indeces if 0 <= i < len(content)]
         return [content[i] for i in indices]
 
     def _run(self, **kwargs) -> ResearchToolOutput:
         # https://python.langchain.com/docs/integrations/tools/google_serper/
         google_serper = GoogleSerperAPIWrapper(type="news", k=10)
 
-        response = google_serper.results(query=kwargs["query"])
+        with adaptive_limiter.limit("serper"):
+            response = google_serper.results(query=kwargs["query"])
 
         news_results = response["news"]
         # exampel = {
@@ -143,11 +153,22 @@ class NewsSearch(BaseTool):
                 )
             )
 
-        summary = ""
+        summary, cuts = "", []
         if self.include_summary:
-            formatted_content = "\n\n".join([f"### {item}" for item in content])
+            # Fit the search results into the token budget of the model.
+            system_prompt, data = summarize_search_results.assemble(
+                search_results_str="", user_prompt=kwargs["query"]
+            )
+            results, cuts = prompt_packer.pack(
+                [f"### {item}" for item in content],
+                model="llama3-70b-8192",
+                reserved_tokens=prompt_packer.count(system_prompt + data, "llama3-70b-8192"),
+                query=kwargs["query"],
+                labels=[f"Search result '{item.title}'" for item in content],
+            )
+            formatted_content = "\n\n".join([result for result in results if result])
 
-            system_prompt = summarize_search_results.compile(
+            system_prompt, data = summarize_search_results.assemble(
                 search_results_str=formatted_content, user_prompt=kwargs["query"]
             )
 
@@ -155,10 +176,13 @@ class NewsSearch(BaseTool):
                 name="SummarizeSearchResults",
                 system_prompt=system_prompt,
                 prompt=summarize_search_results,
+                data=data,
                 user_prompt=f"Summarize and group the search results based on this: '{kwargs['query']}'. Include links, dates, and snippets from the search results.",
                 model="llama3-70b-8192",
                 host="groq",
                 temperature=0.7,
+                # Only shown to the user, the research tasks don't wait for it.
+                priority="low",
             )
 
-        return ResearchToolOutput(content=content, summary=summary)
+        return ResearchToolOutput(content=content, summary=summary, cuts=cuts)
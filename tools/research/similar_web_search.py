@@ -2,6 +2,9 @@ from .common.model_schemas import ContentItem, ResearchToolOutput
 from langchain.tools import BaseTool
 
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
+from utils.prompt_packer import prompt_packer
+from utils.resource_limiter import limiter
+from utils.client_registry import clients
 from langchain.pydantic_v1 import BaseModel
 from eezo.interface.message import Message
 from bs4 import BeautifulSoup
@@ -11,7 +14,6 @@ from typing import Type
 from eezo.agent import Agent
 from eezo import Eezo
 
-import requests
 import os
 
 l = Langfuse()
@@ -80,7 +82,7 @@ class SimilarWebSearch(BaseTool):
         params = {"q": query, "count": count}
 
         # Make the GET request to the Brave Search API
-        response = requests.get(url, headers=headers, params=params)
+        response = clients.session("brave").get(url, headers=headers, params=params)
 
         # Check if the request was successful
         if response.status_code == 200:
@@ -106,26 +108,37 @@ class SimilarWebSearch(BaseTool):
             self.chat_message.notify()
 
         url = f"https://www.similarweb.com/website/{domain}/#overview"
-        response = requests.post(
-            "https://api.zyte.com/v1/extract",
-            auth=(os.getenv("ZYTE_API_KEY"), ""),
-            json={"url": url, "browserHtml": True},
-        )
+        with limiter.limit("scrape"):
+            response = clients.session("zyte").post(
+                "https://api.zyte.com/v1/extract",
+                auth=(os.getenv("ZYTE_API_KEY"), ""),
+                json={"url": url, "browserHtml": True},
+            )
 
         if self.chat_message:
             self.chat_message.add("text", text="Generating a report...")
             self.chat_message.notify()
 
-        text = ""
+        text, cuts = "", []
         if response.status_code == 200:
             soup = BeautifulSoup(response.json().get("browserHtml", ""), "html.parser")
             text = soup.get_text(separator="\n", strip=True)
+            # SimilarWeb pages are long, fit them into the token budget of the models.
+            [text], cuts = prompt_packer.pack(
+                [text],
+                model="gpt-3.5-turbo-1106",
+                query=self.user_prompt or "",
+                labels=[f"SimilarWeb page of {domain}"],
+            )
 
+            # The text is sent once, after the instructions, so their prefix can be cached.
+            system_prompt, data = generate_paragraph.assemble(text=text)
             snippet = langfuse_model_wrapper(
                 name="GenerateParagraph",
-                system_prompt=generate_paragraph.compile(text=text),
+                system_prompt=system_prompt,
                 prompt=generate_paragraph,
-                user_prompt=f"Generate a snippet based on the given text:\n{text}",
+                user_prompt="Generate a snippet based on the given text.",
+                data=data,
                 model="gpt-3.5-turbo-1106",
                 temperature=0.7,
             )
@@ -144,14 +157,15 @@ class SimilarWebSearch(BaseTool):
 
         summary = ""
         if self.include_summary and len(content) > 0:
-            system_prompt = summarize_similarweb.compile(
-                text=text, instructions=instructions, user_prompt=self.user_prompt
+            system_prompt, data = summarize_similarweb.assemble(
+                text=text, instructions=instructions, user_prompt=self.user_prompt or ""
             )
             summary = langfuse_model_wrapper(
                 name="SimilarWebSearchSummary",
                 system_prompt=system_prompt,
                 user_prompt="Generate a detailed report based on the given text.",
+                data=data,
                 prompt=summarize_similarweb,
                 temperature=0.7,
             )
-        return ResearchToolOutput(content=content, summary=summary)
+        return ResearchToolOutput(content=content, summary=summary, cuts=cuts)
@@ -2,6 +2,8 @@ from .common.model_schemas import ContentItem, ResearchToolOutput
 from langchain.tools import BaseTool
 
 from utils.langfuse_model_wrapper import langfuse_model_wrapper
+from utils.prompt_packer import prompt_packer
+from utils.client_registry import clients
 from langchain.pydantic_v1 import BaseModel
 from langfuse import Langfuse
 from prompts import Prompt
@@ -9,7 +11,6 @@ from typing import Type
 from eezo.agent import Agent
 from eezo import Eezo
 
-import requests
 import os
 
 l = Langfuse()
@@ -37,7 +38,7 @@ class YouComSearch(BaseTool):
     def you_com_search(self, query):
         headers = {"X-API-Key": os.environ["YOUCOM_API_KEY"]}
         params = {"query": query}
-        return requests.get(
+        return clients.session("youcom").get(
             f"https://api.ydc-index.io/rag?query={query}",
             params=params,
             headers=headers,
@@ -59,11 +60,22 @@ class YouComSearch(BaseTool):
                 )
             )
 
-        summary = ""
+        summary, cuts = "", []
         if self.include_summary:
-            formatted_content = "\n\n".join([f"### {item}" for item in content])
+            # Fit the search results into the token budget of the model.
+            system_prompt, data = summarize_search_results.assemble(
+                search_results_str="", user_prompt=kwargs["query"]
+            )
+            results, cuts = prompt_packer.pack(
+                [f"### {item}" for item in content],
+                model="llama3-70b-8192",
+                reserved_tokens=prompt_packer.count(system_prompt + data, "llama3-70b-8192"),
+                query=kwargs["query"],
+                labels=[f"Search result '{item.title}'" for item in content],
+            )
+            formatted_content = "\n\n".join([result for result in results if result])
 
-            system_prompt = summarize_search_results.compile(
+            system_prompt, data = summarize_search_results.assemble(
                 search_results_str=formatted_content, user_prompt=kwargs["query"]
             )
 
@@ -71,9 +83,12 @@ class YouComSearch(BaseTool):
                 name="SummarizeSearchResults",
                 system_prompt=system_prompt,
                 prompt=summarize_search_results,
+                data=data,
                 user_prompt=kwargs["query"],
                 model="llama3-70b-8192",
                 host="groq",
                 temperature=0.7,
+                # Only shown to the user, the research tasks don't wait for it.
+                priority="low",
             )
-        return ResearchToolOutput(content=content, summary=summary)
+        return ResearchToolOutput(content=content, summary=summary, cuts=cuts)
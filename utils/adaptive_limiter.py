@@ -0,0 +1,338 @@
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+from utils.async_waiters import AsyncWaiters
+
+import threading
+import requests
+import logging
+import openai
+import httpx
+import groq
+import time
+
+# Initial, minimum and maximum concurrency per external provider.
+DEFAULT_PROVIDER_LIMITS: Dict[str, Tuple[int, int, int]] = {
+    "openai": (16, 1, 64),
+    "groq": (8, 1, 32),
+    "youcom": (4, 1, 16),
+    "serper": (4, 1, 16),
+    "exa": (4, 1, 16),
+    "brave": (2, 1, 8),
+    "zyte": (5, 1, 32),
+}
+# Errors and status codes telling that a provider is overloaded.
+OVERLOAD_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    groq.RateLimitError,
+    groq.APITimeoutError,
+    requests.Timeout,
+    httpx.TimeoutException,
+    TimeoutError,
+)
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+class Call:
+    """
+    The outcome of one call, set by the caller if the provider reported an overload without
+    raising, e.g. with a 429 response.
+    """
+
+    def __init__(self):
+        self.overloaded = False
+
+
+class ProviderState:
+    """
+    The AIMD state of one provider.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_use = 0
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+        self.calls = 0
+        self.overloads = 0
+        self.errors = 0
+
+
+class AdaptiveLimiter:
+    """
+    Adapts the number of concurrent calls per external provider with AIMD (additive increase,
+    multiplicative decrease), like TCP congestion control.
+
+    While the latency of a provider stays close to its best observed latency and its error rate
+    stays low, the limit grows by one call per round of successful calls. On rate limit errors,
+    503s and timeouts it is halved, at most once per round trip, so a burst of failures of calls
+    sent at the same time counts as one overload. Coroutines wait for a slot as futures that are
+    resolved when a slot frees up, without holding a thread.
+
+    Attributes:
+        latency_tolerance (float): The limit only grows while the smoothed latency is below this
+            multiple of the best smoothed latency.
+        max_error_rate (float): The limit only grows while the smoothed error rate is below this.
+        decrease_factor (float): The factor the limit is multiplied with on an overload.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, int, int]]] = None,
+        latency_tolerance: float = 2.0,
+        max_error_rate: float = 0.1,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initializes the AdaptiveLimiter with the default provider limits, optionally overridden.
+
+        Args:
+            limits (Optional[Dict[str, Tuple[int, int, int]]]): Initial, minimum and maximum
+                concurrency per provider, overriding DEFAULT_PROVIDER_LIMITS.
+            latency_tolerance (float): Multiple of the best latency still considered healthy.
+            max_error_rate (float): Highest error rate still considered healthy.
+            decrease_factor (float): The factor the limit is multiplied with on an overload.
+        """
+        self.condition = threading.Condition()
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+        self.providers: Dict[str, ProviderState] = {}
+        for provider, provider_limits in {**DEFAULT_PROVIDER_LIMITS, **(limits or {})}.items():
+            self.providers[provider] = ProviderState(*provider_limits)
+        # Coroutines waiting for a slot, keyed by provider
+        self.waiters = AsyncWaiters()
+
+    def configure(self, limits: Dict[str, Tuple[int, int, int]]) -> None:
+        """
+        Resets the limits of one or more providers.
+
+        Args:
+            limits (Dict[str, Tuple[int, int, int]]): Initial, minimum and maximum concurrency
+                per provider.
+        """
+        for provider, (initial, min_limit, max_limit) in limits.items():
+            if not 1 <= min_limit <= initial <= max_limit:
+                raise ValueError(
+                    f"Limits for provider '{provider}' must satisfy 1 <= min <= initial <= max."
+                )
+        with self.condition:
+            for provider, provider_limits in limits.items():
+                self.providers[provider] = ProviderState(*provider_limits)
+                self._dispatch(provider)
+            self.condition.notify_all()
+        logging.info(f"Adaptive provider limits set to {limits}")
+
+    def _state(self, provider: str) -> ProviderState:
+        """
+        Returns the state of a provider, unknown providers start with the defaults of Zyte.
+        Needs the condition.
+        """
+        if provider not in self.providers:
+            self.providers[provider] = ProviderState(*DEFAULT_PROVIDER_LIMITS["zyte"])
+        return self.providers[provider]
+
+    def concurrency(self, provider: str) -> int:
+        """
+        Returns the current concurrency limit of a provider.
+        """
+        with self.condition:
+            return int(self._state(provider).limit)
+
+    def acquire(self, provider: str, blocking: bool = True) -> bool:
+        """
+        Acquires a slot for a call to the given provider.
+
+        Args:
+            provider (str): The provider name, e.g. "openai" or "zyte".
+            blocking (bool): Wait for a free slot if True, otherwise return immediately.
+
+        Returns:
+            bool: True if a slot was acquired.
+        """
+        with self.condition:
+            state = self._state(provider)
+            while state.in_use >= int(state.limit):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            state.in_use += 1
+            return True
+
+    def release(self, provider: str) -> None:
+        """
+        Releases a slot previously acquired for the given provider.
+
+        Args:
+            provider (str): The provider name.
+        """
+        with self.condition:
+            self._state(provider).in_use -= 1
+            self._dispatch(provider)
+            self.condition.notify_all()
+
+    def _dispatch(self, provider: str) -> None:
+        """
+        Hands free slots of a provider to waiting coroutines, oldest first. Needs the condition.
+        """
+        self.waiters.dispatch(self._has_slot, self._take, key=provider)
+
+    def _has_slot(self, provider: str) -> bool:
+        state = self._state(provider)
+        return state.in_use < int(state.limit)
+
+    def _take(self, provider: str) -> None:
+        self._state(provider).in_use += 1
+
+    async def aacquire(self, provider: str) -> None:
+        """
+        Waits for a slot of the given provider without blocking the event loop or a thread.
+
+        Args:
+            provider (str): The provider name.
+        """
+        with self.condition:
+            if not self.waiters.count(provider) and self._has_slot(provider):
+                self._take(provider)
+                return
+            waiter = self.waiters.enqueue(provider)
+        await self.waiters.wait(waiter, self.condition, lambda: self.release(provider))
+
+    def record(
+        self, provider: str, latency: float, overloaded: bool = False, failed: bool = False
+    ) -> None:
+        """
+        Records the outcome of a call and adapts the limit of its provider.
+
+        Args:
+            provider (str): The provider name.
+            latency (float): The seconds the call took.
+            overloaded (bool): The provider reported a rate limit, 503 or timed out.
+            failed (bool): The call failed for another reason.
+        """
+        with self.condition:
+            state = self._state(provider)
+            state.calls += 1
+            state.error_rate = 0.9 * state.error_rate + 0.1 * (overloaded or failed)
+            now = time.monotonic()
+
+            if overloaded:
+                state.overloads += 1
+                # Calls sent before the last decrease still see the old overload.
+                if now - state.last_decrease > (state.latency or 1.0):
+                    previous = state.limit
+                    state.limit = max(
+                        float(state.min_limit), state.limit * self.decrease_factor
+                    )
+                    state.last_decrease = now
+                    logging.info(
+                        f"Provider {provider} overloaded, limit {previous:.1f} -> {state.limit:.1f}"
+                    )
+                return
+            if failed:
+                state.errors += 1
+                return
+
+            state.latency = (
+                latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+            )
+            state.baseline = (
+                state.latency if state.baseline is None else min(state.baseline, state.latency)
+            )
+            healthy = (
+                state.latency <= self.latency_tolerance * state.baseline
+                and state.error_rate < self.max_error_rate
+            )
+            if healthy and state.limit < state.max_limit:
+                # One more call per round of limit successful calls.
+                state.limit = min(float(state.max_limit), state.limit + 1 / state.limit)
+                self._dispatch(provider)
+                self.condition.notify_all()
+
+    def _record_error(self, provider: str, latency: float, error: BaseException) -> None:
+        """
+        Records a failed call, classifying the error as overload or other failure.
+        """
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+        overloaded = isinstance(error, OVERLOAD_ERRORS) or (
+            status_code in OVERLOAD_STATUS_CODES
+        )
+        self.record(provider, latency, overloaded=overloaded, failed=not overloaded)
+
+    @contextmanager
+    def limit(self, provider: str):
+        """
+        Holds a slot of the given provider for the duration of the with block and records the
+        outcome of the call. Set overloaded on the yielded Call if the provider reported an
+        overload without raising.
+
+        Args:
+            provider (str): The provider name.
+        """
+        self.acquire(provider)
+        call = Call()
+        start = time.monotonic()
+        try:
+            yield call
+        except Exception as error:
+            self._record_error(provider, time.monotonic() - start, error)
+            raise
+        else:
+            self.record(provider, time.monotonic() - start, overloaded=call.overloaded)
+        finally:
+            self.release(provider)
+
+    @asynccontextmanager
+    async def alimit(self, provider: str):
+        """
+        Awaitable counterpart of limit(). Neither the event loop nor a thread is blocked
+        while waiting for a slot.
+
+        Args:
+            provider (str): The provider name.
+        """
+        await self.aacquire(provider)
+        call = Call()
+        start = time.monotonic()
+        try:
+            yield call
+        except Exception as error:
+            self._record_error(provider, time.monotonic() - start, error)
+            raise
+        else:
+            self.record(provider, time.monotonic() - start, overloaded=call.overloaded)
+        finally:
+            self.release(provider)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the current limit and health of every provider.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Limit, calls in flight and waiting, smoothed and best latency, error
+                rate, and the number of calls, overloads and other errors per provider.
+        """
+        with self.condition:
+            return {
+                provider: {
+                    "limit": int(state.limit),
+                    "in_use": state.in_use,
+                    "waiting": self.waiters.count(provider),
+                    "latency": state.latency,
+                    "baseline_latency": state.baseline,
+                    "error_rate": state.error_rate,
+                    "calls": state.calls,
+                    "overloads": state.overloads,
+                    "errors": state.errors,
+                }
+                for provider, state in self.providers.items()
+            }
+
+
+# The process-wide limiter shared by the dispatcher, the tools and the client registry.
+adaptive_limiter = AdaptiveLimiter()
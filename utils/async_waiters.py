@@ -0,0 +1,126 @@
+from typing import Any, Callable, List, Optional
+
+import threading
+import asyncio
+
+
+class Waiter:
+    """
+    A coroutine waiting for a slot: the future it awaits, the event loop the future belongs to
+    and the key it asked for, e.g. a resource, a provider or a run ID.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future, key: Any):
+        self.loop = loop
+        self.future = future
+        self.key = key
+
+
+class AsyncWaiters:
+    """
+    The coroutines waiting for slots of a counter that is guarded by a threading lock and also
+    taken and released by plain threads, e.g. a ResourceLimiter.
+
+    A waiting coroutine is a future, so any number of them can wait without holding a thread.
+    The owner of the counter calls dispatch() with its lock held whenever a slot may have freed
+    up, and the futures are resolved on their own event loops. All methods except wait() must
+    be called with the lock of the owner held.
+
+    Attributes:
+        waiters (List[Waiter]): The waiting coroutines, oldest first.
+    """
+
+    def __init__(self):
+        self.waiters: List[Waiter] = []
+
+    def __len__(self) -> int:
+        return len(self.waiters)
+
+    def count(self, key: Any) -> int:
+        """
+        Returns the number of coroutines waiting for the given key.
+        """
+        return sum(1 for waiter in self.waiters if waiter.key == key)
+
+    def enqueue(self, key: Any = None) -> Waiter:
+        """
+        Adds a waiter for the running event loop.
+
+        Args:
+            key (Any): What the coroutine waits for.
+
+        Returns:
+            Waiter: The waiter to pass to wait().
+        """
+        loop = asyncio.get_running_loop()
+        waiter = Waiter(loop, loop.create_future(), key)
+        self.waiters.append(waiter)
+        return waiter
+
+    def dispatch(
+        self,
+        has_slot: Callable[[Any], bool],
+        take: Callable[[Any], None],
+        key: Any = None,
+        choose: Optional[Callable[[List[Waiter]], Waiter]] = None,
+    ) -> None:
+        """
+        Hands free slots to waiting coroutines. A slot is only taken once the grant is
+        scheduled on the loop of the waiter; the waiters of closed loops are dropped, so
+        releasing a slot never fails because of them.
+
+        Args:
+            has_slot (Callable[[Any], bool]): Whether a slot of a key is free.
+            take (Callable[[Any], None]): Takes a slot of a key.
+            key (Any): Only hand out slots of this key. None considers all waiters.
+            choose (Optional[Callable[[List[Waiter]], Waiter]]): Picks the next waiter among the
+                candidates, the oldest one by default.
+        """
+        while True:
+            candidates = (
+                waiter
+                for waiter in self.waiters
+                if (key is None or waiter.key == key) and has_slot(waiter.key)
+            )
+            if choose:
+                candidates = list(candidates)
+                waiter = choose(candidates) if candidates else None
+            else:
+                waiter = next(candidates, None)
+            if waiter is None:
+                return
+            self.waiters.remove(waiter)
+            try:
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+            except RuntimeError:
+                # The event loop of the waiter is closed, nobody is left to take the slot.
+                continue
+            take(waiter.key)
+
+    async def wait(
+        self, waiter: Waiter, lock: threading.Condition, release: Callable[[], None]
+    ) -> None:
+        """
+        Waits until the waiter is granted a slot. Must be called without the lock held.
+
+        Args:
+            waiter (Waiter): The waiter returned by enqueue().
+            lock (threading.Condition): The lock of the owner.
+            release (Callable[[], None]): Gives the slot back if it was granted after all.
+        """
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with lock:
+                pending = waiter in self.waiters
+                if pending:
+                    self.waiters.remove(waiter)
+            if not pending:
+                # The slot was granted before the cancellation arrived.
+                release()
+            raise
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
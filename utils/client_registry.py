@@ -0,0 +1,294 @@
+from utils.adaptive_limiter import adaptive_limiter, OVERLOAD_STATUS_CODES
+from requests.adapters import HTTPAdapter
+from langchain_openai import ChatOpenAI
+from typing import Dict, Any, Optional
+from openai import OpenAI, AsyncOpenAI
+from groq import Groq, AsyncGroq
+from instructor import Instructor, AsyncInstructor
+
+import instructor
+import threading
+import requests
+import asyncio
+import weakref
+import httpx
+
+
+class AdaptiveHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter sending every request of a provider through its adaptive concurrency limit.
+    Requests without a timeout get the default timeout of the adapter, so a hung provider
+    can't hold the calling thread forever.
+    """
+
+    def __init__(self, provider: str, timeout: Optional[float] = None, **kwargs):
+        self.provider = provider
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        with adaptive_limiter.limit(self.provider) as call:
+            response = super().send(request, **kwargs)
+            call.overloaded = response.status_code in OVERLOAD_STATUS_CODES
+        return response
+
+
+class ClientRegistry:
+    """
+    A process-wide registry of long-lived API clients.
+
+    Every provider gets one client with its own keep-alive connection pool, which is reused by all
+    calls instead of opening new connections (and TLS handshakes) per call. LLM clients share
+    httpx pools, the search and scraping tools share requests sessions. Async clients are bound to
+    an event loop, so they are kept per loop.
+
+    Attributes:
+        max_connections (int): Maximum number of connections per pool.
+        max_keepalive_connections (int): Maximum number of idle connections kept open per pool.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        timeout (float): Default request timeout in seconds of the LLM clients.
+        session_timeout (float): Default request timeout in seconds of the requests sessions.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 32,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 120.0,
+        session_timeout: float = 30.0,
+    ):
+        """
+        Initializes the ClientRegistry. Clients are created on first use.
+
+        Args:
+            max_connections (int): Maximum number of connections per pool.
+            max_keepalive_connections (int): Maximum number of idle connections kept open per pool.
+            keepalive_expiry (float): Seconds an idle connection is kept open.
+            timeout (float): Default request timeout in seconds of the LLM clients.
+            session_timeout (float): Default request timeout in seconds of the requests sessions.
+        """
+        self.lock = threading.Lock()
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.session_timeout = session_timeout
+        self.http_clients: Dict[str, httpx.Client] = {}
+        self.sessions: Dict[str, requests.Session] = {}
+        self.clients: Dict[str, Any] = {}
+        # Async clients per event loop, dropped together with their loop.
+        self.async_clients = weakref.WeakKeyDictionary()
+
+    def http_client(self, host: str) -> httpx.Client:
+        """
+        Returns the keep-alive httpx client of a host.
+
+        Args:
+            host (str): The name of the host, e.g. "openai" or "groq".
+
+        Returns:
+            httpx.Client: The shared client.
+        """
+        with self.lock:
+            if host not in self.http_clients:
+                self.http_clients[host] = httpx.Client(
+                    limits=self._limits(), timeout=self.timeout
+                )
+            return self.http_clients[host]
+
+    def session(self, host: str) -> requests.Session:
+        """
+        Returns the keep-alive requests session of a host, used by the search and scraping tools.
+        Its requests follow the adaptive concurrency limit of the host.
+
+        Args:
+            host (str): The name of the host, e.g. "youcom" or "zyte".
+
+        Returns:
+            requests.Session: The shared session.
+        """
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = AdaptiveHTTPAdapter(
+                    host,
+                    timeout=self.session_timeout,
+                    pool_connections=4,
+                    pool_maxsize=self.max_connections,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def _limits(self) -> httpx.Limits:
+        """
+        Returns the connection pool limits of the httpx clients.
+        """
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _client(self, name: str, create) -> Any:
+        """
+        Returns the client stored under name, creating it on first use.
+        """
+        with self.lock:
+            client = self.clients.get(name)
+        if client is None:
+            client = create()
+            with self.lock:
+                client = self.clients.setdefault(name, client)
+        return client
+
+    def openai(self) -> OpenAI:
+        """
+        Returns the shared OpenAI client.
+        """
+        return self._client(
+            "openai", lambda: OpenAI(http_client=self.http_client("openai"))
+        )
+
+    def groq(self) -> Groq:
+        """
+        Returns the shared Groq client.
+        """
+        return self._client("groq", lambda: Groq(http_client=self.http_client("groq")))
+
+    def instructor(self) -> Instructor:
+        """
+        Returns the shared instructor client, which runs on the OpenAI connection pool.
+        """
+        return self._client("instructor", lambda: instructor.from_openai(self.openai()))
+
+    def chat_openai(self, model: str) -> ChatOpenAI:
+        """
+        Returns the shared LangChain chat model for an OpenAI model.
+
+        Args:
+            model (str): The model name.
+
+        Returns:
+            ChatOpenAI: The shared chat model.
+        """
+        return self._client(
+            f"chat_openai:{model}",
+            lambda: ChatOpenAI(model=model, http_client=self.http_client("openai")),
+        )
+
+    def _async_client(self, name: str, create) -> Any:
+        """
+        Returns the client of the running event loop stored under name, creating it on first use.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            clients = self.async_clients.setdefault(loop, {})
+            if name not in clients:
+                clients[name] = create()
+            return clients[name]
+
+    def async_http_client(self, host: str) -> httpx.AsyncClient:
+        """
+        Returns the keep-alive httpx client of a host for the running event loop.
+
+        Args:
+            host (str): The name of the host, e.g. "openai" or "groq".
+
+        Returns:
+            httpx.AsyncClient: The shared client.
+        """
+        return self._async_client(
+            f"http:{host}",
+            lambda: httpx.AsyncClient(limits=self._limits(), timeout=self.timeout),
+        )
+
+    def async_openai(self) -> AsyncOpenAI:
+        """
+        Returns the shared AsyncOpenAI client of the running event loop.
+        """
+        http_client = self.async_http_client("openai")
+        return self._async_client(
+            "openai", lambda: AsyncOpenAI(http_client=http_client)
+        )
+
+    def async_groq(self) -> AsyncGroq:
+        """
+        Returns the shared AsyncGroq client of the running event loop.
+        """
+        http_client = self.async_http_client("groq")
+        return self._async_client("groq", lambda: AsyncGroq(http_client=http_client))
+
+    def async_instructor(self) -> AsyncInstructor:
+        """
+        Returns the shared async instructor client of the running event loop.
+        """
+        client = self.async_openai()
+        return self._async_client(
+            "instructor", lambda: instructor.from_openai(client)
+        )
+
+    async def aclose(self) -> None:
+        """
+        Closes the async clients of the running event loop. Call it before a short-lived loop
+        ends, e.g. one started with asyncio.run, so its connections are not left open.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            clients = self.async_clients.pop(loop, {})
+        for name, client in clients.items():
+            if name.startswith("http:"):
+                await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the utilisation of all connection pools.
+
+        Returns:
+            Dict[str, Any]: Open, active and idle connections per httpx pool and
+                pools, connections and requests per requests session.
+        """
+        with self.lock:
+            http_clients = list(self.http_clients.items())
+            sessions = dict(self.sessions)
+            # Async pools of all event loops, added up per host.
+            http_clients += [
+                (name.split(":", 1)[1], client)
+                for clients in self.async_clients.values()
+                for name, client in clients.items()
+                if name.startswith("http:")
+            ]
+
+        stats: Dict[str, Any] = {"http": {}, "sessions": {}}
+        for host, client in http_clients:
+            # httpx doesn't expose its pool publicly, so read it defensively.
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for connection in connections if connection.is_idle())
+            host_stats = stats["http"].setdefault(
+                host,
+                {"max_connections": self.max_connections, "open": 0, "active": 0, "idle": 0},
+            )
+            host_stats["open"] += len(connections)
+            host_stats["active"] += len(connections) - idle
+            host_stats["idle"] += idle
+        for host, session in sessions.items():
+            adapter = session.get_adapter("https://")
+            pools = [
+                adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()
+            ]
+            stats["sessions"][host] = {
+                "max_connections": self.max_connections,
+                "pools": len(pools),
+                "connections": sum(pool.num_connections for pool in pools),
+                "requests": sum(pool.num_requests for pool in pools),
+            }
+        return stats
+
+
+# The process-wide registry used by the model wrappers and tools.
+clients = ClientRegistry()
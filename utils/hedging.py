@@ -0,0 +1,144 @@
+from typing import Any, Deque, Dict, Optional, Tuple
+from collections import defaultdict, deque
+
+import threading
+import logging
+import os
+
+
+class HedgeCancelled(BaseException):
+    """
+    Raised in the attempt that lost a hedged call. Like asyncio.CancelledError it is no Exception,
+    so it is neither retried nor counted as a provider error.
+    """
+
+
+# The secondary host and model per call site. The primary is the one the call site asks for.
+DEFAULT_HEDGE_ROUTES: Dict[str, Tuple[str, str]] = {
+    # Mixtral on Groq, its context window fits the packed webpages.
+    "ConvertWebpagesToNotes": ("groq", "mixtral-8x7b-32768"),
+    "GenerateSectionSummary": ("openai", "gpt-4o-mini"),
+}
+
+
+class Hedger:
+    """
+    Decides when a slow LLM call is hedged with the same request to a second provider.
+
+    The hedging threshold of a host and model is a high quantile of its recent call durations, so
+    only the slowest calls of a provider are hedged and the extra load stays small. Until enough
+    calls are recorded, a default threshold is used.
+
+    Attributes:
+        enabled (bool): Hedging is opt-in, enable it with configure(enabled=True) or LLM_HEDGING=1.
+        routes (Dict[str, Tuple[str, str]]): The secondary host and model per call site.
+        quantile (float): The quantile of the recent durations used as threshold, e.g. 0.95.
+        min_samples (int): Durations needed before the threshold is learned.
+        default_threshold (float): Seconds used as threshold until then.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        routes: Optional[Dict[str, Tuple[str, str]]] = None,
+        quantile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+        default_threshold: float = 10.0,
+    ):
+        """
+        Initializes the Hedger with the default routes, optionally overridden.
+
+        Args:
+            enabled (bool): Hedge calls of the configured routes.
+            routes (Optional[Dict[str, Tuple[str, str]]]): Routes overriding DEFAULT_HEDGE_ROUTES.
+            quantile (float): The quantile of the recent durations used as threshold.
+            window (int): Number of recent durations kept per host and model.
+            min_samples (int): Durations needed before the threshold is learned.
+            default_threshold (float): Seconds used as threshold until then.
+        """
+        self.lock = threading.Lock()
+        self.enabled = enabled
+        self.routes: Dict[str, Tuple[str, str]] = dict(DEFAULT_HEDGE_ROUTES)
+        self.routes.update(routes or {})
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_threshold = default_threshold
+        self.durations: Dict[Tuple[str, str], Deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def configure(
+        self,
+        enabled: Optional[bool] = None,
+        routes: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> None:
+        """
+        Enables or disables hedging and updates its routes.
+
+        Args:
+            enabled (Optional[bool]): Hedge calls of the configured routes.
+            routes (Optional[Dict[str, Tuple[str, str]]]): The secondary host and model per call site.
+        """
+        with self.lock:
+            if enabled is not None:
+                self.enabled = enabled
+            self.routes.update(routes or {})
+        logging.info(f"Hedging {'enabled' if self.enabled else 'disabled'}, routes {self.routes}")
+
+    def secondary(self, name: str, host: str, model: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns the secondary host and model of a call, None if it is not hedged.
+
+        Args:
+            name (str): The call site, e.g. "GenerateSectionSummary".
+            host (str): The primary host.
+            model (str): The primary model.
+        """
+        with self.lock:
+            secondary = self.routes.get(name) if self.enabled else None
+        if secondary == (host, model):
+            return None
+        return secondary
+
+    def record(self, host: str, model: str, duration: float) -> None:
+        """
+        Records the duration of a completed call.
+        """
+        with self.lock:
+            self.durations[(host, model)].append(duration)
+
+    def threshold(self, host: str, model: str) -> float:
+        """
+        Returns the seconds after which a call to host and model is hedged.
+        """
+        with self.lock:
+            durations = sorted(self.durations[(host, model)])
+        if len(durations) < self.min_samples:
+            return self.default_threshold
+        return durations[min(int(len(durations) * self.quantile), len(durations) - 1)]
+
+    def count(self, outcome: str) -> None:
+        """
+        Counts a call outcome: "hedged", "primary_won" or "secondary_won".
+        """
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hedging thresholds per host and model and the hedging outcomes.
+        """
+        with self.lock:
+            keys = list(self.durations)
+            counts = dict(self.counts)
+        return {
+            "enabled": self.enabled,
+            "thresholds": {f"{host}:{model}": self.threshold(host, model) for host, model in keys},
+            **counts,
+        }
+
+
+# The process-wide hedger used by the model wrapper.
+hedger = Hedger(enabled=os.getenv("LLM_HEDGING") == "1")
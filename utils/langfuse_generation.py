@@ -0,0 +1,143 @@
+from langfuse.model import TextPromptClient
+from typing import Any, Dict, List, Optional, Tuple
+from langfuse import Langfuse
+
+l = Langfuse()
+
+
+def start_generation(
+    name: str,
+    system_prompt: str,
+    user_prompt: str,
+    prompt: TextPromptClient,
+    model: str,
+    metadata: Dict[str, Any],
+    trace=None,
+    observation_id=None,
+    data: str = "",
+) -> Tuple[Any, Any, List[Dict[str, str]], Any]:
+    """
+    Builds the messages of a model call and opens its Langfuse generation. Shared by the sync,
+    async and streaming wrappers. The per-call data (see Prompt.assemble) goes last, so the system prompt
+    and user prompt form a prefix the provider can cache.
+
+    Returns:
+        Tuple: The trace, the observation ID, the messages and the generation.
+    """
+    if trace is None:
+        trace = l.trace(name=name)
+    if observation_id is None:
+        if trace.id is not None:
+            observation_id = trace.id
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": f"{user_prompt}\n\n{data}" if data else user_prompt,
+        },
+    ]
+
+    generation = trace.generation(
+        name=name,
+        model=model,
+        input=messages,
+        metadata=metadata,
+        prompt=prompt if isinstance(prompt, TextPromptClient) else None,
+    )
+    return trace, observation_id, messages, generation
+
+
+def end_generation(
+    trace,
+    generation,
+    observation_id,
+    result: Any,
+    usage,
+    duration: float,
+    time_to_first_token: Optional[float] = None,
+    queue_time: Optional[float] = None,
+) -> None:
+    """
+    Ends the generation of a model call with its result and token usage, and scores the
+    throughput of the call on the trace.
+
+    Args:
+        trace (StatefulTraceClient): The trace of the call.
+        generation (StatefulGenerationClient): The generation of the call.
+        observation_id (Optional[str]): The observation the scores belong to.
+        result (Any): The JSON-serializable result of the call.
+        usage (Optional[CompletionUsage]): The token usage reported by the provider, None if the
+            provider didn't report it for a streamed call.
+        duration (float): The duration of the call in seconds.
+        time_to_first_token (Optional[float]): Seconds until the first token of a streamed call.
+        queue_time (Optional[float]): Seconds the call waited for the rate limits of the provider.
+    """
+    output = {"result": result, "duration": duration}
+    if queue_time is not None:
+        output["queue_time"] = queue_time
+        trace.score(
+            name="queue_time",
+            value=queue_time,
+            comment="The number of seconds the call waited for the rate limits of the provider.",
+            observation_id=observation_id,
+        )
+    if time_to_first_token is not None:
+        output["time_to_first_token"] = time_to_first_token
+        trace.score(
+            name="ttft",
+            value=time_to_first_token,
+            comment="The number of seconds until the first token was streamed.",
+            observation_id=observation_id,
+        )
+    if usage is None:
+        generation.end(output=output)
+        return
+
+    # Prompt tokens served from the provider's prompt cache, if the provider reports them.
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached_tokens = details.get("cached_tokens")
+    else:
+        cached_tokens = getattr(details, "cached_tokens", None)
+    if cached_tokens is not None:
+        output["cached_tokens"] = cached_tokens
+        trace.score(
+            name="cached_tokens",
+            value=cached_tokens,
+            comment="The number of prompt tokens served from the provider's prompt cache.",
+            observation_id=observation_id,
+        )
+
+    input_tokens = usage.prompt_tokens
+    output_tokens = usage.completion_tokens
+    total_tokens = usage.total_tokens
+
+    generation.end(
+        output=output,
+        usage={
+            "input": input_tokens,
+            "output": output_tokens,
+            "total": total_tokens,
+            "unit": "TOKENS",
+        },
+    )
+
+    trace.score(
+        name="ttps",
+        value=total_tokens / duration,
+        comment="The number of total tokens processed per second.",
+        observation_id=observation_id,
+    )
+    trace.score(
+        name="itps",
+        value=input_tokens / duration,
+        comment="The number of input tokens processed per second.",
+        observation_id=observation_id,
+    )
+    trace.score(
+        name="otps",
+        value=output_tokens / duration,
+        comment="The number of output tokens processed per second.",
+        observation_id=observation_id,
+    )
@@ -1,14 +1,16 @@
+from utils.langfuse_generation import start_generation, end_generation
+from utils.llm_cache import llm_cache, record_cache_lookup
+from utils.micro_batcher import micro_batcher
+from utils.llm_dispatcher import dispatcher
+from utils.client_registry import clients
 from langfuse.model import TextPromptClient
-from langfuse import Langfuse
 from pydantic import BaseModel
-from openai import OpenAI
+from typing import Optional
 
-import instructor
+import asyncio
 import logging
 import time
 
-l = Langfuse()
-
 
 def langfuse_json_model_wrapper(
     name: str,
@@ -20,78 +22,181 @@ def langfuse_json_model_wrapper(
     temperature=0,
     trace=None,
     observation_id=None,
+    data: str = "",
+    cache: Optional[bool] = None,
+    priority: str = "normal",
+    max_retries: int = 3,
+    batch: bool = False,
 ) -> BaseModel:
+    """
+    Sends a structured call and validates the response against base_model. With batch=True and
+    micro-batching enabled, calls with a data block are sent together with compatible calls of
+    other tasks, see MicroBatcher. Responses are cached by default at temperature 0 only, pass
+    cache=True or cache=False to override.
+    """
     logging.info(f"Start json inference '{name}' - model {model}")
-    if trace is None:
-        trace = l.trace(name=name)
-    if observation_id is None:
-        if trace.id is not None:
-            observation_id = trace.id
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {
-            "role": "user",
-            "content": user_prompt,
-        },
-    ]
-
-    generation = trace.generation(
-        name=name,
-        model=model,
-        input=messages,
+    trace, observation_id, messages, generation = start_generation(
+        name,
+        system_prompt,
+        user_prompt,
+        prompt,
+        model,
         metadata={
             "temperature": temperature,
             "base_model": base_model.model_json_schema(),
         },
-        prompt=prompt if isinstance(prompt, TextPromptClient) else None,
+        trace=trace,
+        observation_id=observation_id,
+        data=data,
     )
 
-    client = instructor.from_openai(OpenAI())
+    # Deterministic calls are answered from the persistent cache. Sampled calls are only cached
+    # if they opt in with cache=True, otherwise their outputs would be frozen.
+    if cache is None:
+        cache = temperature == 0
+    cache_key = llm_cache.make_key(
+        "openai", model, messages, temperature, base_model.model_json_schema()
+    )
+    cached = llm_cache.get(cache_key) if cache else None
+    if cache:
+        record_cache_lookup(trace, generation, observation_id, cached)
+    if cached is not None:
+        logging.info(f"Cache hit for json inference '{name}'")
+        return base_model.model_validate(cached["result"])
+
+    client = clients.instructor()
+
+    def send(messages, response_model):
+        # Sent through the dispatcher, which keeps the call within OpenAI's rate limits.
+        tokens = dispatcher.estimate(messages, model)
+        (obj, completion), queue_time = dispatcher.call(
+            "openai",
+            model,
+            lambda: client.chat.completions.create_with_completion(
+                model=model,
+                response_model=response_model,
+                messages=messages,
+                max_retries=max_retries,
+            ),
+            tokens,
+            priority,
+        )
+        dispatcher.settle("openai", model, tokens, completion.usage.total_tokens)
+        return obj, completion.usage, queue_time
 
     start = time.time()
-    obj, completion = client.chat.completions.create_with_completion(
-        model=model,
-        response_model=base_model,
-        messages=messages,
+    if batch and data and micro_batcher.enabled:
+        obj, usage, queue_time, batch_size = micro_batcher.submit(
+            name, model, system_prompt, user_prompt, data, base_model, messages, send
+        )
+        if batch_size > 1:
+            trace.score(
+                name="batch_size",
+                value=batch_size,
+                comment="The number of calls sent together in one batched call.",
+                observation_id=observation_id,
+            )
+    else:
+        obj, usage, queue_time = send(messages, base_model)
+    duration = time.time() - start - queue_time
+
+    if cache:
+        llm_cache.set(cache_key, {"result": obj.model_dump()})
+
+    # Base model is a Pydantic model, so we can dump it to JSON
+    end_generation(
+        trace,
+        generation,
+        observation_id,
+        obj.model_dump(),
+        usage,
+        duration,
+        queue_time=queue_time,
     )
-    duration = time.time() - start
 
-    input_tokens = completion.usage.prompt_tokens
-    output_tokens = completion.usage.completion_tokens
-    total_tokens = completion.usage.total_tokens
+    return obj
 
-    generation.end(
-        output={
-            # Base model is a Pydantic model, so we can dump it to JSON
-            "result": obj.model_dump(),
-            "duration": duration,
-        },
-        usage={
-            "input": input_tokens,
-            "output": output_tokens,
-            "total": total_tokens,
-            "unit": "TOKENS",
+
+async def alangfuse_json_model_wrapper(
+    name: str,
+    system_prompt: str,
+    user_prompt: str,
+    prompt: TextPromptClient,
+    base_model: BaseModel,
+    model: str = "gpt-3.5-turbo",
+    temperature=0,
+    trace=None,
+    observation_id=None,
+    data: str = "",
+    cache: Optional[bool] = None,
+    priority: str = "normal",
+    max_retries: int = 3,
+) -> BaseModel:
+    """
+    The awaitable counterpart of langfuse_json_model_wrapper. It runs on the async instructor
+    client, so many calls can be in flight on one event loop without tying up a thread each.
+    """
+    logging.info(f"Start async json inference '{name}' - model {model}")
+    trace, observation_id, messages, generation = start_generation(
+        name,
+        system_prompt,
+        user_prompt,
+        prompt,
+        model,
+        metadata={
+            "temperature": temperature,
+            "base_model": base_model.model_json_schema(),
         },
+        trace=trace,
+        observation_id=observation_id,
+        data=data,
     )
 
-    trace.score(
-        name="ttps",
-        value=total_tokens / duration,
-        comment="The number of total tokens processed per second.",
-        observation_id=observation_id,
+    # Deterministic calls are answered from the persistent cache. Sampled calls are only cached
+    # if they opt in with cache=True, otherwise their outputs would be frozen.
+    if cache is None:
+        cache = temperature == 0
+    cache_key = llm_cache.make_key(
+        "openai", model, messages, temperature, base_model.model_json_schema()
     )
-    trace.score(
-        name="itps",
-        value=input_tokens / duration,
-        comment="The number of input tokens processed per second.",
-        observation_id=observation_id,
+    cached = await asyncio.to_thread(llm_cache.get, cache_key) if cache else None
+    if cache:
+        record_cache_lookup(trace, generation, observation_id, cached)
+    if cached is not None:
+        logging.info(f"Cache hit for async json inference '{name}'")
+        return base_model.model_validate(cached["result"])
+
+    client = clients.async_instructor()
+
+    tokens = dispatcher.estimate(messages, model)
+    start = time.time()
+    (obj, completion), queue_time = await dispatcher.acall(
+        "openai",
+        model,
+        lambda: client.chat.completions.create_with_completion(
+            model=model,
+            response_model=base_model,
+            messages=messages,
+            max_retries=max_retries,
+        ),
+        tokens,
+        priority,
     )
-    trace.score(
-        name="otps",
-        value=output_tokens / duration,
-        comment="The number of output tokens processed per second.",
-        observation_id=observation_id,
+    duration = time.time() - start - queue_time
+    dispatcher.settle("openai", model, tokens, completion.usage.total_tokens)
+
+    if cache:
+        await asyncio.to_thread(llm_cache.set, cache_key, {"result": obj.model_dump()})
+
+    # Base model is a Pydantic model, so we can dump it to JSON
+    end_generation(
+        trace,
+        generation,
+        observation_id,
+        obj.model_dump(),
+        completion.usage,
+        duration,
+        queue_time=queue_time,
     )
 
     return obj
@@ -0,0 +1,118 @@
+from utils.langfuse_generation import start_generation
+from utils.adaptive_limiter import adaptive_limiter
+from utils.resource_limiter import limiter
+from utils.llm_dispatcher import dispatcher
+from utils.client_registry import clients
+from langfuse.model import TextPromptClient
+from typing import Iterator
+from pydantic import BaseModel
+
+import concurrent.futures
+import threading
+import logging
+import queue
+import time
+
+# Reads the streams from the provider, see langfuse_json_stream_wrapper.
+stream_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="json-stream"
+)
+# Put on the queue of a stream after its last item.
+_END = object()
+
+
+def langfuse_json_stream_wrapper(
+    name: str,
+    system_prompt: str,
+    user_prompt: str,
+    prompt: TextPromptClient,
+    base_model: BaseModel,
+    model: str = "gpt-3.5-turbo",
+    temperature=0,
+    trace=None,
+    observation_id=None,
+    data: str = "",
+) -> Iterator[BaseModel]:
+    """
+    Streams a list of base_model objects from the model and yields each object as soon as it
+    is complete, so the caller can start working on the first items while the rest is generated.
+    The duration recorded for the provider is the time it streamed, not the time the caller
+    spent on the items.
+    """
+    logging.info(f"Start json stream inference '{name}' - model {model}")
+    trace, observation_id, messages, generation = start_generation(
+        name,
+        system_prompt,
+        user_prompt,
+        prompt,
+        model,
+        metadata={
+            "temperature": temperature,
+            "base_model": base_model.model_json_schema(),
+            "stream": True,
+        },
+        trace=trace,
+        observation_id=observation_id,
+        data=data,
+    )
+
+    client = clients.instructor()
+
+    # A stream can't be retried once it yielded items, so it only waits for the rate limits.
+    dispatcher.admit("openai", model, dispatcher.estimate(messages, model), "high")
+
+    # The stream is read on its own thread into a queue. The llm and provider slots are held
+    # only while the provider streams, not while the caller works on the items in between.
+    received: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+    start = time.time()
+
+    def read() -> float:
+        try:
+            with limiter.limit("llm"), adaptive_limiter.limit("openai"):
+                for obj in client.chat.completions.create_iterable(
+                    model=model,
+                    response_model=base_model,
+                    messages=messages,
+                ):
+                    received.put(obj)
+                    if stop.is_set():
+                        break
+            return time.time() - start
+        finally:
+            received.put(_END)
+
+    reader = stream_executor.submit(read)
+    items = []
+    time_to_first_item = None
+    try:
+        while True:
+            obj = received.get()
+            if obj is _END:
+                break
+            if time_to_first_item is None:
+                time_to_first_item = time.time() - start
+            items.append(obj)
+            yield obj
+    finally:
+        # Stops reading if the caller stopped early.
+        stop.set()
+    # Raises the error of the stream, if any.
+    duration = reader.result()
+
+    # Streamed responses don't report token usage, so only the latencies are recorded.
+    generation.end(
+        output={
+            "result": [item.model_dump() for item in items],
+            "duration": duration,
+            "time_to_first_item": time_to_first_item,
+        },
+    )
+
+    if time_to_first_item is not None:
+        trace.score(
+            name="ttfi",
+            value=time_to_first_item,
+            comment="The number of seconds until the first item was complete.",
+            observation_id=observation_id,
+        )
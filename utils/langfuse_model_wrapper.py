@@ -1,13 +1,23 @@
+from utils.langfuse_generation import start_generation, end_generation
+from utils.llm_cache import llm_cache, record_cache_lookup
 from langfuse.model import TextPromptClient
-from langfuse import Langfuse
-from groq import Groq
+from utils.llm_dispatcher import dispatcher
+from utils.client_registry import clients
+from utils.message_stream import MessageStream
+from utils.hedging import hedger, HedgeCancelled
+from typing import Optional, Tuple, Any
 
+import concurrent.futures
+import threading
+import asyncio
 import logging
-import openai
 import time
 
-l = Langfuse()
-g = Groq()
+# Sends the attempts of hedged calls, see hedged_completion. A losing attempt keeps its thread
+# until it notices its cancellation, the bound keeps such threads from piling up across calls.
+hedge_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=16, thread_name_prefix="hedge"
+)
 
 
 def langfuse_model_wrapper(
@@ -20,85 +30,399 @@ def langfuse_model_wrapper(
     host="openai",
     trace=None,
     observation_id=None,
+    data: str = "",
+    cache: Optional[bool] = None,
+    stream_to: Optional[MessageStream] = None,
+    priority: str = "normal",
 ):
+    """
+    Calls a chat model and records the call on Langfuse. If stream_to is given, the response is
+    streamed and its tokens are pushed to the user's Eezo message while they are generated.
+    The call is sent through the dispatcher, which keeps it within the provider's rate limits
+    and retries rate limit and connection errors. priority is its lane: high, normal or low.
+    If hedging is enabled for the call site, a slow call is hedged with a second provider.
+    data is the per-call data block of Prompt.assemble, sent last so the prefix can be cached.
+    Responses are cached by default at temperature 0 only, pass cache=True or cache=False to
+    override.
+    """
     logging.info(f"Start inference '{name}' - model {model}, host {host}")
-    if trace is None:
-        trace = l.trace(name=name)
-    if observation_id is None:
-        if trace.id is not None:
-            observation_id = trace.id
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {
-            "role": "user",
-            "content": user_prompt,
-        },
-    ]
-
-    generation = trace.generation(
-        name=name,
-        model=model,
-        input=messages,
+    trace, observation_id, messages, generation = start_generation(
+        name,
+        system_prompt,
+        user_prompt,
+        prompt,
+        model,
         metadata={"temperature": temperature},
-        prompt=prompt if isinstance(prompt, TextPromptClient) else None,
+        trace=trace,
+        observation_id=observation_id,
+        data=data,
     )
 
+    # Deterministic calls are answered from the persistent cache. Sampled calls are only cached
+    # if they opt in with cache=True, otherwise their outputs would be frozen.
+    if cache is None:
+        cache = temperature == 0
+    cache_key = llm_cache.make_key(host, model, messages, temperature)
+    cached = llm_cache.get(cache_key) if cache else None
+    if cache:
+        record_cache_lookup(trace, generation, observation_id, cached)
+    if cached is not None:
+        logging.info(f"Cache hit for inference '{name}'")
+        if stream_to is not None:
+            stream_to.write(cached["result"])
+            stream_to.flush()
+        return cached["result"]
+
     start = time.time()
+    secondary = hedger.secondary(name, host, model)
+    if secondary is None:
+        result, usage, time_to_first_token, queue_time = send_completion(
+            host, model, temperature, messages, stream_to, priority
+        )
+    else:
+        (
+            result,
+            usage,
+            time_to_first_token,
+            queue_time,
+            generation,
+        ) = hedged_completion(
+            name,
+            system_prompt,
+            user_prompt,
+            prompt,
+            (host, model),
+            secondary,
+            temperature,
+            messages,
+            trace,
+            observation_id,
+            generation,
+            stream_to,
+            priority,
+            data,
+        )
+    duration = time.time() - start - queue_time
 
+    if cache:
+        llm_cache.set(cache_key, {"result": result})
+
+    end_generation(
+        trace,
+        generation,
+        observation_id,
+        result,
+        usage,
+        duration,
+        time_to_first_token=time_to_first_token,
+        queue_time=queue_time,
+    )
+
+    return result
+
+
+def send_completion(
+    host: str,
+    model: str,
+    temperature,
+    messages,
+    stream_to: Optional[MessageStream],
+    priority: str,
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[str, Any, Optional[float], float]:
+    """
+    Sends a chat completion through the dispatcher and records its duration for hedging.
+
+    Args:
+        cancel (Optional[threading.Event]): If given, the completion is streamed and aborted as
+            soon as the event is set.
+
+    Returns:
+        Tuple[str, Any, Optional[float], float]: The response, the token usage, the seconds until
+            the first streamed token and the seconds the call was queued.
+    """
     if host == "openai":
-        completion = openai.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages,
-        )
-        result = completion.choices[0].message.content
-        input_tokens = completion.usage.prompt_tokens
-        output_tokens = completion.usage.completion_tokens
-        total_tokens = completion.usage.total_tokens
+        client = clients.openai()
 
     if host == "groq":
-        completion = g.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages,
+        client = clients.groq()
+
+    def send():
+        if stream_to is None and cancel is None:
+            completion = client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+            )
+            return completion.choices[0].message.content, completion.usage, None
+        if stream_to is not None:
+            # A retried stream starts over, drop the tokens of the failed attempt.
+            stream_to.text = streamed
+        return stream_completion(
+            client, host, model, temperature, messages, stream_to, cancel
         )
-        result = completion.choices[0].message.content
-        input_tokens = completion.usage.prompt_tokens
-        output_tokens = completion.usage.completion_tokens
-        total_tokens = completion.usage.total_tokens
-    duration = time.time() - start
-
-    generation.end(
-        output={
-            "result": result,
-            "duration": duration,
-        },
-        usage={
-            "input": input_tokens,
-            "output": output_tokens,
-            "total": total_tokens,
-            "unit": "TOKENS",
-        },
+
+    streamed = stream_to.text if stream_to is not None else ""
+    tokens = dispatcher.estimate(messages, model)
+    start = time.time()
+    (result, usage, time_to_first_token), queue_time = dispatcher.call(
+        host, model, send, tokens, priority
     )
+    hedger.record(host, model, time.time() - start - queue_time)
+    if usage is not None:
+        dispatcher.settle(host, model, tokens, usage.total_tokens)
+    return result, usage, time_to_first_token, queue_time
 
-    trace.score(
-        name="ttps",
-        value=total_tokens / duration,
-        comment="The number of total tokens processed per second.",
-        observation_id=observation_id,
+
+def hedged_completion(
+    name: str,
+    system_prompt: str,
+    user_prompt: str,
+    prompt: TextPromptClient,
+    primary: Tuple[str, str],
+    secondary: Tuple[str, str],
+    temperature,
+    messages,
+    trace,
+    observation_id,
+    generation,
+    stream_to: Optional[MessageStream],
+    priority: str,
+    data: str = "",
+) -> Tuple[str, Any, Optional[float], float, Any]:
+    """
+    Sends a chat completion to the primary host and model. If it hasn't finished within the
+    hedging threshold learned for the primary, or failed, the same call is sent to the secondary.
+    The first success wins and the other attempt is cancelled. Both attempts get a generation.
+
+    Returns:
+        Tuple[str, Any, Optional[float], float, Any]: The response, the token usage, the seconds
+            until the first streamed token, the seconds queued and the generation of the winner.
+    """
+    streamed = stream_to.text if stream_to is not None else ""
+    cancels = {primary: threading.Event(), secondary: threading.Event()}
+    generations = {primary: generation}
+    start = time.time()
+    winner = None
+    try:
+        # Only the primary streams to the user, the secondary replaces its text if it wins.
+        attempts = {
+            hedge_executor.submit(
+                send_completion,
+                *primary,
+                temperature,
+                messages,
+                stream_to,
+                priority,
+                cancels[primary],
+            ): primary
+        }
+        done, _ = concurrent.futures.wait(attempts, timeout=hedger.threshold(*primary))
+        if not done or next(iter(done)).exception() is not None:
+            hedger.count("hedged")
+            logging.info(
+                f"Hedging inference '{name}' - {primary[0]}:{primary[1]} is slow, "
+                f"sending it to {secondary[0]}:{secondary[1]}"
+            )
+            _, _, _, generations[secondary] = start_generation(
+                f"{name}Hedge",
+                system_prompt,
+                user_prompt,
+                prompt,
+                secondary[1],
+                metadata={"temperature": temperature, "host": secondary[0]},
+                trace=trace,
+                observation_id=observation_id,
+                data=data,
+            )
+            attempts[
+                hedge_executor.submit(
+                    send_completion,
+                    *secondary,
+                    temperature,
+                    messages,
+                    None,
+                    priority,
+                    cancels[secondary],
+                )
+            ] = secondary
+
+        errors = {}
+        pending = set(attempts)
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    winner = attempts[future]
+                    result = future.result()
+                    break
+                errors[attempts[future]] = future.exception()
+                generations[attempts[future]].end(
+                    level="ERROR", status_message=str(future.exception())
+                )
+        if winner is None:
+            raise errors.get(primary) or errors[secondary]
+    finally:
+        for attempt, cancel in cancels.items():
+            if attempt != winner:
+                cancel.set()
+
+    for attempt in generations:
+        if attempt != winner and attempt not in errors:
+            generations[attempt].end(
+                output={"cancelled": True},
+                level="WARNING",
+                status_message=f"Cancelled, {winner[0]}:{winner[1]} answered first.",
+            )
+    if winner != primary and primary not in errors:
+        # The primary took at least this long, keep it in its latency history.
+        hedger.record(*primary, time.time() - start)
+
+    if len(generations) > 1:
+        hedger.count("primary_won" if winner == primary else "secondary_won")
+        trace.score(
+            name="hedge_won",
+            value=float(winner == secondary),
+            comment="1 if the hedged request to the secondary provider answered first.",
+            observation_id=observation_id,
+        )
+    if winner == secondary and stream_to is not None:
+        stream_to.replace(streamed + result[0])
+    return (*result, generations[winner])
+
+
+def stream_completion(
+    client,
+    host: str,
+    model: str,
+    temperature,
+    messages,
+    stream_to: Optional[MessageStream],
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[str, Any, Optional[float]]:
+    """
+    Streams a chat completion, optionally into an Eezo message. If cancel is set while the
+    completion streams, the connection is closed and HedgeCancelled is raised.
+
+    Returns:
+        Tuple[str, Any, Optional[float]]: The full response, the token usage if the provider
+            reported it, and the seconds until the first token.
+    """
+    start = time.time()
+    # OpenAI only reports the usage of a stream if asked to, Groq always does.
+    options = {"stream_options": {"include_usage": True}} if host == "openai" else {}
+    chunks = client.chat.completions.create(
+        model=model,
+        temperature=temperature,
+        messages=messages,
+        stream=True,
+        **options,
     )
-    trace.score(
-        name="itps",
-        value=input_tokens / duration,
-        comment="The number of input tokens processed per second.",
+
+    result = ""
+    usage = None
+    time_to_first_token = None
+    with chunks:
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                raise HedgeCancelled()
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start
+                result += token
+                if stream_to is not None:
+                    stream_to.write(token)
+            # OpenAI sends the usage with the last chunk, Groq in its x_groq extension.
+            usage = (
+                getattr(chunk, "usage", None)
+                or getattr(getattr(chunk, "x_groq", None), "usage", None)
+                or usage
+            )
+    if stream_to is not None:
+        stream_to.flush()
+    return result, usage, time_to_first_token
+
+
+async def alangfuse_model_wrapper(
+    name: str,
+    system_prompt: str,
+    user_prompt: str,
+    prompt: TextPromptClient,
+    model: str = "gpt-4o",
+    temperature=0,
+    host="openai",
+    trace=None,
+    observation_id=None,
+    data: str = "",
+    cache: Optional[bool] = None,
+    priority: str = "normal",
+):
+    """
+    The awaitable counterpart of langfuse_model_wrapper. It runs on the async provider clients,
+    so many calls can be in flight on one event loop without tying up a thread each.
+    """
+    logging.info(f"Start async inference '{name}' - model {model}, host {host}")
+    trace, observation_id, messages, generation = start_generation(
+        name,
+        system_prompt,
+        user_prompt,
+        prompt,
+        model,
+        metadata={"temperature": temperature},
+        trace=trace,
         observation_id=observation_id,
+        data=data,
     )
-    trace.score(
-        name="otps",
-        value=output_tokens / duration,
-        comment="The number of output tokens processed per second.",
-        observation_id=observation_id,
+
+    # Deterministic calls are answered from the persistent cache. Sampled calls are only cached
+    # if they opt in with cache=True, otherwise their outputs would be frozen.
+    if cache is None:
+        cache = temperature == 0
+    cache_key = llm_cache.make_key(host, model, messages, temperature)
+    cached = await asyncio.to_thread(llm_cache.get, cache_key) if cache else None
+    if cache:
+        record_cache_lookup(trace, generation, observation_id, cached)
+    if cached is not None:
+        logging.info(f"Cache hit for async inference '{name}'")
+        return cached["result"]
+
+    if host == "openai":
+        client = clients.async_openai()
+
+    if host == "groq":
+        client = clients.async_groq()
+
+    tokens = dispatcher.estimate(messages, model)
+    start = time.time()
+    completion, queue_time = await dispatcher.acall(
+        host,
+        model,
+        lambda: client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+        ),
+        tokens,
+        priority,
+    )
+    duration = time.time() - start - queue_time
+    result = completion.choices[0].message.content
+    dispatcher.settle(host, model, tokens, completion.usage.total_tokens)
+
+    if cache:
+        await asyncio.to_thread(llm_cache.set, cache_key, {"result": result})
+
+    end_generation(
+        trace,
+        generation,
+        observation_id,
+        result,
+        completion.usage,
+        duration,
+        queue_time=queue_time,
     )
 
     return result
@@ -0,0 +1,290 @@
+from typing import Optional, Dict, Any, List
+
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "research_agent",
+    "db",
+    "llm_cache.db",
+)
+
+
+class LLMCache:
+    """
+    A persistent cache for LLM responses backed by SQLite.
+
+    Responses are keyed by host, model, messages, temperature and response schema, so the same
+    prompt on the same inputs is only paid for once, also across reruns of the process. The least
+    recently used entries are evicted above max_entries and entries expire after ttl_seconds.
+
+    Attributes:
+        max_entries (int): Maximum number of cached responses.
+        ttl_seconds (Optional[float]): Seconds a response stays valid. None keeps it until evicted.
+        enabled (bool): Whether responses are looked up and stored at all.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups not found in the cache.
+        entries (int): Number of cached responses, counted when the database is opened.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        enabled: bool = True,
+    ):
+        """
+        Initializes the LLMCache.
+
+        Args:
+            db_path (str): The file path to the SQLite database. Defaults to an in-memory database.
+            max_entries (int): Maximum number of cached responses.
+            ttl_seconds (Optional[float]): Seconds a response stays valid. None keeps it until evicted.
+            enabled (bool): Whether responses are looked up and stored at all.
+        """
+        self.lock = threading.Lock()  # Ensures that database operations are thread-safe
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        # Opened on first use, so importing the cache creates no database file.
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Returns the database connection, opening the database on first use. Must be called
+        with the lock held.
+        """
+        if self.conn is not None:
+            return self.conn
+        if self.db_path != ":memory:":
+            # Ensures the directory for the database file exists
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+        # Allow multi-threaded access to the database by setting check_same_thread to False
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                created_at REAL,
+                last_used_at REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (last_used_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_age ON llm_cache (created_at)")
+        conn.commit()
+        # Counted once here, then kept up to date in memory by set and _evict.
+        self.entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        self.conn = conn
+        return conn
+
+    def configure(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ) -> None:
+        """
+        Changes the limits of the cache. Omitted arguments keep their current value.
+
+        Args:
+            max_entries (Optional[int]): Maximum number of cached responses.
+            ttl_seconds (Optional[float]): Seconds a response stays valid.
+            enabled (Optional[bool]): Whether responses are looked up and stored at all.
+        """
+        with self.lock:
+            if max_entries is not None:
+                if max_entries < 1:
+                    raise ValueError("max_entries must be >= 1.")
+                self.max_entries = max_entries
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+            if enabled is not None:
+                self.enabled = enabled
+            if self.conn is not None:
+                self._evict()
+
+    @staticmethod
+    def make_key(
+        host: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Builds the cache key of an LLM call.
+
+        Args:
+            host (str): The provider, e.g. "openai" or "groq".
+            model (str): The model name.
+            messages (List[Dict[str, Any]]): The messages sent to the model.
+            temperature (float): The sampling temperature.
+            schema (Optional[Dict[str, Any]]): The JSON schema of a structured response.
+
+        Returns:
+            str: The cache key.
+        """
+        payload = json.dumps(
+            {
+                "host": host,
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "schema": schema,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Looks up a cached response and marks it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[Any]: The cached response, or None if it is missing or expired.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self.lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self.entries -= conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Stores a response and evicts the least recently used entries above max_entries.
+
+        Args:
+            key (str): The cache key.
+            value (Any): The JSON-serializable response.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self.lock:
+                conn = self._connection()
+                row = (json.dumps(value), now, now, key)
+                updated = conn.execute(
+                    """
+                    UPDATE llm_cache SET value = ?, created_at = ?, last_used_at = ?
+                    WHERE key = ?
+                    """,
+                    row,
+                ).rowcount
+                if not updated:
+                    conn.execute(
+                        """
+                        INSERT INTO llm_cache (value, created_at, last_used_at, key)
+                        VALUES (?, ?, ?, ?)
+                        """,
+                        row,
+                    )
+                    self.entries += 1
+                self._evict()
+        except sqlite3.Error as error:
+            # The cache is an optimization, never fail the call because of it.
+            logging.error(f"Failed to cache LLM response: {error}")
+
+    def _evict(self) -> None:
+        """
+        Deletes expired entries and the least recently used entries above max_entries.
+        Must be called with the lock held.
+        """
+        if self.ttl_seconds is not None:
+            self.entries -= self.conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            ).rowcount
+        if self.entries > self.max_entries:
+            self.entries -= self.conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            ).rowcount
+        self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit and miss counters of the cache. The counters are kept in memory, so this
+        never touches the database.
+
+        Returns:
+            Dict[str, Any]: Hits, misses, hit rate and number of cached responses.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self.entries,
+            }
+
+
+# The process-wide cache used by the model wrappers, its database is opened on first use.
+llm_cache = LLMCache(os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
+
+
+def record_cache_lookup(
+    trace, generation, observation_id, cached: Optional[Dict[str, Any]]
+) -> None:
+    """
+    Reports a cache lookup of a model wrapper together with the hit and miss counters of the
+    cache to the trace. A hit also ends the generation, since no model is called.
+
+    Args:
+        trace (StatefulTraceClient): The trace of the call.
+        generation (StatefulGenerationClient): The generation of the call.
+        observation_id (Optional[str]): The observation the score belongs to.
+        cached (Optional[Dict[str, Any]]): The cached response, None on a miss.
+    """
+    stats = llm_cache.stats()
+    trace.score(
+        name="llm_cache_hit",
+        value=1 if cached is not None else 0,
+        comment=f"LLM cache hits: {stats['hits']}, misses: {stats['misses']}.",
+        observation_id=observation_id,
+    )
+    if cached is not None:
+        generation.end(
+            output={"result": cached["result"], "duration": 0},
+            metadata={"cache": "hit", "cache_stats": stats},
+            usage={"input": 0, "output": 0, "total": 0, "unit": "TOKENS"},
+        )
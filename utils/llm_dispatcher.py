@@ -0,0 +1,416 @@
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.adaptive_limiter import adaptive_limiter
+from utils.resource_limiter import limiter
+from utils.prompt_packer import prompt_packer
+from collections import defaultdict
+
+import threading
+import itertools
+import asyncio
+import logging
+import heapq
+import openai
+import groq
+import time
+
+# Requests and tokens per minute per provider, or per "provider:model" to override a model.
+DEFAULT_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+    "openai": {"rpm": 5000, "tpm": 800000},
+    "groq": {"rpm": 100, "tpm": 100000},
+}
+# Lower values are served first.
+LANES: Dict[str, int] = {"high": 0, "normal": 1, "low": 2}
+# Errors worth another attempt, they usually pass after a short wait.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    groq.RateLimitError,
+    groq.APITimeoutError,
+    groq.APIConnectionError,
+    groq.InternalServerError,
+)
+RATE_LIMIT_ERRORS = (openai.RateLimitError, groq.RateLimitError)
+# Output tokens expected per call, taken from the token bucket before the actual usage is known.
+EXPECTED_OUTPUT_TOKENS = 1000
+# Seconds between two checks of a queued async call, coroutines can't wait on the condition.
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously up to a per-minute capacity. The level can go below
+    zero, e.g. when a call used more tokens than estimated or a provider asked to back off.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Returns the seconds until amount can be taken, 0 if it can be taken now.
+        """
+        self._refill()
+        # Calls larger than the bucket wait for a full bucket instead of forever.
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def pause(self, seconds: float) -> None:
+        """
+        Empties the bucket so that nothing can be taken for the given number of seconds.
+        """
+        self._refill()
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class LLMDispatcher:
+    """
+    Coordinates all LLM calls of the process so they stay within the rate limits of the providers.
+
+    Calls are admitted per provider and model through a requests-per-minute and a tokens-per-minute
+    token bucket, in priority lanes (high, normal, low) and FIFO within a lane. Rate limit errors
+    pause the buckets of that model for everyone, and retryable errors are retried with jittered
+    exponential backoff, so the throughput settles at the provider's limit instead of failing.
+
+    Attributes:
+        rate_limits (Dict[str, Dict[str, int]]): rpm and tpm per provider or "provider:model".
+        max_attempts (int): Maximum number of attempts per call.
+        max_backoff (float): Maximum number of seconds between two attempts.
+    """
+
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, Dict[str, int]]] = None,
+        max_attempts: int = 6,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Initializes the LLMDispatcher with the default rate limits, optionally overridden.
+
+        Args:
+            rate_limits (Optional[Dict[str, Dict[str, int]]]): Limits overriding DEFAULT_RATE_LIMITS.
+            max_attempts (int): Maximum number of attempts per call.
+            max_backoff (float): Maximum number of seconds between two attempts.
+        """
+        self.condition = threading.Condition()
+        self.rate_limits: Dict[str, Dict[str, int]] = dict(DEFAULT_RATE_LIMITS)
+        self.rate_limits.update(rate_limits or {})
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self.waiting: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.sequence = itertools.count()
+        self.metrics: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+
+    def configure(self, rate_limits: Dict[str, Dict[str, int]]) -> None:
+        """
+        Updates the rate limits of one or more providers or models.
+
+        Args:
+            rate_limits (Dict[str, Dict[str, int]]): rpm and tpm per provider or "provider:model".
+        """
+        for key, limits in rate_limits.items():
+            if min(limits.values()) < 1:
+                raise ValueError(f"Rate limits for '{key}' must be >= 1.")
+        with self.condition:
+            self.rate_limits.update(rate_limits)
+            self.buckets.clear()
+            self.condition.notify_all()
+        logging.info(f"LLM rate limits set to {self.rate_limits}")
+
+    def _buckets(self, key: str) -> Tuple[TokenBucket, TokenBucket]:
+        """
+        Returns the request and token buckets of a "provider:model" key. Needs the condition.
+        """
+        if key not in self.buckets:
+            limits = self.rate_limits.get(key) or self.rate_limits[key.split(":")[0]]
+            self.buckets[key] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return self.buckets[key]
+
+    def _enqueue(self, key: str, priority: str) -> Tuple[int, int]:
+        """
+        Queues a call in its lane and returns its ticket. Needs the condition.
+        """
+        ticket = (LANES[priority], next(self.sequence))
+        heapq.heappush(self.waiting[key], ticket)
+        return ticket
+
+    def _try_take(self, key: str, ticket: Tuple[int, int], tokens: int) -> Optional[float]:
+        """
+        Takes the request and tokens of a queued call if it is first in the queue and the buckets
+        allow it. Needs the condition.
+
+        Returns:
+            Optional[float]: 0 if the call was admitted, the seconds until the buckets allow it,
+                or None if other calls are queued before it.
+        """
+        if self.waiting[key][0] != ticket:
+            return None
+        requests, token_bucket = self._buckets(key)
+        wait = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+        if wait > 0:
+            return wait
+        requests.take(1)
+        token_bucket.take(tokens)
+        return 0.0
+
+    def _dequeue(self, key: str, ticket: Tuple[int, int]) -> None:
+        """
+        Removes a ticket from the queue and wakes the calls queued after it. Needs the condition.
+        """
+        waiting = self.waiting[key]
+        waiting.remove(ticket)
+        heapq.heapify(waiting)
+        self.condition.notify_all()
+
+    def _record_queue_time(self, key: str, start: float) -> float:
+        """
+        Records the queue time of an admitted call. Needs the condition.
+        """
+        queue_time = time.monotonic() - start
+        metrics = self.metrics[key]
+        metrics["calls"] += 1
+        metrics["queue_time_total"] += queue_time
+        metrics["queue_time_max"] = max(metrics["queue_time_max"], queue_time)
+        return queue_time
+
+    def _record_slot_wait(self, key: str, seconds: float) -> float:
+        """
+        Records the seconds an admitted call waited for a free llm and provider concurrency
+        slot, which count as queue time as well.
+        """
+        with self.condition:
+            metrics = self.metrics[key]
+            metrics["slot_wait_total"] += seconds
+            metrics["queue_time_total"] += seconds
+        return seconds
+
+    def _admit(self, key: str, tokens: int, priority: str) -> float:
+        """
+        Waits until a call may be sent and takes its request and tokens from the buckets.
+
+        Returns:
+            float: The seconds the call was queued.
+        """
+        start = time.monotonic()
+        with self.condition:
+            ticket = self._enqueue(key, priority)
+            try:
+                while True:
+                    wait = self._try_take(key, ticket, tokens)
+                    if wait == 0:
+                        break
+                    self.condition.wait(wait)
+            finally:
+                self._dequeue(key, ticket)
+            return self._record_queue_time(key, start)
+
+    async def _aadmit(self, key: str, tokens: int, priority: str) -> float:
+        """
+        Awaitable counterpart of _admit(). The queue is polled, so neither the event loop nor a
+        thread is blocked while the call waits.
+
+        Returns:
+            float: The seconds the call was queued.
+        """
+        start = time.monotonic()
+        with self.condition:
+            ticket = self._enqueue(key, priority)
+        try:
+            while True:
+                with self.condition:
+                    wait = self._try_take(key, ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL))
+        finally:
+            with self.condition:
+                self._dequeue(key, ticket)
+        with self.condition:
+            return self._record_queue_time(key, start)
+
+    def admit(self, host: str, model: str, tokens: int, priority: str = "normal") -> float:
+        """
+        Waits until a call may be sent, for calls that can't be retried by call(), e.g. streams
+        that already yielded items.
+
+        Args:
+            host (str): The provider, e.g. "openai" or "groq".
+            model (str): The model name.
+            tokens (int): The estimated number of tokens of the call.
+            priority (str): The lane of the call, "high", "normal" or "low".
+
+        Returns:
+            float: The seconds the call was queued.
+        """
+        return self._admit(f"{host}:{model}", tokens, priority)
+
+    def _on_error(self, key: str, error: BaseException) -> None:
+        """
+        Records a failed attempt. Rate limit errors pause the buckets of the model for everyone.
+        """
+        with self.condition:
+            self.metrics[key]["retries"] += 1
+            if isinstance(error, RATE_LIMIT_ERRORS):
+                self.metrics[key]["rate_limited"] += 1
+                response = getattr(error, "response", None)
+                retry_after = (
+                    response.headers.get("retry-after") if response is not None else None
+                )
+                try:
+                    seconds = float(retry_after)
+                except (TypeError, ValueError):
+                    seconds = 1.0
+                requests, token_bucket = self._buckets(key)
+                requests.pause(seconds)
+                token_bucket.pause(seconds)
+        logging.error(f"LLM call to {key} failed, retrying: {error}")
+
+    def estimate(self, messages: List[Dict[str, str]], model: str) -> int:
+        """
+        Estimates the tokens of a call before it is sent.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages of the call.
+            model (str): The model name.
+
+        Returns:
+            int: The prompt tokens plus EXPECTED_OUTPUT_TOKENS.
+        """
+        prompt = "\n".join(message["content"] for message in messages)
+        return prompt_packer.count(prompt, model) + EXPECTED_OUTPUT_TOKENS
+
+    def settle(self, host: str, model: str, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Corrects the token bucket of a model once the actual usage of a call is known.
+
+        Args:
+            host (str): The provider, e.g. "openai" or "groq".
+            model (str): The model name.
+            estimated_tokens (int): The tokens taken when the call was admitted.
+            used_tokens (int): The tokens the provider reported.
+        """
+        with self.condition:
+            self._buckets(f"{host}:{model}")[1].take(used_tokens - estimated_tokens)
+            self.condition.notify_all()
+
+    def _retrying(self, key: str, retrying_class):
+        return retrying_class(
+            retry=retry_if_exception_type(RETRYABLE_ERRORS),
+            wait=wait_random_exponential(multiplier=0.5, max=self.max_backoff),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=lambda state: self._on_error(key, state.outcome.exception()),
+            reraise=True,
+        )
+
+    def call(
+        self,
+        host: str,
+        model: str,
+        fn: Callable[[], Any],
+        tokens: int,
+        priority: str = "normal",
+    ) -> Tuple[Any, float]:
+        """
+        Sends an LLM call once the rate limits allow it, retrying retryable errors.
+
+        Args:
+            host (str): The provider, e.g. "openai" or "groq".
+            model (str): The model name.
+            fn (Callable[[], Any]): Sends the call, called once per attempt.
+            tokens (int): The estimated number of tokens of the call.
+            priority (str): The lane of the call, "high", "normal" or "low".
+
+        Returns:
+            Tuple[Any, float]: The result of fn and the total seconds the call was queued.
+        """
+        key = f"{host}:{model}"
+        queue_time = 0.0
+        for attempt in self._retrying(key, Retrying):
+            with attempt:
+                queue_time += self._admit(key, tokens, priority)
+                waited = time.monotonic()
+                with limiter.limit("llm"), adaptive_limiter.limit(host):
+                    queue_time += self._record_slot_wait(key, time.monotonic() - waited)
+                    result = fn()
+        return result, queue_time
+
+    async def acall(
+        self,
+        host: str,
+        model: str,
+        fn: Callable[[], Awaitable[Any]],
+        tokens: int,
+        priority: str = "normal",
+    ) -> Tuple[Any, float]:
+        """
+        Awaitable counterpart of call(), for calls sent with an async client. Neither the event
+        loop nor a thread is blocked while the call is queued.
+        """
+        key = f"{host}:{model}"
+        queue_time = 0.0
+        async for attempt in self._retrying(key, AsyncRetrying):
+            with attempt:
+                queue_time += await self._aadmit(key, tokens, priority)
+                waited = time.monotonic()
+                async with limiter.alimit("llm"), adaptive_limiter.alimit(host):
+                    queue_time += self._record_slot_wait(key, time.monotonic() - waited)
+                    result = await fn()
+        return result, queue_time
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the queue and bucket state per "provider:model".
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Queued calls per lane, available requests and tokens,
+                calls, retries, rate limit errors and queue times.
+        """
+        lanes = {priority: lane for lane, priority in LANES.items()}
+        stats = {}
+        with self.condition:
+            for key, metrics in self.metrics.items():
+                requests, token_bucket = self._buckets(key)
+                requests._refill()
+                token_bucket._refill()
+                queued = defaultdict(int)
+                for priority, _ in self.waiting[key]:
+                    queued[lanes[priority]] += 1
+                stats[key] = {
+                    "queued": dict(queued),
+                    "requests_available": int(requests.level),
+                    "tokens_available": int(token_bucket.level),
+                    "calls": int(metrics["calls"]),
+                    "retries": int(metrics["retries"]),
+                    "rate_limited": int(metrics["rate_limited"]),
+                    "queue_time_avg": metrics["queue_time_total"] / max(metrics["calls"], 1),
+                    "queue_time_max": metrics["queue_time_max"],
+                    "slot_wait_avg": metrics["slot_wait_total"] / max(metrics["calls"], 1),
+                }
+        return stats
+
+
+# The process-wide dispatcher used by the model wrappers.
+dispatcher = LLMDispatcher()
@@ -0,0 +1,80 @@
+from eezo.interface.message import Message
+from typing import Optional
+
+import threading
+import logging
+import time
+
+
+class MessageStream:
+    """
+    Streams text into a text component of an open Eezo message. The user is notified at most once
+    per interval, so a fast token stream doesn't flood the connection.
+
+    Attributes:
+        message (Message): The message the text is streamed into.
+        text (str): The text streamed so far.
+        interval (float): Minimum number of seconds between two notifications.
+        lock (threading.Lock): Serializes updates of the message, can be shared by several streams
+            into the same message.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        text: str = "",
+        interval: float = 0.5,
+        lock: Optional[threading.Lock] = None,
+    ):
+        """
+        Initializes the MessageStream and adds its text component to the message.
+
+        Args:
+            message (Message): The message to stream into.
+            text (str): Text shown before the streamed text, e.g. a heading.
+            interval (float): Minimum number of seconds between two notifications.
+            lock (Optional[threading.Lock]): Lock shared by all streams into the same message.
+        """
+        self.message = message
+        self.text = text
+        self.interval = interval
+        self.lock = lock or threading.Lock()
+        self.last_notify = 0.0
+        with self.lock:
+            self.component = message.add("text", text=text)
+
+    def write(self, text: str) -> None:
+        """
+        Appends text and notifies the user if the interval has passed since the last notification.
+
+        Args:
+            text (str): The text to append.
+        """
+        self.text += text
+        if time.monotonic() - self.last_notify >= self.interval:
+            self.flush()
+
+    def replace(self, text: str) -> None:
+        """
+        Replaces the text streamed so far, e.g. with the final version, and shows it.
+
+        Args:
+            text (str): The new text.
+        """
+        self.text = text
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Shows all text streamed so far to the user.
+        """
+        with self.lock:
+            self.component = self.message.replace(
+                self.component.id, "text", text=self.text
+            )
+            try:
+                self.message.notify()
+            except Exception as error:
+                # Losing an update is fine, the next one contains the full text again.
+                logging.error(f"Failed to stream message update: {error}")
+        self.last_notify = time.monotonic()
@@ -0,0 +1,280 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from openai.types import CompletionUsage
+from pydantic import BaseModel, create_model
+
+import concurrent.futures
+import threading
+import logging
+import json
+import os
+
+# A call sends messages with a response model and returns the object, usage and queue time.
+Send = Callable[[List[Dict[str, str]], BaseModel], Tuple[BaseModel, Any, float]]
+
+BATCH_INSTRUCTIONS = """
+
+You are given {count} independent requests, each in a <request id="..."> block of the user \
+message. Answer every request on its own, as if it was the only one, and return exactly \
+{count} items in the order of the requests."""
+
+# Sends the calls of failed batches individually.
+fallback_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=16, thread_name_prefix="micro-batch"
+)
+
+
+class Request:
+    """
+    One structured call waiting to be sent, alone or as part of a batch.
+    """
+
+    def __init__(
+        self, data: str, base_model: BaseModel, messages: List[Dict[str, str]], send: Send
+    ):
+        self.data = data
+        self.base_model = base_model
+        self.messages = messages
+        self.send = send
+        self.done = threading.Event()
+        self.result: Optional[Tuple[BaseModel, Any, float, int]] = None
+        self.error: Optional[BaseException] = None
+        # "pending" until the call is sent on its own ("sending") or given back to its caller
+        # because the leader of its batch stopped ("abandoned").
+        self.state = "pending"
+
+
+class MicroBatcher:
+    """
+    Gathers compatible structured calls made within a short window by concurrent tasks into one
+    multi-item call, so a burst of small calls pays the fixed latency of a round trip once.
+
+    Calls are compatible if they share the call site, model, system prompt, user prompt and
+    response schema and only differ in their data block (see Prompt.assemble). The first call of
+    a window sends the batch once the window has passed or the batch is full, and every caller
+    gets its own typed item back. If the batched response fails validation or has the wrong
+    number of items, every call of the batch is sent individually. If the first call is stopped
+    before the batch is sent, the other calls are sent by their own callers.
+
+    Attributes:
+        enabled (bool): Batching is opt-in, enable it with configure(enabled=True) or
+            LLM_MICRO_BATCHING=1.
+        window (float): Seconds the first call of a batch waits for more calls.
+        max_batch_size (int): Batches are sent as soon as they have this many calls.
+    """
+
+    def __init__(self, enabled: bool = False, window: float = 0.05, max_batch_size: int = 8):
+        """
+        Initializes the MicroBatcher.
+
+        Args:
+            enabled (bool): Batch calls that ask for it.
+            window (float): Seconds the first call of a batch waits for more calls.
+            max_batch_size (int): Batches are sent as soon as they have this many calls.
+        """
+        self.condition = threading.Condition()
+        self.enabled = enabled
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.open: Dict[Tuple[str, ...], List[Request]] = {}
+        self.counts: Dict[str, int] = {"calls": 0, "batches": 0, "fallbacks": 0}
+
+    def configure(
+        self,
+        enabled: Optional[bool] = None,
+        window: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+    ) -> None:
+        """
+        Enables or disables batching and updates its window and batch size.
+
+        Args:
+            enabled (Optional[bool]): Batch calls that ask for it.
+            window (Optional[float]): Seconds the first call of a batch waits for more calls.
+            max_batch_size (Optional[int]): Batches are sent as soon as they have this many calls.
+        """
+        if max_batch_size is not None and max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1.")
+        with self.condition:
+            if enabled is not None:
+                self.enabled = enabled
+            if window is not None:
+                self.window = window
+            if max_batch_size is not None:
+                self.max_batch_size = max_batch_size
+        logging.info(
+            f"Micro-batching {'enabled' if self.enabled else 'disabled'}, "
+            f"window {self.window}s, max batch size {self.max_batch_size}"
+        )
+
+    def submit(
+        self,
+        name: str,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        data: str,
+        base_model: BaseModel,
+        messages: List[Dict[str, str]],
+        send: Send,
+    ) -> Tuple[BaseModel, Any, float, int]:
+        """
+        Sends a structured call as part of a batch of compatible calls.
+
+        Args:
+            name (str): The call site, e.g. "SelectContent".
+            model (str): The model name.
+            system_prompt (str): The static system prompt.
+            user_prompt (str): The user prompt.
+            data (str): The data block of the call, the only part that differs within a batch.
+            base_model (BaseModel): The response model of the call.
+            messages (List[Dict[str, str]]): The messages of the call when sent individually.
+            send (Send): Sends messages with a response model, used for the batch and fallbacks.
+
+        Returns:
+            Tuple[BaseModel, Any, float, int]: The response, the share of the token usage, the
+                seconds the call was queued and the size of the batch it was sent in.
+        """
+        schema = json.dumps(base_model.model_json_schema(), sort_keys=True)
+        key = (name, model, system_prompt, user_prompt, schema)
+        request = Request(data, base_model, messages, send)
+
+        with self.condition:
+            self.counts["calls"] += 1
+            batch = self.open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.open[key] = []
+            batch.append(request)
+            if len(batch) >= self.max_batch_size:
+                # A full batch is closed, later calls start a new one.
+                del self.open[key]
+                self.condition.notify_all()
+            if leader:
+                # Wait for more calls, unless the batch fills up earlier.
+                self.condition.wait_for(
+                    lambda: len(batch) >= self.max_batch_size, timeout=self.window
+                )
+                if self.open.get(key) is batch:
+                    del self.open[key]
+
+        if leader:
+            try:
+                self._send(name, system_prompt, user_prompt, batch)
+            finally:
+                # Even if the leader is stopped, e.g. by HedgeCancelled or KeyboardInterrupt, no
+                # caller of the batch is left waiting.
+                for other in batch:
+                    self._abandon(other)
+        request.done.wait()
+        if request.state == "abandoned":
+            obj, usage, queue_time = request.send(request.messages, request.base_model)
+            return obj, usage, queue_time, 1
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _claim(self, request: Request) -> bool:
+        """
+        Marks a request as being sent on its own. Returns False if it was given back to its caller.
+        """
+        with self.condition:
+            if request.state != "pending":
+                return False
+            request.state = "sending"
+            return True
+
+    def _abandon(self, request: Request) -> None:
+        """
+        Gives a request without a result and not being sent back to its caller, which sends it.
+        """
+        with self.condition:
+            if request.state == "pending" and not request.done.is_set():
+                request.state = "abandoned"
+                request.done.set()
+
+    def _send(
+        self, name: str, system_prompt: str, user_prompt: str, batch: List[Request]
+    ) -> None:
+        """
+        Sends a batch and hands every request its result. Requests of a failed batch are sent
+        individually.
+        """
+        if len(batch) > 1:
+            try:
+                self._send_batch(name, system_prompt, user_prompt, batch)
+                return
+            except Exception as error:
+                logging.error(
+                    f"Batch of {len(batch)} '{name}' calls failed, sending each: {error}"
+                )
+                with self.condition:
+                    self.counts["fallbacks"] += 1
+
+        if len(batch) == 1:
+            self._send_one(batch[0])
+            return
+        futures = [fallback_executor.submit(self._send_one, request) for request in batch]
+        try:
+            concurrent.futures.wait(futures)
+        finally:
+            # Calls not started yet are given back to their callers by submit.
+            for future in futures:
+                future.cancel()
+
+    def _send_one(self, request: Request) -> None:
+        if not self._claim(request):
+            return
+        try:
+            obj, usage, queue_time = request.send(request.messages, request.base_model)
+            request.result = (obj, usage, queue_time, 1)
+        except BaseException as error:
+            request.error = error
+        finally:
+            request.done.set()
+
+    def _send_batch(
+        self, name: str, system_prompt: str, user_prompt: str, batch: List[Request]
+    ) -> None:
+        base_model = batch[0].base_model
+        batch_model = create_model(f"{base_model.__name__}Batch", items=(List[base_model], ...))
+        requests = "\n\n".join(
+            f'<request id="{i}">\n{request.data}\n</request>' for i, request in enumerate(batch)
+        )
+        messages = [
+            {
+                "role": "system",
+                "content": system_prompt + BATCH_INSTRUCTIONS.format(count=len(batch)),
+            },
+            {"role": "user", "content": f"{user_prompt}\n\n{requests}"},
+        ]
+        response, usage, queue_time = batch[0].send(messages, batch_model)
+        if len(response.items) != len(batch):
+            raise ValueError(f"Expected {len(batch)} items, got {len(response.items)}")
+        # Validated per caller, the response models of the callers may be different classes.
+        results = [
+            request.base_model.model_validate(item.model_dump())
+            for request, item in zip(batch, response.items)
+        ]
+
+        logging.info(f"Sent {len(batch)} '{name}' calls as one batch")
+        with self.condition:
+            self.counts["batches"] += 1
+        share = CompletionUsage(
+            prompt_tokens=usage.prompt_tokens // len(batch),
+            completion_tokens=usage.completion_tokens // len(batch),
+            total_tokens=usage.total_tokens // len(batch),
+        )
+        for request, result in zip(batch, results):
+            request.result = (result, share, queue_time, len(batch))
+            request.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of calls, batches sent and batches that fell back to single calls.
+        """
+        with self.condition:
+            return dict(self.counts)
+
+
+# The process-wide batcher used by the JSON model wrapper.
+micro_batcher = MicroBatcher(enabled=os.getenv("LLM_MICRO_BATCHING") == "1")
@@ -0,0 +1,462 @@
+from utils.langfuse_model_wrapper import langfuse_model_wrapper, alangfuse_model_wrapper
+from utils.langfuse_json_model_wrapper import langfuse_json_model_wrapper
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from instructor.exceptions import InstructorRetryException
+from utils.message_stream import MessageStream
+from utils.prompt_packer import prompt_packer
+from langfuse.model import TextPromptClient
+from pydantic import BaseModel, ValidationError
+from collections import defaultdict
+
+import threading
+import logging
+import time
+
+# The models tried per call site, fastest and cheapest first.
+DEFAULT_POLICY: Dict[str, List[Tuple[str, str]]] = {
+    "SelectContent": [("openai", "gpt-4o-mini"), ("openai", "gpt-4o")],
+    "AssessInformationSufficiency": [("openai", "gpt-4o-mini"), ("openai", "gpt-4o")],
+    "SelectAndAssessContent": [("openai", "gpt-4o-mini"), ("openai", "gpt-4o")],
+    "ConvertOutlineToDAG": [("openai", "gpt-4o-mini"), ("openai", "gpt-4o")],
+    # Section summaries are final output, a cheaper tier has to be opted into with configure().
+    "GenerateSectionSummary": [("groq", "llama3-70b-8192")],
+}
+# USD per million input and output tokens.
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama3-8b-8192": (0.05, 0.08),
+}
+# Errors telling that a model couldn't produce a valid response, worth escalating.
+ESCALATION_ERRORS = (InstructorRetryException, ValidationError)
+
+
+class ModelRouter:
+    """
+    Picks the model of every call site from a policy. A call starts with the fastest model of its
+    route and escalates to the next one when the response fails schema validation or the
+    caller's confidence check.
+
+    The router learns from its history: a model failing most calls of a route is skipped, except
+    for an occasional probe, so the hot path starts at the fastest model that works. The latency
+    and cost saved compared to always using the last model of the route are scored on the trace.
+
+    Attributes:
+        policy (Dict[str, List[Tuple[str, str]]]): The (host, model) cascade per call site.
+        min_success_rate (float): Models succeeding less often on a route are skipped.
+        min_samples (int): Calls needed before a model is judged.
+        probe_interval (int): Every probe_interval-th call still tries a skipped model.
+    """
+
+    def __init__(
+        self,
+        policy: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+        min_success_rate: float = 0.5,
+        min_samples: int = 10,
+        probe_interval: int = 20,
+    ):
+        """
+        Initializes the ModelRouter with the default policy, optionally overridden.
+
+        Args:
+            policy (Optional[Dict[str, List[Tuple[str, str]]]]): Routes overriding DEFAULT_POLICY.
+            min_success_rate (float): Models succeeding less often on a route are skipped.
+            min_samples (int): Calls needed before a model is judged.
+            probe_interval (int): Every probe_interval-th call still tries a skipped model.
+        """
+        self.lock = threading.Lock()
+        self.policy: Dict[str, List[Tuple[str, str]]] = dict(DEFAULT_POLICY)
+        self.policy.update(policy or {})
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        # Per route and model: calls, successes and the smoothed latency.
+        self.history: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.savings: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.routed: Dict[str, int] = defaultdict(int)
+
+    def configure(self, policy: Dict[str, List[Tuple[str, str]]]) -> None:
+        """
+        Updates the routes of one or more call sites.
+
+        Args:
+            policy (Dict[str, List[Tuple[str, str]]]): The (host, model) cascade per call site.
+        """
+        for route, models in policy.items():
+            if not models:
+                raise ValueError(f"Route '{route}' needs at least one model.")
+        with self.lock:
+            self.policy.update(policy)
+        logging.info(f"Model routes set to {self.policy}")
+
+    def models(self, route: str, host: str, model: str) -> List[Tuple[str, str]]:
+        """
+        Returns the models to try for a call, skipping models that mostly fail on the route.
+
+        Args:
+            route (str): The call site, e.g. "SelectContent".
+            host (str): The host used if the route has no policy.
+            model (str): The model used if the route has no policy.
+
+        Returns:
+            List[Tuple[str, str]]: The (host, model) pairs to try in order.
+        """
+        with self.lock:
+            cascade = self.policy.get(route, [(host, model)])
+            calls = self.routed[route]
+            self.routed[route] += 1
+            models = []
+            for tier in cascade[:-1]:
+                history = self.history[(route, tier[1])]
+                failing = (
+                    history["calls"] >= self.min_samples
+                    and history["successes"] / history["calls"] < self.min_success_rate
+                )
+                if not failing or calls % self.probe_interval == 0:
+                    models.append(tier)
+            return models + [cascade[-1]]
+
+    def packing_model(self, route: str, model: str) -> str:
+        """
+        Returns the model of a route with the smallest prompt budget. A prompt packed for it fits
+        every model the call may be escalated to.
+
+        Args:
+            route (str): The call site, e.g. "SelectContent".
+            model (str): The model used if the route has no policy.
+
+        Returns:
+            str: The model to pack the prompt for.
+        """
+        with self.lock:
+            cascade = self.policy.get(route, [("", model)])
+        return min((tier_model for _, tier_model in cascade), key=prompt_packer.budget)
+
+    def _record(self, route: str, model: str, latency: float, success: bool) -> None:
+        with self.lock:
+            history = self.history[(route, model)]
+            # Recent calls weigh more, so a model that recovers is used again.
+            if history["calls"] >= 50:
+                history["calls"] *= 0.98
+                history["successes"] *= 0.98
+            history["calls"] += 1
+            history["successes"] += success
+            if success:
+                history["latency"] = (
+                    latency
+                    if not history["latency"]
+                    else 0.8 * history["latency"] + 0.2 * latency
+                )
+
+    def _cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        input_price, output_price = PRICES.get(model, (0.0, 0.0))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def _record_savings(
+        self,
+        route: str,
+        trace,
+        attempts: List[Tuple[str, float]],
+        input_tokens: int,
+        output_tokens: int,
+    ) -> None:
+        """
+        Scores the latency and cost saved by a routed call compared to the last model of its route.
+        Escalated calls cost more than the last model alone, so their savings are negative.
+        """
+        top_model = self.policy.get(route, [("", attempts[-1][0])])[-1][1]
+        cost = sum(
+            self._cost(model, input_tokens, output_tokens) for model, _ in attempts
+        )
+        cost_saved = self._cost(top_model, input_tokens, output_tokens) - cost
+        with self.lock:
+            top_latency = self.history[(route, top_model)]["latency"]
+            savings = self.savings[route]
+            savings["calls"] += 1
+            savings["escalations"] += len(attempts) - 1
+            savings["cost_saved"] += cost_saved
+            latency_saved = None
+            if top_latency:
+                latency_saved = top_latency - sum(latency for _, latency in attempts)
+                savings["latency_saved"] += latency_saved
+
+        if trace is None:
+            return
+        trace.score(
+            name="route_cost_saved",
+            value=cost_saved,
+            comment=f"USD saved by route {route} compared to always using {top_model}.",
+        )
+        if latency_saved is not None:
+            trace.score(
+                name="route_latency_saved",
+                value=latency_saved,
+                comment=f"Seconds saved by route {route} compared to always using {top_model}.",
+            )
+
+    def _route(
+        self,
+        route: str,
+        host: str,
+        model: str,
+        call: Callable[[str, str, bool], Any],
+        accept: Optional[Callable[[Any], bool]],
+        trace,
+        input_tokens: int,
+    ) -> Any:
+        """
+        Tries the models of a route until one returns an accepted response.
+        """
+        models = self.models(route, host, model)
+        attempts: List[Tuple[str, float]] = []
+        for i, (tier_host, tier_model) in enumerate(models):
+            last = i == len(models) - 1
+            start = time.time()
+            try:
+                result = call(tier_host, tier_model, last)
+            except ESCALATION_ERRORS as error:
+                self._escalate(route, tier_model, start, error, last, attempts)
+                continue
+            if self._judge(route, tier_model, start, result, last, accept, attempts):
+                break
+        self._finish(route, trace, attempts, input_tokens, result, tier_model)
+        return result
+
+    async def _aroute(
+        self,
+        route: str,
+        host: str,
+        model: str,
+        call: Callable[[str, str, bool], Awaitable[Any]],
+        accept: Optional[Callable[[Any], bool]],
+        trace,
+        input_tokens: int,
+    ) -> Any:
+        """
+        Awaitable counterpart of _route().
+        """
+        models = self.models(route, host, model)
+        attempts: List[Tuple[str, float]] = []
+        for i, (tier_host, tier_model) in enumerate(models):
+            last = i == len(models) - 1
+            start = time.time()
+            try:
+                result = await call(tier_host, tier_model, last)
+            except ESCALATION_ERRORS as error:
+                self._escalate(route, tier_model, start, error, last, attempts)
+                continue
+            if self._judge(route, tier_model, start, result, last, accept, attempts):
+                break
+        self._finish(route, trace, attempts, input_tokens, result, tier_model)
+        return result
+
+    def _escalate(
+        self,
+        route: str,
+        model: str,
+        start: float,
+        error: BaseException,
+        last: bool,
+        attempts: List[Tuple[str, float]],
+    ) -> None:
+        """
+        Records a model that failed validation. The error of the last model is raised.
+        """
+        if last:
+            raise error
+        self._record(route, model, time.time() - start, False)
+        attempts.append((model, time.time() - start))
+        logging.info(f"{route}: {model} failed validation, escalating: {error}")
+
+    def _judge(
+        self,
+        route: str,
+        model: str,
+        start: float,
+        result: Any,
+        last: bool,
+        accept: Optional[Callable[[Any], bool]],
+        attempts: List[Tuple[str, float]],
+    ) -> bool:
+        """
+        Records the response of a model and returns True if it is accepted.
+        """
+        latency = time.time() - start
+        attempts.append((model, latency))
+        if last or accept is None or accept(result):
+            self._record(route, model, latency, True)
+            return True
+        self._record(route, model, latency, False)
+        logging.info(f"{route}: {model} response not accepted, escalating")
+        return False
+
+    def _finish(
+        self,
+        route: str,
+        trace,
+        attempts: List[Tuple[str, float]],
+        input_tokens: int,
+        result: Any,
+        model: str,
+    ) -> None:
+        output = result.model_dump_json() if isinstance(result, BaseModel) else str(result)
+        self._record_savings(
+            route, trace, attempts, input_tokens, prompt_packer.count(output, model)
+        )
+
+    def call_json(
+        self,
+        name: str,
+        system_prompt: str,
+        user_prompt: str,
+        prompt: TextPromptClient,
+        base_model: BaseModel,
+        accept: Optional[Callable[[BaseModel], bool]] = None,
+        model: str = "gpt-3.5-turbo",
+        trace=None,
+        **kwargs,
+    ) -> BaseModel:
+        """
+        Routes a structured call. See langfuse_json_model_wrapper for the arguments.
+
+        Args:
+            name (str): The call site, used as route.
+            accept (Optional[Callable[[BaseModel], bool]]): Returns False if the response is not
+                confident enough and the next model should be tried.
+            model (str): The model used if the route has no policy.
+
+        Returns:
+            BaseModel: The response of the first model that passed validation and accept.
+        """
+
+        def call(host: str, tier_model: str, last: bool) -> BaseModel:
+            # Cheaper models get one attempt, escalating is faster than repairing.
+            return langfuse_json_model_wrapper(
+                name=name,
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                prompt=prompt,
+                base_model=base_model,
+                model=tier_model,
+                trace=trace,
+                max_retries=3 if last else 1,
+                **kwargs,
+            )
+
+        input_tokens = prompt_packer.count(
+            system_prompt + user_prompt + kwargs.get("data", ""), model
+        )
+        return self._route(name, "openai", model, call, accept, trace, input_tokens)
+
+    def call_text(
+        self,
+        name: str,
+        system_prompt: str,
+        user_prompt: str,
+        prompt: TextPromptClient,
+        accept: Optional[Callable[[str], bool]] = None,
+        model: str = "gpt-4o",
+        host: str = "openai",
+        trace=None,
+        stream_to: Optional[MessageStream] = None,
+        **kwargs,
+    ) -> str:
+        """
+        Routes a text call. See langfuse_model_wrapper for the arguments.
+
+        Args:
+            name (str): The call site, used as route.
+            accept (Optional[Callable[[str], bool]]): Returns False if the response is not good
+                enough and the next model should be tried.
+            model (str): The model used if the route has no policy.
+            host (str): The host used if the route has no policy.
+
+        Returns:
+            str: The response of the first model that was accepted.
+        """
+        streamed = stream_to.text if stream_to is not None else ""
+
+        def call(tier_host: str, tier_model: str, last: bool) -> str:
+            if stream_to is not None:
+                # An escalated stream starts over.
+                stream_to.text = streamed
+            return langfuse_model_wrapper(
+                name=name,
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                prompt=prompt,
+                model=tier_model,
+                host=tier_host,
+                trace=trace,
+                stream_to=stream_to,
+                **kwargs,
+            )
+
+        input_tokens = prompt_packer.count(
+            system_prompt + user_prompt + kwargs.get("data", ""), model
+        )
+        return self._route(name, host, model, call, accept, trace, input_tokens)
+
+    async def acall_text(
+        self,
+        name: str,
+        system_prompt: str,
+        user_prompt: str,
+        prompt: TextPromptClient,
+        accept: Optional[Callable[[str], bool]] = None,
+        model: str = "gpt-4o",
+        host: str = "openai",
+        trace=None,
+        **kwargs,
+    ) -> str:
+        """
+        Awaitable counterpart of call_text(), sent with alangfuse_model_wrapper. Responses are not
+        streamed.
+
+        Returns:
+            str: The response of the first model that was accepted.
+        """
+
+        async def call(tier_host: str, tier_model: str, last: bool) -> str:
+            return await alangfuse_model_wrapper(
+                name=name,
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                prompt=prompt,
+                model=tier_model,
+                host=tier_host,
+                trace=trace,
+                **kwargs,
+            )
+
+        input_tokens = prompt_packer.count(
+            system_prompt + user_prompt + kwargs.get("data", ""), model
+        )
+        return await self._aroute(name, host, model, call, accept, trace, input_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the savings and model history per route.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Calls, escalations, cost and latency saved and the success
+                rate and latency of every model per route.
+        """
+        with self.lock:
+            stats = {route: dict(savings) for route, savings in self.savings.items()}
+            for (route, model), history in self.history.items():
+                if not history["calls"]:
+                    continue
+                stats.setdefault(route, {})[model] = {
+                    "success_rate": history["successes"] / history["calls"],
+                    "latency": history["latency"],
+                }
+        return stats
+
+
+# The process-wide router used by the research tasks.
+model_router = ModelRouter()
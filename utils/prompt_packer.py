@@ -0,0 +1,222 @@
+from typing import Dict, List, Optional, Tuple
+
+import threading
+import tiktoken
+import logging
+import re
+
+# Maximum number of input tokens spent on the data of a prompt, per model.
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "gpt-4o": 24000,
+    "gpt-4o-mini": 24000,
+    "gpt-3.5-turbo": 12000,
+    "gpt-3.5-turbo-1106": 12000,
+    "llama3-70b-8192": 5000,
+    "llama3-8b-8192": 5000,
+}
+DEFAULT_BUDGET = 8000
+# Parts that would get fewer tokens than this are dropped instead of truncated.
+MIN_PART_TOKENS = 150
+
+
+class PromptPacker:
+    """
+    Fits the data of a prompt (webpages, snippets, search results) into a token budget per model.
+
+    Every part gets a fair share of the budget: parts smaller than their share keep all their
+    tokens and the rest is split among the larger parts, which are truncated. Parts are expected
+    in order of relevance; if the budget can't give every part a useful share, the least relevant
+    parts are dropped. Truncation keeps the paragraphs that match the query best.
+
+    Attributes:
+        budgets (Dict[str, int]): Maximum number of data tokens per model.
+        min_part_tokens (int): Parts that would get fewer tokens are dropped.
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        min_part_tokens: int = MIN_PART_TOKENS,
+    ):
+        """
+        Initializes the PromptPacker with the default budgets, optionally overridden.
+
+        Args:
+            budgets (Optional[Dict[str, int]]): Budgets overriding DEFAULT_BUDGETS.
+            min_part_tokens (int): Parts that would get fewer tokens are dropped.
+        """
+        self.lock = threading.Lock()
+        self.budgets: Dict[str, int] = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets or {})
+        self.min_part_tokens = min_part_tokens
+        self.encodings: Dict[str, Optional[tiktoken.Encoding]] = {}
+
+    def configure(self, budgets: Dict[str, int]) -> None:
+        """
+        Updates the budgets of one or more models.
+
+        Args:
+            budgets (Dict[str, int]): The new budgets per model. Values must be >= 1.
+        """
+        for model, budget in budgets.items():
+            if budget < 1:
+                raise ValueError(f"Budget for model '{model}' must be >= 1.")
+        with self.lock:
+            self.budgets.update(budgets)
+        logging.info(f"Prompt budgets set to {self.budgets}")
+
+    def budget(self, model: str) -> int:
+        """
+        Returns the data token budget of a model.
+        """
+        return self.budgets.get(model, DEFAULT_BUDGET)
+
+    def _encoding(self, model: str) -> Optional[tiktoken.Encoding]:
+        """
+        Returns the tokenizer of a model. Models unknown to tiktoken (e.g. Llama on Groq) are
+        approximated with cl100k_base. None if the encoding can't be loaded, e.g. offline.
+        """
+        with self.lock:
+            if model in self.encodings:
+                return self.encodings[model]
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as error:
+            logging.error(f"Failed to load tokenizer for {model}, estimating tokens: {error}")
+            encoding = None
+        with self.lock:
+            self.encodings[model] = encoding
+        return encoding
+
+    def count(self, text: str, model: str) -> int:
+        """
+        Counts the tokens of a text.
+
+        Args:
+            text (str): The text.
+            model (str): The model the text is sent to.
+
+        Returns:
+            int: The number of tokens.
+        """
+        encoding = self._encoding(model)
+        if encoding is None:
+            # About four characters per token for English text.
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, tokens: int, model: str, query: str = "") -> str:
+        """
+        Truncates a text to a number of tokens. With a query, the paragraphs sharing the most
+        words with it are kept in their original order, otherwise the beginning of the text.
+
+        Args:
+            text (str): The text.
+            tokens (int): The maximum number of tokens.
+            model (str): The model the text is sent to.
+            query (str): The question the text should answer.
+
+        Returns:
+            str: The truncated text.
+        """
+        if self.count(text, model) <= tokens:
+            return text
+
+        terms = set(re.findall(r"\w{3,}", query.lower()))
+        paragraphs = [p for p in text.split("\n") if p.strip()]
+        if terms and len(paragraphs) > 1:
+            scores = [
+                len(terms & set(re.findall(r"\w{3,}", paragraph.lower())))
+                for paragraph in paragraphs
+            ]
+            ranked = sorted(range(len(paragraphs)), key=lambda i: (-scores[i], i))
+            kept, used = set(), 0
+            for i in ranked:
+                size = self.count(paragraphs[i], model) + 1
+                if scores[i] > 0 and used + size <= tokens:
+                    kept.add(i)
+                    used += size
+            if kept:
+                return "\n".join(paragraphs[i] for i in sorted(kept))
+
+        encoding = self._encoding(model)
+        if encoding is None:
+            return text[: tokens * 4]
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+    def pack(
+        self,
+        parts: List[str],
+        model: str,
+        reserved_tokens: int = 0,
+        query: str = "",
+        labels: Optional[List[str]] = None,
+        trace=None,
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Fits parts into the budget of a model.
+
+        Args:
+            parts (List[str]): The parts, most relevant first.
+            model (str): The model the prompt is sent to.
+            reserved_tokens (int): Tokens of the budget already used by the rest of the prompt.
+            query (str): The question the parts should answer, used to keep the relevant paragraphs.
+            labels (Optional[List[str]]): Names of the parts used in the cuts, e.g. page titles.
+            trace (Optional[StatefulTraceClient]): If given, the cuts are recorded as a span.
+
+        Returns:
+            Tuple[List[str], List[str]]: The packed parts, with dropped parts as empty strings so
+                indices stay valid, and a description of every cut.
+        """
+        labels = labels or [f"Part {i + 1}" for i in range(len(parts))]
+        budget = max(self.budget(model) - reserved_tokens, 0)
+        sizes = [self.count(part, model) for part in parts]
+        if sum(sizes) <= budget:
+            return list(parts), []
+
+        # Drop the least relevant parts until every remaining part gets a useful share.
+        active = [i for i, size in enumerate(sizes) if size > 0]
+        while active and budget // len(active) < min(
+            self.min_part_tokens, min(sizes[i] for i in active)
+        ):
+            active.pop()
+
+        # Fair shares: small parts keep all their tokens, the rest is split among larger ones.
+        allocation: Dict[int, int] = {}
+        remaining = budget
+        by_size = sorted(active, key=lambda i: sizes[i])
+        for n, i in enumerate(by_size):
+            allocation[i] = min(sizes[i], remaining // (len(by_size) - n))
+            remaining -= allocation[i]
+
+        packed, cuts = [], []
+        for i, part in enumerate(parts):
+            if i not in allocation:
+                packed.append("")
+                if sizes[i] > 0:
+                    cuts.append(f"{labels[i]}: dropped ({sizes[i]} tokens)")
+            elif allocation[i] < sizes[i]:
+                packed.append(self.truncate(part, allocation[i], model, query))
+                cuts.append(
+                    f"{labels[i]}: truncated from {sizes[i]} to {allocation[i]} tokens"
+                )
+            else:
+                packed.append(part)
+
+        logging.info(
+            f"Packed {sum(sizes)} tokens into a budget of {budget} for {model}, {len(cuts)} cuts"
+        )
+        if trace is not None:
+            span = trace.span(
+                name="PackPrompt",
+                input={"model": model, "budget": budget, "tokens": sum(sizes)},
+            )
+            span.end(output={"cuts": cuts})
+        return packed, cuts
+
+
+# The process-wide packer used by the research tasks and tools.
+prompt_packer = PromptPacker()
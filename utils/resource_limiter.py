@@ -0,0 +1,163 @@
+from contextlib import contextmanager, asynccontextmanager
+from utils.async_waiters import AsyncWaiters
+from collections import defaultdict
+from typing import Dict, Optional
+
+import threading
+import logging
+
+# Default number of concurrent calls allowed per external resource.
+DEFAULT_LIMITS: Dict[str, int] = {"llm": 16, "search": 8, "scrape": 8}
+
+
+class ResourceLimiter:
+    """
+    Caps the number of concurrent calls per external resource (LLM, search, scrape).
+
+    The limits are process-wide and can be changed at runtime, so every scheduler,
+    task and tool running in this process shares the same budget per resource.
+    Threads wait with limit(), coroutines with alimit(). A waiting coroutine is a future that
+    is resolved when a slot frees up, so any number of them can wait without holding a thread.
+
+    Attributes:
+        limits (Dict[str, int]): The maximum number of concurrent calls per resource.
+        in_use (Dict[str, int]): The number of calls currently holding a slot per resource.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        """
+        Initializes the ResourceLimiter with the default limits, optionally overridden.
+
+        Args:
+            limits (Optional[Dict[str, int]]): Limits overriding DEFAULT_LIMITS.
+        """
+        self.condition = threading.Condition()
+        self.limits: Dict[str, int] = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.in_use: Dict[str, int] = defaultdict(int)
+        # Coroutines waiting for a slot, keyed by resource
+        self.waiters = AsyncWaiters()
+
+    def configure(self, limits: Dict[str, int]) -> None:
+        """
+        Updates the limits of one or more resources.
+
+        Args:
+            limits (Dict[str, int]): The new limits per resource. Values must be >= 1.
+        """
+        for resource, limit in limits.items():
+            if limit < 1:
+                raise ValueError(f"Limit for resource '{resource}' must be >= 1.")
+        with self.condition:
+            self.limits.update(limits)
+            for resource in limits:
+                self._dispatch(resource)
+            self.condition.notify_all()
+        logging.info(f"Resource limits set to {self.limits}")
+
+    def acquire(self, resource: str, blocking: bool = True) -> bool:
+        """
+        Acquires a slot for the given resource.
+
+        Args:
+            resource (str): The resource name, e.g. "llm", "search" or "scrape".
+            blocking (bool): Wait for a free slot if True, otherwise return immediately.
+
+        Returns:
+            bool: True if a slot was acquired.
+        """
+        with self.condition:
+            while self.in_use[resource] >= self.limits.get(resource, 1):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            self.in_use[resource] += 1
+            return True
+
+    def release(self, resource: str) -> None:
+        """
+        Releases a slot previously acquired for the given resource.
+
+        Args:
+            resource (str): The resource name.
+        """
+        with self.condition:
+            self.in_use[resource] -= 1
+            self._dispatch(resource)
+            self.condition.notify_all()
+
+    def _dispatch(self, resource: str) -> None:
+        """
+        Hands free slots of a resource to waiting coroutines, oldest first. Must be called with
+        the lock held.
+        """
+        self.waiters.dispatch(self._has_slot, self._take, key=resource)
+
+    def _has_slot(self, resource: str) -> bool:
+        return self.in_use[resource] < self.limits.get(resource, 1)
+
+    def _take(self, resource: str) -> None:
+        self.in_use[resource] += 1
+
+    @contextmanager
+    def limit(self, resource: str):
+        """
+        Holds a slot of the given resource for the duration of the with block.
+
+        Args:
+            resource (str): The resource name.
+        """
+        self.acquire(resource)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+    async def aacquire(self, resource: str) -> None:
+        """
+        Waits for a slot of the given resource without blocking the event loop or a thread.
+
+        Args:
+            resource (str): The resource name.
+        """
+        with self.condition:
+            if not self.waiters.count(resource) and self._has_slot(resource):
+                self._take(resource)
+                return
+            waiter = self.waiters.enqueue(resource)
+        await self.waiters.wait(waiter, self.condition, lambda: self.release(resource))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the slots in use and the waiting coroutines per resource.
+
+        Returns:
+            Dict[str, Dict[str, int]]: Limit, in use and waiting per resource.
+        """
+        with self.condition:
+            return {
+                resource: {
+                    "limit": limit,
+                    "in_use": self.in_use[resource],
+                    "waiting": self.waiters.count(resource),
+                }
+                for resource, limit in self.limits.items()
+            }
+
+    @asynccontextmanager
+    async def alimit(self, resource: str):
+        """
+        Awaitable counterpart of limit(). Neither the event loop nor a thread is blocked
+        while waiting for a slot.
+
+        Args:
+            resource (str): The resource name.
+        """
+        await self.aacquire(resource)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+
+limiter = ResourceLimiter()
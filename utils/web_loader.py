@@ -0,0 +1,52 @@
+from utils.adaptive_limiter import adaptive_limiter, OVERLOAD_STATUS_CODES
+from langchain_community.document_loaders import WebBaseLoader
+from utils.resource_limiter import limiter
+from typing import List
+
+import logging
+import asyncio
+import aiohttp
+
+
+class AdaptiveWebLoader(WebBaseLoader):
+    """
+    A WebBaseLoader that takes one "scrape" slot and one adaptive slot of its provider per URL
+    instead of one for the whole batch. The adaptive limit then bounds the requests actually in
+    flight, and every request reports its own latency and errors to the AIMD state of the
+    provider. A URL that fails is skipped and loaded as an empty document, so one bad page
+    doesn't fail the batch.
+
+    Attributes:
+        provider (str): The provider the requests are sent through, e.g. "zyte".
+    """
+
+    def __init__(self, web_paths: List[str], provider: str = "zyte", **kwargs):
+        """
+        Initializes the AdaptiveWebLoader.
+
+        Args:
+            web_paths (List[str]): The URLs to load.
+            provider (str): The provider whose adaptive limit the requests follow.
+            **kwargs: Passed on to WebBaseLoader, e.g. proxies.
+        """
+        kwargs.setdefault("raise_for_status", True)
+        super().__init__(web_paths, **kwargs)
+        self.provider = provider
+        # The limiters bound the concurrency, the semaphore of the loader must not.
+        self.requests_per_second = max(len(self.web_paths), 1)
+
+    async def _fetch_with_rate_limit(self, url: str, semaphore: asyncio.Semaphore) -> str:
+        try:
+            async with limiter.alimit("scrape"), adaptive_limiter.alimit(self.provider) as call:
+                try:
+                    return await self._fetch(url)
+                except aiohttp.ClientResponseError as error:
+                    if error.status not in OVERLOAD_STATUS_CODES:
+                        raise
+                    # A rate limit comes back as a response, record it as an overload.
+                    call.overloaded = True
+                    logging.error(f"Provider {self.provider} overloaded scraping {url}")
+                    return ""
+        except Exception as error:
+            logging.error(f"Error scraping {url}: {error}")
+            return ""
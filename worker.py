@@ -0,0 +1,20 @@
+import logging
+import dotenv
+import os
+
+# !Rename env to .env and add missing keys!
+dotenv.load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+
+from research_agent import ResearchWorker
+from research_agent.db import JobQueue
+from tools import *
+
+# Workers need the same tools as the agent that queues the research tasks.
+tools = [YouComSearch(), SimilarWebSearch(), ExaCompanySearch(), NewsSearch()]
+
+# The queue is shared with ResearchAgent(tools, job_queue=...) through the database file.
+current_folder = os.path.dirname(os.path.abspath(__file__))
+queue = JobQueue(current_folder + "/research_agent/db/jobs.db")
+
+ResearchWorker(tools, queue).run_forever()